@@ -0,0 +1,214 @@
+# %%
+import heapq
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from model.cache import cached_many, content_hash
+from model.ipr import ipr_model, qo_model
+from model.nodal import VLP, operating_point, vlp_model
+from model.other import f_darcy
+
+# %%
+
+# Field-wide lift gas allocation
+# Every well gets a response curve q(qgi) on a common grid of injection rates.
+# The curves are solved for all the wells and all the injection rates in one
+# operating_point call and kept per well in the shared cache (model.cache),
+# and the shared gas is handed out in grid steps to the wells with the largest
+# marginal oil gain (max-heap).
+
+WELL_COLUMNS = ("q_test", "pwf_test", "pr", "pb", "thp", "api", "wc", "sg_h2o", "tvd", "md", "nvl", "id", "c")
+
+Allocation = namedtuple("Allocation", "levels qgi q total_q")
+
+
+# VLP of a well lifted with gas injected at the bottom of the tubing
+def gas_lift_vlp(vlp: VLP,
+                 qgi,
+                 t_avg: float = 150,
+                 z: float = 0.9):
+    """
+
+    No-slip mixture: the liquid gradient is diluted by the in-situ gas volume
+    (Bg evaluated at the mean pressure of the static column) and the friction
+    term uses the total liquid + gas rate.
+
+    :param vlp: VLP of the well without lift
+    :param qgi: Injected gas rate (Mscf/d)
+    :param t_avg: Average temperature in the tubing (°F)
+    :param z: Gas compressibility factor
+    :return: Function q -> Po(psia)
+    """
+    p_avg = vlp.thp + 0.5 * vlp.gradient * (vlp.tvd - vlp.nvl)
+    bg = 5.04 * z * (t_avg + 460) / p_avg  # bbl/Mscf
+    q_gas = np.asarray(qgi, dtype=float) * bg
+
+    def lift(q):
+        q = np.maximum(np.asarray(q, dtype=float), 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            holdup = np.where(q + q_gas > 0, q / (q + q_gas), 1.0)
+        friction = vlp.gradient * f_darcy(q + q_gas, vlp.id, vlp.c) * vlp.md
+        return vlp.thp + vlp.gradient * holdup * (vlp.tvd - vlp.nvl) + friction
+
+    return lift
+
+
+def _solve_curves(wells: pd.DataFrame, qgi_levels):
+    w = {name: wells[name].to_numpy(dtype=float)[:, None] for name in WELL_COLUMNS}
+    model = ipr_model(w["q_test"], w["pwf_test"], w["pr"], w["pb"])
+    vlp = vlp_model(w["thp"], w["api"], w["wc"], w["sg_h2o"], w["tvd"], w["md"], w["nvl"], w["id"], w["c"])
+    pr = np.broadcast_to(w["pr"], (len(wells), len(qgi_levels)))
+    lift = gas_lift_vlp(vlp, np.asarray(qgi_levels, dtype=float)[None, :])
+    return operating_point(lambda pwf: qo_model(model, pwf), pr, lift).q
+
+
+# Rate vs injected gas for every well
+def response_curves(wells: pd.DataFrame,
+                    qgi_levels) -> np.ndarray:
+    """
+
+    :param wells: One row per well with the WELL_COLUMNS
+    :param qgi_levels: Injection rates of the grid (Mscf/d), equally spaced from 0
+    :return: Array (wells x levels) of oil rates; only wells not seen before with the same parameters are solved
+    """
+    qgi_levels = np.asarray(qgi_levels, dtype=float)
+    params = wells.loc[:, list(WELL_COLUMNS)].to_numpy(dtype=float)
+    keys = [content_hash(row, qgi_levels) for row in params]
+
+    def solve(missing):
+        curves = [curve.copy() for curve in _solve_curves(wells.iloc[missing], qgi_levels)]
+        for curve in curves:
+            curve.setflags(write=False)
+        return curves
+
+    return np.array(cached_many("gas-lift", keys, solve))
+
+
+# Smallest concave curve above each response curve
+def concave_envelope(curves: np.ndarray) -> np.ndarray:
+    """
+
+    With a concave curve the marginal gain of every well decreases with the
+    injected gas, which is what makes the greedy allocation optimal.
+
+    :param curves: Array (wells x levels)
+    :return: Concave majorant of every row, on the same grid
+    """
+    n = curves.shape[1]
+    envelope = curves.copy()
+    if n < 3:
+        return envelope
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    span = np.where(i < j, j - i, 1)
+    for m in range(1, n - 1):
+        # Every chord (i, j) that passes over m, evaluated at m
+        chord = (i <= m) & (m <= j) & (i < j)
+        line = curves[:, i] + (curves[:, j] - curves[:, i]) * ((m - i) / span)
+        envelope[:, m] = np.where(chord, line, -np.inf).max(axis=(1, 2))
+    return envelope
+
+
+def _result(curves, levels, qgi_levels):
+    q = curves[np.arange(len(levels)), levels]
+    return Allocation(levels, np.asarray(qgi_levels)[levels], q, float(q.sum()))
+
+
+# %%
+
+# Allocation of the shared gas
+def allocate(curves: np.ndarray,
+             qgi_levels,
+             budget: float) -> Allocation:
+    """
+
+    :param curves: Response curves (wells x levels), see response_curves
+    :param qgi_levels: Injection rates of the grid (Mscf/d)
+    :param budget: Total gas available (Mscf/d)
+    :return: Allocation with the grid level, gas and oil rate of every well
+    """
+    levels = np.zeros(len(curves), dtype=int)
+    return reallocate(curves, qgi_levels, budget, levels)
+
+
+# Incremental re-optimization after some curves (or the budget) changed
+def reallocate(curves: np.ndarray,
+               qgi_levels,
+               budget: float,
+               levels,
+               changed=()) -> Allocation:
+    """
+
+    The wells in `changed` give their gas back; the free gas goes to the best
+    marginal gains and units are then moved from the cheapest last increment to
+    the best next increment until no move improves the total. With an unchanged
+    field only the changed wells' share of the gas is moved.
+
+    :param curves: Response curves (wells x levels)
+    :param qgi_levels: Injection rates of the grid (Mscf/d)
+    :param budget: Total gas available (Mscf/d)
+    :param levels: Current grid level of every well
+    :param changed: Indices of the wells whose curve changed
+    :return: Allocation
+    """
+    qgi_levels = np.asarray(qgi_levels, dtype=float)
+    step = qgi_levels[1] - qgi_levels[0]
+    units = int(np.floor(budget / step + 1e-9))
+    gains = np.diff(concave_envelope(np.asarray(curves, dtype=float)), axis=1)
+    top = gains.shape[1]
+    levels = np.array(levels, dtype=int)
+    levels[list(changed)] = 0
+
+    # Lazy heaps: an entry is valid only while the well is still at the level it was pushed with
+    add = [(-gains[w, k], w, k) for w, k in enumerate(levels) if k < top]
+    remove = [(gains[w, k - 1], w, k) for w, k in enumerate(levels) if k > 0]
+    heapq.heapify(add)
+    heapq.heapify(remove)
+
+    def push(w):
+        k = levels[w]
+        if k < top:
+            heapq.heappush(add, (-gains[w, k], w, k))
+        if k > 0:
+            heapq.heappush(remove, (gains[w, k - 1], w, k))
+
+    def peek(heap):
+        while heap and levels[heap[0][1]] != heap[0][2]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    free = units - int(levels.sum())
+    while free < 0:
+        peek(remove)
+        _, w, _ = heapq.heappop(remove)
+        levels[w] -= 1
+        free += 1
+        push(w)
+    while free > 0:
+        best = peek(add)
+        if best is None or -best[0] <= 0:
+            break
+        levels[best[1]] += 1
+        free -= 1
+        push(best[1])
+    while True:
+        best, worst = peek(add), peek(remove)
+        if best is None or worst is None or best[1] == worst[1] or -best[0] <= worst[0] + 1e-9:
+            break
+        levels[worst[1]] -= 1
+        levels[best[1]] += 1
+        push(worst[1])
+        push(best[1])
+    return _result(np.asarray(curves), levels, qgi_levels)
+
+
+# Quicktest
+wells_test = pd.DataFrame({
+    "q_test": [500, 300, 800], "pwf_test": [1500, 1200, 1800], "pr": [2500, 2200, 3000], "pb": [2000, 2000, 2000],
+    "thp": [150, 150, 150], "api": [30, 25, 35], "wc": [0.6, 0.8, 0.4], "sg_h2o": [1.0, 1.0, 1.0],
+    "tvd": [6000, 6000, 6500], "md": [6500, 6500, 7000], "nvl": [0, 0, 0], "id": [2.5, 2.5, 2.5], "c": [120, 120, 120]})
+qgi_test = np.linspace(0, 1000, 11)
+curves_test = response_curves(wells_test, qgi_test)
+allocation_test = allocate(curves_test, qgi_test, 1200)
+print("Gas allocated per well (Mscf/d):", allocation_test.qgi, "total oil (bpd):", allocation_test.total_q)
@@ -0,0 +1,210 @@
+# %%
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from model.ipr import aof_array, as_floats, j_array, qo_array
+
+# %%
+
+# Batch evaluation with a per-row error channel
+# The scalar functions stop at the first bad row: aof() and qo() leave their
+# result unbound for some ef/ef2 combinations, j_darcy() prints and returns
+# None, pwf_vogel() takes the sqrt of a negative number. The batch versions
+# check every row up front with array comparisons, compute all the rows, and
+# return the values together with a status code per row: 0 for a good row,
+# otherwise the sum of the STATUS flags that apply. Values of flagged rows are
+# NaN, so they cannot leak into totals unnoticed, and summarize() counts the
+# flags of a whole run in one pass.
+
+STATUS = {
+    "missing": 1,  # NaN input
+    "nonpositive": 2,  # rate, pressure, efficiency or rock/fluid property out of its physical range
+    "test_pressure": 4,  # pwf_test >= pr: the test gives no productivity index
+    "pwf_range": 8,  # pwf outside [0, pr]
+    "ef_unsupported": 16,  # ef/ef2 combination the scalar function does not handle
+    "flow_regime": 32,  # unknown flow regime (j_darcy)
+    "rate_above_aof": 64,  # requested rate above what the IPR can deliver
+    "bad_result": 128,  # non-finite or negative result from valid inputs
+}
+
+BatchResult = namedtuple("BatchResult", "values status")
+
+
+def _flag(status, mask, name):
+    np.bitwise_or(status, np.where(mask, np.uint16(STATUS[name]), np.uint16(0)), out=status)
+
+
+def _ef2(ef2):
+    return np.nan if ef2 is None else np.asarray(ef2, dtype=float)
+
+
+def _finish(values, status):
+    _flag(status, (status == 0) & ~(np.isfinite(values) & (values >= 0)), "bad_result")
+    return BatchResult(np.where(status == 0, values, np.nan), status)
+
+
+def validate_test(q_test,
+                  pwf_test,
+                  pr,
+                  pb,
+                  ef=1,
+                  ef2=None,
+                  kind: str = "qo") -> np.ndarray:
+    """
+
+    :param q_test: Test flow rate
+    :param pwf_test: Flowing bottom-hole pressure during test
+    :param pr: Reservoir pressure
+    :param pb: Bubble-point pressure
+    :param ef: Efficiency factor
+    :param ef2: Additional efficiency factor (None, or NaN in the rows without one)
+    :param kind: "qo" or "aof", the scalar function whose ef/ef2 cases apply
+    :return: Status code per row (uint16)
+    """
+    q_test, pwf_test, pr, pb, ef = as_floats(q_test, pwf_test, pr, pb, ef)
+    ef2 = _ef2(ef2)
+    shape = np.broadcast(q_test, pwf_test, pr, pb, ef, ef2).shape
+    status = np.zeros(shape, dtype=np.uint16)
+    has_ef2 = ~np.isnan(ef2)
+    with np.errstate(invalid="ignore"):
+        _flag(status, np.isnan(q_test) | np.isnan(pwf_test) | np.isnan(pr) | np.isnan(pb) | np.isnan(ef), "missing")
+        _flag(status, (q_test <= 0) | (pwf_test < 0) | (pr <= 0) | (pb < 0) | (ef <= 0) | (has_ef2 & (ef2 <= 0)),
+              "nonpositive")
+        _flag(status, pwf_test >= pr, "test_pressure")
+        if kind == "aof":
+            unsupported = has_ef2 & ((ef == 1) | ((ef < 1) & (ef2 < 1)) | ((ef > 1) & (ef2 > 1)))
+        else:
+            unsupported = has_ef2 & (ef == 1)
+        _flag(status, unsupported, "ef_unsupported")
+    return status
+
+
+# %%
+
+# AOF (bpd) of every row (model.q.aof)
+def batch_aof(q_test, pwf_test, pr, pb, ef=1, ef2=None) -> BatchResult:
+    """
+
+    :return: BatchResult(Absolute Open Flow, status)
+    """
+    status = validate_test(q_test, pwf_test, pr, pb, ef, ef2, kind="aof")
+    with np.errstate(invalid="ignore"):
+        return _finish(aof_array(q_test, pwf_test, pr, pb, ef, ef2), status)
+
+
+# Qo (bpd) of every row (model.q.qo)
+def batch_qo(q_test, pwf_test, pr, pwf, pb, ef=1, ef2=None) -> BatchResult:
+    """
+
+    :return: BatchResult(Oil Production rate, status)
+    """
+    status = validate_test(q_test, pwf_test, pr, pb, ef, ef2, kind="qo")
+    pwf = np.asarray(pwf, dtype=float)
+    status = np.broadcast_to(status, np.broadcast(status, pwf).shape).copy()
+    with np.errstate(invalid="ignore"):
+        _flag(status, np.isnan(pwf), "missing")
+        _flag(status, (pwf < 0) | (pwf > pr), "pwf_range")
+        return _finish(qo_array(q_test, pwf_test, pr, pwf, pb, ef, ef2), status)
+
+
+# Darcy productivity index of every row (model.j.j_darcy)
+def batch_j_darcy(ko, h, bo, uo, re, rw, s, flow_regime="pseudocontinue") -> BatchResult:
+    """
+
+    :param flow_regime: "pseudocontinue" or "continuo", one for all rows or one per row
+    :return: BatchResult(Productivity Index (IP) of Darcy, status)
+    """
+    ko, h, bo, uo, re, rw, s = as_floats(ko, h, bo, uo, re, rw, s)
+    flow_regime = np.asarray(flow_regime)
+    shape = np.broadcast(ko, h, bo, uo, re, rw, s, flow_regime).shape
+    status = np.zeros(shape, dtype=np.uint16)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        _flag(status, np.isnan(ko) | np.isnan(h) | np.isnan(bo) | np.isnan(uo) | np.isnan(re) | np.isnan(rw) |
+              np.isnan(s), "missing")
+        _flag(status, (ko < 0) | (h <= 0) | (bo <= 0) | (uo <= 0) | (rw <= 0) | (re <= rw), "nonpositive")
+        _flag(status, ~np.isin(flow_regime, ("pseudocontinue", "continuo")), "flow_regime")
+        shape_factor = np.where(flow_regime == "pseudocontinue", 0.75, 0.0)
+        return _finish(ko * h / (141.2 * bo * uo * (np.log(re / rw) - shape_factor + s)), status)
+
+
+# Pwf (psia) of every row (model.pwf.pwf_darcy and model.pwf.pwf_vogel)
+def batch_pwf(q_test, pwf_test, q, pr, pb, method: str = "darcy") -> BatchResult:
+    """
+
+    :param method: "darcy" (pwf_darcy) or "vogel" (pwf_vogel)
+    :return: BatchResult(Flowing bottom pressure, status)
+    """
+    status = validate_test(q_test, pwf_test, pr, pb, kind="aof")
+    q = np.asarray(q, dtype=float)
+    status = np.broadcast_to(status, np.broadcast(status, q).shape).copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        _flag(status, np.isnan(q), "missing")
+        _flag(status, q < 0, "nonpositive")
+        if method == "vogel":
+            root = 81 - 80 * q / aof_array(q_test, pwf_test, pr, pb)
+            _flag(status, root < 0, "rate_above_aof")
+            values = 0.125 * pr * (-1 + np.sqrt(np.maximum(root, 0)))
+        else:
+            values = pr - q / j_array(q_test, pwf_test, pr, pb)
+            _flag(status, values < 0, "rate_above_aof")
+    return _finish(values, status)
+
+
+# %%
+
+def summarize(status) -> pd.Series:
+    """
+
+    :param status: Status codes of a run
+    :return: Number of rows, good rows and rows with every STATUS flag
+    """
+    status = np.asarray(status)
+    counts = {"rows": status.size, "ok": int(np.count_nonzero(status == 0))}
+    for name, bit in STATUS.items():
+        counts[name] = int(np.count_nonzero(status & bit))
+    return pd.Series(counts)
+
+
+def describe(status) -> np.ndarray:
+    """
+
+    :param status: Status codes
+    :return: Text of every code, e.g. "missing|test_pressure" ("" for good rows)
+    """
+    codes, inverse = np.unique(np.asarray(status), return_inverse=True)
+    text = np.array(["|".join(name for name, bit in STATUS.items() if code & bit) for code in codes], dtype=object)
+    return text[inverse].reshape(np.shape(status))
+
+
+# Quicktest
+aof_test = batch_aof([1000, 1000, np.nan, 1000, 1000], [200, 1600, 200, 200, 200], 1500, 500,
+                     [1, 1, 1, 1, 0.8], [np.nan, np.nan, np.nan, 1.2, 0.9])
+print("AOF:", aof_test.values, "status:", describe(aof_test.status))
+print(summarize(aof_test.status).to_dict())
+
+# Row by row against the scalar functions: python -m model.batch
+if __name__ == "__main__":
+    from model.q import aof, qo
+
+    rng = np.random.default_rng(0)
+    n = 3000
+    pr_rows = rng.uniform(1000, 4000, n)
+    pb_rows = pr_rows * rng.uniform(0.5, 1.3, n)
+    pwf_test_rows = pr_rows * rng.uniform(0.2, 0.95, n)
+    q_test_rows = rng.uniform(100, 2000, n)
+    pwf_rows = pr_rows * rng.uniform(0.0, 1.0, n)
+    ef_rows = rng.choice([1.0, 0.8, 1.2], n)
+    ef2_rows = np.where(rng.random(n) < 0.4, rng.choice([0.8, 1.2], n), np.nan)
+    for name, batch, scalar, args in (
+            ("qo", batch_qo, qo, (q_test_rows, pwf_test_rows, pr_rows, pwf_rows, pb_rows)),
+            ("aof", batch_aof, aof, (q_test_rows, pwf_test_rows, pr_rows, pb_rows))):
+        result = batch(*args, ef_rows, ef2_rows)
+        differ = 0
+        for k in np.flatnonzero(result.status == 0):
+            ef2_value = None if np.isnan(ef2_rows[k]) else ef2_rows[k]
+            expected = scalar(*(a[k] for a in args), ef_rows[k], ef2_value)
+            differ += not np.isclose(result.values[k], expected, rtol=1e-12, atol=1e-9)
+        print(f"batch_{name}: {int((result.status == 0).sum())} good rows, {differ} differ from {name}")
+        assert differ == 0
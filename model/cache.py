@@ -0,0 +1,197 @@
+# %%
+import hashlib
+import io
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from model.units import normalize
+
+# %%
+
+# Process-wide shared cache
+# Streamlit runs every browser session in the same Python process, so module
+# level state is shared by all the users of the server. Entries are keyed by a
+# hash of their content (uploaded bytes, input values), bounded by an estimate
+# of their size in bytes and evicted least recently used first. When several
+# sessions ask for the same missing key at once only one of them computes it.
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (value, size)
+_in_flight = {}  # key -> threading.Event
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+_limit = {"max_bytes": 256 * 1024 ** 2}
+
+
+def content_hash(*parts) -> str:
+    """
+
+    :param parts: bytes, str, numbers, numpy arrays, DataFrames or tuples of them
+    :return: Hex digest identifying the content
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(bytes(part))
+        elif isinstance(part, np.ndarray):
+            digest.update(str((part.dtype, part.shape)).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, (pd.DataFrame, pd.Series)):
+            names = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+            digest.update(repr(list(names)).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+        elif isinstance(part, (tuple, list)):
+            digest.update(content_hash(*part).encode())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+
+def _sizeof(value) -> int:
+    # Estimate of the memory held by a cached value
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+def _evict():
+    # Called with the lock held
+    while _stats["bytes"] > _limit["max_bytes"] and _entries:
+        _, (_, size) = _entries.popitem(last=False)
+        _stats["bytes"] -= size
+        _stats["evictions"] += 1
+
+
+def _store(key, value):
+    # Called with the lock held
+    size = _sizeof(value)
+    if size <= _limit["max_bytes"] and key not in _entries:
+        _entries[key] = (value, size)
+        _stats["bytes"] += size
+        _evict()
+
+
+# %%
+
+def cached(namespace: str,
+           key,
+           compute):
+    """
+
+    Values are shared between sessions and must be treated as read-only.
+
+    :param namespace: Kind of value, e.g. "upload", "ipr", "nodal"
+    :param key: Content hash (see content_hash)
+    :param compute: Function without arguments that builds the value on a miss
+    :return: Cached or freshly computed value
+    """
+    key = (namespace, key)
+    while True:
+        with _lock:
+            if key in _entries:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return _entries[key][0]
+            event = _in_flight.get(key)
+            if event is None:
+                event = _in_flight[key] = threading.Event()
+                _stats["misses"] += 1
+                break
+        # Another session is computing the same value: wait and look again
+        # (if that computation failed, this session computes it)
+        event.wait()
+    try:
+        value = compute()
+        with _lock:
+            _store(key, value)
+    finally:
+        with _lock:
+            del _in_flight[key]
+        event.set()
+    return value
+
+
+# Many values of one kind computed together, e.g. one per well of a batch
+def cached_many(namespace: str,
+                keys,
+                compute) -> list:
+    """
+
+    Only the missing values are computed, in one call. Unlike cached, two
+    sessions missing the same key at once both compute it.
+
+    :param namespace: Kind of value
+    :param keys: Content hash of every value
+    :param compute: Function of the list of positions of the missing keys, returning their values in that order
+    :return: Values of every key
+    """
+    values = [None] * len(keys)
+    missing = []
+    with _lock:
+        for k, key in enumerate(keys):
+            entry = _entries.get((namespace, key))
+            if entry is None:
+                missing.append(k)
+                _stats["misses"] += 1
+            else:
+                _entries.move_to_end((namespace, key))
+                _stats["hits"] += 1
+                values[k] = entry[0]
+    if missing:
+        computed = list(compute(missing))
+        with _lock:
+            for k, value in zip(missing, computed):
+                values[k] = value
+                _store((namespace, keys[k]), value)
+    return values
+
+
+def cache_stats() -> dict:
+    """
+
+    :return: hits, misses, evictions, bytes in use, entries and byte limit
+    """
+    with _lock:
+        return dict(_stats, entries=len(_entries), max_bytes=_limit["max_bytes"])
+
+
+def set_cache_limit(max_bytes: int):
+    """
+
+    :param max_bytes: Memory budget of the cache
+    """
+    with _lock:
+        _limit["max_bytes"] = int(max_bytes)
+        _evict()
+
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        _stats.update(hits=0, misses=0, evictions=0, bytes=0)
+
+
+# Parsed upload shared by every session that uploads the same file
+def read_upload(file) -> pd.DataFrame:
+    """
+
+    :param file: Uploaded file (st.file_uploader result)
+    :return: DataFrame parsed with pd.read_excel and its columns converted to canonical units (see
+             model.units.normalize), cached by the file content
+    """
+    data = file.getvalue()
+    return cached("upload", content_hash(data), lambda: normalize(pd.read_excel(io.BytesIO(data))))
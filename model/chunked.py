@@ -0,0 +1,210 @@
+# %%
+from collections import namedtuple
+
+import numpy as np
+
+from model.ipr import ipr_model, qo_model
+from model.nodal import operating_point, vlp_model
+
+# %%
+
+# Memory-bounded sweeps
+# A sweep is the Cartesian product of a few parameter grids. It is never
+# materialized: points are numbered 0..N-1, a tile of consecutive numbers is
+# turned into grid indices (np.unravel_index), evaluated, and folded into
+# running reductions (count, mean, min/max with their arguments, histogram for
+# percentiles) before the next tile is built. The tile size comes from the
+# memory budget, so a 10^8-point study runs in the same memory as a small one.
+# The percentile histogram keeps a fixed number of equal bins; when a tile has
+# values outside its range, the bin width is doubled (bins merged in pairs)
+# until they fit, so no value is ever lost in an under/overflow bin.
+#
+# float32: the kernels below keep float32 inputs in float32 (about half the
+# memory and bandwidth). Each operation rounds with a relative error of at most
+# u = 2^-24 = 6e-8. The IPR is ~15 operations deep, so rates differ from float64
+# by at most ~15u = 1e-6 relative to the largest term, i.e. |dq| <= 1e-6 *
+# J * pr, plus the bisection of the operating point, which in float32 resolves
+# pwf to one ulp (~2.4e-4 psi at 3000 psi). float32_error measures the actual
+# difference on a random sample of any sweep.
+
+SweepStats = namedtuple("SweepStats", "count mean min max argmin argmax percentiles bin_width")
+
+
+# Kernels: keyword parameters in, dict of outputs out
+def ipr_kernel(q_test, pwf_test, pr, pb, pwf, ef=1):
+    """
+
+    :return: {"q": Oil Production rate}
+    """
+    return {"q": qo_model(ipr_model(q_test, pwf_test, pr, pb, ef), pwf)}
+
+
+def nodal_kernel(q_test, pwf_test, pr, pb, thp, api, wc, sg_h2o, tvd, md, nvl, id, c=120):
+    """
+
+    :return: {"q": operating rate, "pwf": operating pressure}
+    """
+    model = ipr_model(q_test, pwf_test, pr, pb)
+    vlp = vlp_model(thp, api, wc, sg_h2o, tvd, md, nvl, id, c)
+    point = operating_point(lambda pwf: qo_model(model, pwf), pr, vlp)
+    return {"q": point.q, "pwf": point.pwf}
+
+
+def chunk_points(n_params: int,
+                 memory_mb: float,
+                 dtype=np.float64,
+                 work_arrays: int = 32) -> int:
+    """
+
+    :param n_params: Swept parameters
+    :param memory_mb: Memory budget of one tile
+    :param dtype: Computation dtype
+    :param work_arrays: Temporaries per point the kernel is assumed to hold at once
+    :return: Points per tile
+    """
+    per_point = np.dtype(dtype).itemsize * (n_params + work_arrays) + 8  # + the int64 point number
+    return max(1, int(memory_mb * 1024 ** 2 // per_point))
+
+
+def _tiles(grid, chunk, dtype):
+    names = list(grid)
+    values = [np.asarray(grid[name], dtype=dtype) for name in names]
+    sizes = [len(v) for v in values]
+    total = int(np.prod(sizes))
+    for start in range(0, total, chunk):
+        index = np.arange(start, min(start + chunk, total))
+        subs = np.unravel_index(index, sizes)
+        yield index, {name: v[s] for name, v, s in zip(names, values, subs)}
+
+
+def _grow(a, lo_value, hi_value):
+    # Double the bin width, merging bins in pairs, until [lo_value, hi_value] fits
+    bins = len(a["hist"])
+    while lo_value < a["lo"] or hi_value >= a["lo"] + bins * a["width"]:
+        merged = a["hist"].reshape(-1, 2).sum(axis=1)
+        if lo_value < a["lo"]:
+            a["hist"] = np.concatenate((np.zeros(bins // 2, dtype=np.int64), merged))
+            a["lo"] -= bins * a["width"]
+        else:
+            a["hist"] = np.concatenate((merged, np.zeros(bins // 2, dtype=np.int64)))
+        a["width"] *= 2
+
+
+def _point(grid, flat_index):
+    subs = np.unravel_index(flat_index, [len(v) for v in grid.values()])
+    return {name: float(np.asarray(v)[s]) for (name, v), s in zip(grid.items(), subs)}
+
+
+# %%
+
+def sweep(kernel,
+          grid: dict,
+          fixed: dict = None,
+          memory_mb: float = 256,
+          dtype=np.float64,
+          percentiles=(10, 50, 90),
+          hist_range: dict = None,
+          bins: int = 4096) -> dict:
+    """
+
+    Percentiles come from a histogram of `bins` equal bins that starts on
+    hist_range[output] (by default the range of the first tile) and doubles
+    its bin width whenever later values fall outside. A percentile is the
+    centre of the bin holding its rank, clipped to the exact min/max, so its
+    error is at most one bin width, returned as SweepStats.bin_width (the
+    width of the first range / bins, doubled once per growth).
+
+    :param kernel: Function of keyword arrays returning a dict of output arrays
+    :param grid: Parameter name -> 1-D values to sweep
+    :param fixed: Parameter name -> value shared by every point
+    :param memory_mb: Memory budget of one tile
+    :param dtype: np.float64 or np.float32
+    :param percentiles: Percentiles to report
+    :param hist_range: Output name -> (lo, hi) of the percentile histogram
+    :param bins: Histogram bins (rounded up to an even number)
+    :return: Output name -> SweepStats; argmin/argmax are the parameters of the extreme points
+    """
+    fixed = {name: np.asarray(value, dtype=dtype) for name, value in (fixed or {}).items()}
+    chunk = chunk_points(len(grid), memory_mb, dtype)
+    bins += bins % 2
+    acc = {}
+    for index, params in _tiles(grid, chunk, dtype):
+        outputs = kernel(**params, **fixed)
+        for name, values in outputs.items():
+            values = np.broadcast_to(values, index.shape)
+            finite = np.isfinite(values)
+            v = values[finite]
+            if len(v) == 0:
+                continue
+            k_min, k_max = np.argmin(v), np.argmax(v)
+            if name not in acc:
+                lo, hi = (hist_range or {}).get(name, (float(v[k_min]), float(v[k_max])))
+                acc[name] = dict(count=0, total=0.0, min=np.inf, max=-np.inf, argmin=None, argmax=None,
+                                 lo=float(lo), width=max(float(hi) - float(lo), 1e-12) / bins,
+                                 hist=np.zeros(bins, dtype=np.int64))
+            a = acc[name]
+            a["count"] += len(v)
+            a["total"] += float(v.sum(dtype=np.float64))
+            if v[k_min] < a["min"]:
+                a["min"], a["argmin"] = float(v[k_min]), int(index[finite][k_min])
+            if v[k_max] > a["max"]:
+                a["max"], a["argmax"] = float(v[k_max]), int(index[finite][k_max])
+            _grow(a, float(v[k_min]), float(v[k_max]))
+            k = np.minimum(((v - a["lo"]) / a["width"]).astype(np.int64), bins - 1)
+            a["hist"] += np.bincount(k, minlength=bins)
+
+    stats = {}
+    for name, a in acc.items():
+        cumulative = np.cumsum(a["hist"])
+        centers = a["lo"] + (np.arange(bins) + 0.5) * a["width"]
+        ranks = np.asarray(percentiles, dtype=float) / 100 * max(a["count"] - 1, 0)
+        values = np.clip(centers[np.searchsorted(cumulative, ranks, side="right")], a["min"], a["max"])
+        stats[name] = SweepStats(
+            a["count"], a["total"] / a["count"] if a["count"] else np.nan, a["min"], a["max"],
+            _point(grid, a["argmin"]) if a["argmin"] is not None else None,
+            _point(grid, a["argmax"]) if a["argmax"] is not None else None,
+            dict(zip(percentiles, values)), a["width"])
+    return stats
+
+
+# float32 vs float64 on a random sample of the sweep
+def float32_error(kernel,
+                  grid: dict,
+                  fixed: dict = None,
+                  samples: int = 100000,
+                  seed: int = 0) -> dict:
+    """
+
+    :param kernel: Kernel as in sweep
+    :param grid: Parameter grids
+    :param fixed: Fixed parameters
+    :param samples: Points to compare
+    :param seed: Random seed
+    :return: Output name -> (max absolute error, max error relative to the largest |value|)
+    """
+    rng = np.random.default_rng(seed)
+    sizes = [len(v) for v in grid.values()]
+    index = rng.integers(0, int(np.prod(sizes)), samples)
+    subs = np.unravel_index(index, sizes)
+    results = []
+    for dtype in (np.float64, np.float32):
+        params = {name: np.asarray(v, dtype=dtype)[s] for (name, v), s in zip(grid.items(), subs)}
+        params.update({name: np.asarray(value, dtype=dtype) for name, value in (fixed or {}).items()})
+        results.append(kernel(**params))
+    errors = {}
+    for name in results[0]:
+        exact = np.asarray(results[0][name], dtype=np.float64)
+        diff = np.abs(np.asarray(results[1][name], dtype=np.float64) - exact)
+        finite = np.isfinite(diff)
+        scale = np.nanmax(np.abs(exact[finite])) if finite.any() else np.nan
+        errors[name] = (float(diff[finite].max()), float(diff[finite].max() / scale))
+    return errors
+
+
+# Quicktest
+grid_test = {"pr": np.linspace(2000, 4000, 200), "pwf": np.linspace(0, 2000, 500), "q_test": [300, 500, 800]}
+fixed_test = {"pwf_test": 1500, "pb": 2500}
+stats_test = sweep(ipr_kernel, grid_test, fixed_test, memory_mb=8, dtype=np.float32)
+print("Rate over the sweep (bpd): min", stats_test["q"].min, "max", stats_test["q"].max,
+      "P50", stats_test["q"].percentiles[50])
+print("float32 error (abs, rel):", float32_error(ipr_kernel, grid_test, fixed_test, samples=10000))
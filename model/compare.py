@@ -0,0 +1,154 @@
+# %%
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from model.batch import describe, validate_test
+from model.ipr import ipr_model, pwf_model, qo_model
+from model.jobs import FLEET_COLUMNS
+from model.nodal import operating_point, vlp_model, vlp_pressure
+
+# %%
+
+# Multi-well comparison
+# The IPR and VLP curves of every well of an upload are evaluated on one
+# (wells, rates) array: the rate axis of each well runs from 0 to its rate at
+# pwf = 0, the IPR pressure comes from pwf_model and the VLP pressure from
+# vlp_pressure, and all the operating points from one operating_point call.
+# For drawing, every curve is cut down to a few dozen points with
+# largest-triangle-three-buckets decimation (done on all the wells at once),
+# which keeps the bends of the curves, and each family of curves is a single
+# LineCollection, so the chart stays light with hundreds of wells.
+
+Comparison = namedtuple("Comparison", "wells q pwf po table")
+
+RANKINGS = {"AOF": "AOF(bpd)", "Operating rate": "q(bpd)", "Drawdown": "Drawdown(psi)"}
+
+
+def comparison(fleet: pd.DataFrame, points: int = 200) -> Comparison:
+    """
+
+    :param fleet: One row per well: well, the FLEET_COLUMNS, optionally ef and c
+    :param points: Rates per curve
+    :return: Comparison: well names, rates, IPR and VLP pressures of shape (wells, points), and the table of
+             J, AOF, operating point, drawdown and status of every well (flagged wells are NaN)
+    """
+    v = {name: fleet[name].to_numpy(dtype=float) for name in FLEET_COLUMNS}
+    ef = fleet["ef"].to_numpy(dtype=float) if "ef" in fleet else np.ones(len(fleet))
+    c = fleet["c"].to_numpy(dtype=float) if "c" in fleet else np.full(len(fleet), 120.0)
+    status = validate_test(v["q_test"], v["pwf_test"], v["pr"], v["pb"], ef)
+    good = status == 0
+    column = {name: values[:, None] for name, values in v.items()}
+    model = ipr_model(column["q_test"], column["pwf_test"], column["pr"], column["pb"], ef[:, None])
+    vlp = vlp_model(*(column[name] for name in FLEET_COLUMNS[4:]), c[:, None])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q_end = qo_model(model, 0.0)
+        q = np.where(good[:, None], q_end * np.linspace(0.0, 1.0, points), np.nan)
+        pwf = pwf_model(model, q)
+        po = vlp_pressure(vlp, q)
+        point = operating_point(lambda p: qo_model(model, p), model.pr, vlp)
+    q_op, pwf_op = point.q[:, 0], point.pwf[:, 0]
+    table = pd.DataFrame({"well": fleet["well"].astype(str).to_numpy() if "well" in fleet else
+                          [f"Well {k + 1}" for k in range(len(fleet))]})
+    table['J(bpd/psi)'] = model.j[:, 0]
+    table['AOF(bpd)'] = model.aof[:, 0]
+    table['q(bpd)'] = q_op
+    table['Pwf(psia)'] = pwf_op
+    table['Drawdown(psi)'] = v["pr"] - pwf_op
+    table.loc[~good, table.columns[1:]] = np.nan
+    table['status'] = describe(status)
+    return Comparison(table["well"].to_numpy(), q, pwf, po, table)
+
+
+def ranking(table: pd.DataFrame,
+            by: str = "AOF",
+            ascending: bool = False) -> pd.DataFrame:
+    """
+
+    :param table: Comparison.table
+    :param by: Key of RANKINGS
+    :param ascending: Smallest first
+    :return: Table sorted by the ranking, with its rank (flagged wells last)
+    """
+    ranked = table.sort_values(RANKINGS[by], ascending=ascending, na_position="last", kind="stable")
+    ranked.insert(0, "rank", np.arange(1, len(ranked) + 1))
+    return ranked
+
+
+# %%
+
+# Largest-triangle-three-buckets decimation of many curves at once
+def decimate(x, y, n_out: int = 40):
+    """
+
+    :param x: Curves x, shape (curves, points)
+    :param y: Curves y, same shape
+    :param n_out: Points kept per curve (the first and last are always kept)
+    :return: (x, y) of shape (curves, n_out)
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    curves, n = x.shape
+    if n <= n_out:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.zeros((curves, n_out), dtype=int)
+    keep[:, -1] = n - 1
+    rows = np.arange(curves)
+    previous = np.zeros(curves, dtype=int)
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        next_hi = edges[b + 2] if b + 2 < len(edges) else n
+        with warnings.catch_warnings():
+            # Flagged wells are all NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            avg_x = np.nanmean(x[:, hi:next_hi], axis=1)[:, None] if next_hi > hi else x[:, -1:]
+            avg_y = np.nanmean(y[:, hi:next_hi], axis=1)[:, None] if next_hi > hi else y[:, -1:]
+        ax_, ay_ = x[rows, previous][:, None], y[rows, previous][:, None]
+        area = np.abs((ax_ - avg_x) * (y[:, lo:hi] - ay_) - (ax_ - x[:, lo:hi]) * (avg_y - ay_))
+        previous = lo + np.argmax(np.nan_to_num(area, nan=-1.0), axis=1)
+        keep[:, b + 1] = previous
+    return np.take_along_axis(x, keep, axis=1), np.take_along_axis(y, keep, axis=1)
+
+
+def comparison_figure(result: Comparison,
+                      highlight=(),
+                      n_out: int = 40):
+    """
+
+    :param result: Comparison
+    :param highlight: Rows of the wells drawn in colour, with their names
+    :param n_out: Points per drawn curve
+    :return: Figure with every IPR (grey) and VLP (light blue) and the operating points
+    """
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    for pressures, color in ((result.pwf, "0.75"), (result.po, "#9ecae1")):
+        x, y = decimate(result.q, pressures, n_out)
+        ax.add_collection(LineCollection(np.stack((x, y), axis=-1), colors=color, linewidths=0.6))
+    for row in highlight:
+        x, y = decimate(result.q[row:row + 1], result.pwf[row:row + 1], n_out)
+        line, = ax.plot(x[0], y[0], lw=1.8, label=str(result.wells[row]))
+        x, y = decimate(result.q[row:row + 1], result.po[row:row + 1], n_out)
+        ax.plot(x[0], y[0], lw=1.2, ls="--", color=line.get_color())
+    ax.scatter(result.table['q(bpd)'], result.table['Pwf(psia)'], s=8, color="red", zorder=3,
+               label="Operating points")
+    ax.autoscale()
+    ax.set_xlim(left=0)
+    ax.set_ylim(bottom=0)
+    ax.set_xlabel('q(bpd)')
+    ax.set_ylabel('Pwf(psia)')
+    ax.set_title(f'IPR and VLP of {len(result.wells)} wells')
+    ax.grid()
+    ax.legend(loc="upper right", fontsize="small")
+    return fig
+
+
+# Quicktest
+fleet_test = pd.DataFrame({"well": ["A", "B", "C"], "q_test": [500, 800, 300], "pwf_test": [2500, 1800, 2000],
+                           "pr": [3000, 2600, 3200], "pb": [2800, 2000, 1500], "thp": 150, "api": 30, "wc": 0.2,
+                           "sg_h2o": 1.0, "tvd": 5000, "md": 5500, "nvl": 0, "id": 2.5})
+print(ranking(comparison(fleet_test, 50).table, "Operating rate"))
@@ -0,0 +1,285 @@
+# %%
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from model.ipr import IPRModel, as_float, as_floats, ipr_model, qo_model
+from model.nodal import VLP, OperatingPoint, vlp_model
+
+# %%
+
+# Closed-form derivatives
+# The rate and the lift pressure with their partial derivatives from one
+# vectorized call, for sensitivities (tornado charts) and Newton solves.
+#
+# IPR regimes (qo_model), with u = 1 - pwf / pb and y = 1 - pwf / pr:
+#   pr > pb, pwf >= pb   q = J * (pr - pwf)
+#   pr > pb, pwf <  pb   q = J * D,  D = (pr - pb) + pb * u - (4/9) * ef * pb * u^2
+#   pr <= pb             q = qmax * S,  S = 1.8 * ef * y - 0.8 * ef^2 * y^2
+# A well test fixes J = q_test / D(pwf_test) (model.j.j, Darcy/Vogel for ef = 1,
+# Standing otherwise) or qmax = q_test / (1 - 0.2 r - 0.8 r^2), r = pwf_test / pr,
+# so with the test held fixed J and qmax move with pr, pb and ef too.
+#
+# VLP: Po = THP + g * (TVD - NVL) + g * f(q) * MD with
+#   f = 2.083e-3 * (100 q / (34.3 c))^1.85 * id^-4.8655     (f_darcy)
+#   g = 0.433 * (wc * sg_h2o + (1 - wc) * 141.5 / (131.5 + api))   (gradient_avg)
+
+QoDerivatives = namedtuple("QoDerivatives", "q d_pr d_pb d_ef d_j d_qmax d_pwf")
+TestDerivatives = namedtuple("TestDerivatives", "q d_pr d_pb d_ef d_q_test d_pwf_test d_pwf")
+FrictionDerivatives = namedtuple("FrictionDerivatives", "f d_q d_id d_c")
+GradientDerivatives = namedtuple("GradientDerivatives", "g d_api d_wc d_sg_h2o")
+VLPDerivatives = namedtuple("VLPDerivatives", "po d_q d_thp d_api d_wc d_sg_h2o d_tvd d_md d_nvl d_id d_c")
+
+IPR_PARAMETERS = ("pr", "pb", "ef", "j", "qmax")
+VLP_PARAMETERS = ("thp", "api", "wc", "sg_h2o", "tvd", "md", "nvl", "id", "c")
+
+
+def _composite(pr, pb, ef, pwf):
+    # D of the composite curve below pb and its partials (pr, pb, ef, pwf)
+    u = 1 - pwf / pb
+    d = (pr - pb) + pb * u - 4 / 9 * ef * pb * u ** 2
+    return d, np.ones_like(d), -4 / 9 * ef * u * (1 + pwf / pb), -4 / 9 * pb * u ** 2, -1 + 8 / 9 * ef * u
+
+
+# Qo and its partials from the IPR constants (J and qmax held)
+def qo_derivatives(model: IPRModel, pwf) -> QoDerivatives:
+    """
+
+    qb is taken as J * (pr - pb), as ipr_model builds it, so dq/dJ and dq/dpr
+    include its change.
+
+    :param model: IPRModel
+    :param pwf: Flowing bottom-hole pressure
+    :return: QoDerivatives: q (same as qo_model) and dq/dpr, dq/dpb, dq/def, dq/dJ, dq/dqmax, dq/dpwf
+    """
+    pwf = as_float(pwf)
+    pr, pb, ef, j_value, qmax = model.pr, model.pb, model.ef, model.j, model.qmax
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d, d_pr, d_pb, d_ef, d_pwf = _composite(pr, pb, ef, pwf)
+        y = 1 - pwf / pr
+        s = 1.8 * ef * y - 0.8 * ef ** 2 * y ** 2
+        s_y = 1.8 * ef - 1.6 * ef ** 2 * y
+    above = pwf >= pb
+    under = pr > pb
+    zero = np.zeros(np.broadcast(pr, pb, ef, j_value, qmax, pwf).shape, dtype=np.result_type(j_value, pwf))
+
+    def regime(darcy, composite, saturated):
+        return zero + np.where(under, np.where(above, darcy, composite), saturated)
+
+    return QoDerivatives(
+        q=regime(j_value * (pr - pwf), j_value * d, qmax * s),
+        d_pr=regime(j_value, j_value * d_pr, qmax * s_y * pwf / pr ** 2),
+        d_pb=regime(0.0, j_value * d_pb, 0.0),
+        d_ef=regime(0.0, j_value * d_ef, qmax * (1.8 * y - 1.6 * ef * y ** 2)),
+        d_j=regime(pr - pwf, d, 0.0),
+        d_qmax=regime(0.0, 0.0, s),
+        d_pwf=regime(-j_value, j_value * d_pwf, -qmax * s_y / pr))
+
+
+# Qo and its partials with the well test held fixed
+def qo_test_derivatives(q_test,
+                        pwf_test,
+                        pr,
+                        pb,
+                        pwf,
+                        ef=1) -> TestDerivatives:
+    """
+
+    J (or qmax) is re-derived from the test when pr, pb or ef move, as
+    ipr_model does; this is the sensitivity of a field study where the test
+    is the measurement and pr, pb, ef are estimates.
+
+    :param q_test: Test flow rate
+    :param pwf_test: Flowing bottom-hole pressure during test
+    :param pr: Reservoir pressure
+    :param pb: Bubble-point pressure
+    :param pwf: Flowing bottom-hole pressure
+    :param ef: Efficiency factor
+    :return: TestDerivatives: q and dq/dpr, dq/dpb, dq/def, dq/dq_test, dq/dpwf_test, dq/dpwf
+    """
+    q_test, pwf_test, pr, pb, ef = as_floats(q_test, pwf_test, pr, pb, ef)
+    qd = qo_derivatives(ipr_model(q_test, pwf_test, pr, pb, ef), pwf)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # J = q_test / D_test: dJ/dx = -J / D_test * dD_test/dx
+        d, d_pr, d_pb, d_ef, d_pwf_t = _composite(pr, pb, ef, pwf_test)
+        above = pwf_test >= pb
+        d = np.where(above, pr - pwf_test, d)
+        j_value = q_test / d
+        dj = [np.where(above, a, b) * -j_value / d for a, b in ((1.0, d_pr), (0.0, d_pb), (0.0, d_ef), (-1.0, d_pwf_t))]
+        dj_dq_test = 1 / d
+        # qmax = q_test / V, V = 1 - 0.2 r - 0.8 r^2
+        r = pwf_test / pr
+        v = 1 - 0.2 * r - 0.8 * r ** 2
+        qmax = q_test / v
+        dqmax_dpr = -qmax / v * (0.2 * r + 1.6 * r ** 2) / pr
+        dqmax_dpwf_t = qmax / v * (0.2 + 1.6 * r) / pr
+    return TestDerivatives(
+        q=qd.q,
+        d_pr=qd.d_pr + qd.d_j * dj[0] + qd.d_qmax * dqmax_dpr,
+        d_pb=qd.d_pb + qd.d_j * dj[1],
+        d_ef=qd.d_ef + qd.d_j * dj[2],
+        d_q_test=qd.d_j * dj_dq_test + qd.d_qmax / v,
+        d_pwf_test=qd.d_j * dj[3] + qd.d_qmax * dqmax_dpwf_t,
+        d_pwf=qd.d_pwf)
+
+
+# %%
+
+# Friction factor (model.other.f_darcy) and its partials
+def f_darcy_derivatives(q, id, c=120) -> FrictionDerivatives:
+    """
+
+    :param q: Volumetric flow rate
+    :param id: Pipe inner diameter
+    :param c: Roughness coefficient
+    :return: FrictionDerivatives: f and df/dq, df/did, df/dc
+    """
+    q, id, c = as_floats(np.maximum(q, 0.0), id, c)
+    k = 2.083e-3 * (100 / (34.3 * c)) ** 1.85 * id ** -4.8655
+    f = k * q ** 1.85
+    return FrictionDerivatives(f, 1.85 * k * q ** 0.85, -4.8655 * f / id, -1.85 * f / c)
+
+
+# Average gradient (model.other.gradient_avg) and its partials
+def gradient_avg_derivatives(api, wc, sg_h2o) -> GradientDerivatives:
+    """
+
+    :param api: API gravity of oil
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :return: GradientDerivatives: gradient and dg/dapi, dg/dwc, dg/dsg_h2o
+    """
+    api, wc, sg_h2o = as_floats(api, wc, sg_h2o)
+    sg_oil = 141.5 / (131.5 + api)
+    g = 0.433 * (wc * sg_h2o + (1 - wc) * sg_oil)
+    return GradientDerivatives(g, -0.433 * (1 - wc) * sg_oil / (131.5 + api), 0.433 * (sg_h2o - sg_oil), 0.433 * wc)
+
+
+# Lift pressure and its partials
+def vlp_derivatives(vlp: VLP, q, api, wc, sg_h2o) -> VLPDerivatives:
+    """
+
+    :param vlp: VLP
+    :param q: Flow rate
+    :param api: API gravity of oil (for the gradient partials)
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :return: VLPDerivatives: Po (same as vlp_pressure) and its partials
+    """
+    f = f_darcy_derivatives(q, vlp.id, vlp.c)
+    g = gradient_avg_derivatives(api, wc, sg_h2o)
+    head = vlp.tvd - vlp.nvl + f.f * vlp.md  # dPo/dg
+    po = vlp.thp + vlp.gradient * head
+    ones = np.ones_like(po)
+    return VLPDerivatives(
+        po=po, d_q=vlp.gradient * vlp.md * f.d_q, d_thp=ones,
+        d_api=head * g.d_api, d_wc=head * g.d_wc, d_sg_h2o=head * g.d_sg_h2o,
+        d_tvd=vlp.gradient * ones, d_md=vlp.gradient * f.f, d_nvl=-vlp.gradient * ones,
+        d_id=vlp.gradient * vlp.md * f.d_id, d_c=vlp.gradient * vlp.md * f.d_c)
+
+
+# %%
+
+# Operating point by safeguarded Newton
+def operating_point_newton(model: IPRModel,
+                           vlp: VLP,
+                           tol: float = 1e-6,
+                           iterations: int = 30) -> OperatingPoint:
+    """
+
+    Newton on F(pwf) = Po(qo(pwf)) - pwf, F' = dPo/dq * dq/dpwf - 1 <= -1, so
+    F is strictly decreasing in [0, pr]. Steps leaving the bracket fall back to
+    bisection. Converges quadratically: typically 4-6 iterations instead of the
+    50 of operating_point.
+
+    :param model: IPRModel
+    :param vlp: VLP
+    :param tol: Pressure tolerance (psi)
+    :param iterations: Maximum iterations
+    :return: OperatingPoint(q, pwf); wells that cannot lift get q = 0 and pwf = pr
+    """
+    f0 = f_darcy_derivatives(0.0, vlp.id, vlp.c)
+    shape = np.broadcast(*model, *vlp).shape
+    pr = np.broadcast_to(model.pr, shape)
+    flowing = vlp.thp + vlp.gradient * (vlp.tvd - vlp.nvl + f0.f * vlp.md) < pr
+    lo, hi = np.zeros(shape), pr.astype(float)
+    pwf = pr.astype(float)
+    for _ in range(iterations):
+        qd = qo_derivatives(model, pwf)
+        f = f_darcy_derivatives(qd.q, vlp.id, vlp.c)
+        residual = vlp.thp + vlp.gradient * (vlp.tvd - vlp.nvl + f.f * vlp.md) - pwf
+        lo = np.where(residual > 0, pwf, lo)
+        hi = np.where(residual > 0, hi, pwf)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = pwf - residual / (vlp.gradient * vlp.md * f.d_q * qd.d_pwf - 1)
+        inside = (step > lo) & (step < hi)
+        new = np.where(inside, step, 0.5 * (lo + hi))
+        converged = np.abs(new - pwf) < tol
+        pwf = new
+        if np.all(converged | ~flowing):
+            break
+    q = qo_model(model, pwf)
+    return OperatingPoint(np.where(flowing, q, 0.0), np.where(flowing, pwf, pr))
+
+
+# Sensitivity of the operating point (implicit function theorem)
+def operating_sensitivities(model: IPRModel,
+                            vlp: VLP,
+                            api,
+                            wc,
+                            sg_h2o,
+                            point: OperatingPoint = None) -> dict:
+    """
+
+    At the operating point Po(q(pwf, a), b) = pwf, so for an IPR parameter a
+    dpwf/da = Po_q * q_a / (1 - Po_q * q_pwf), and for a VLP parameter b
+    dpwf/db = Po_b / (1 - Po_q * q_pwf); dq follows from q(pwf, a).
+
+    :param model: IPRModel
+    :param vlp: VLP
+    :param api: API gravity of oil
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :param point: Operating point (solved with operating_point_newton if None)
+    :return: Parameter name -> (dq_op, dpwf_op); zero for wells that do not flow
+    """
+    if point is None:
+        point = operating_point_newton(model, vlp)
+    qd = qo_derivatives(model, point.pwf)
+    vd = vlp_derivatives(vlp, point.q, api, wc, sg_h2o)
+    flowing = point.q > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(flowing, 1 / (1 - vd.d_q * qd.d_pwf), 0.0)
+    result = {}
+    for name in IPR_PARAMETERS:
+        q_a = getattr(qd, "d_" + name)
+        dpwf = scale * vd.d_q * q_a
+        result[name] = (np.where(flowing, q_a + qd.d_pwf * dpwf, 0.0), dpwf)
+    for name in VLP_PARAMETERS:
+        dpwf = scale * getattr(vd, "d_" + name)
+        result[name] = (qd.d_pwf * dpwf, dpwf)
+    return result
+
+
+def tornado_table(sensitivities: dict, deltas: dict) -> pd.DataFrame:
+    """
+
+    :param sensitivities: Result of operating_sensitivities for one well
+    :param deltas: Parameter name -> +/- change to evaluate, e.g. {"pr": 100, "wc": 0.1}
+    :return: DataFrame of the linearized rate change per parameter, largest first
+    """
+    rows = [(name, float(np.squeeze(sensitivities[name][0])) * delta) for name, delta in deltas.items()]
+    df = pd.DataFrame(rows, columns=['parameter', 'dq(bpd)']).set_index('parameter')
+    df['low(bpd)'] = -df['dq(bpd)']  # rate change at -delta
+    df['high(bpd)'] = df['dq(bpd)']  # rate change at +delta
+    return df.reindex(df['dq(bpd)'].abs().sort_values(ascending=False).index)
+
+
+# Quicktest
+ipr_test = ipr_model(500, 2500, 3000, 2800)
+vlp_test = vlp_model(thp=150, api=30, wc=0.2, sg_h2o=1.0, tvd=5000, md=5500, nvl=0, id=2.5)
+point_test = operating_point_newton(ipr_test, vlp_test)
+print("Operating point by Newton (q, pwf):", point_test.q, point_test.pwf)
+print(tornado_table(operating_sensitivities(ipr_test, vlp_test, 30, 0.2, 1.0, point_test),
+                    {"pr": 100, "j": 0.1, "thp": 50, "wc": 0.1, "id": 0.5}))
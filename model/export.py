@@ -0,0 +1,206 @@
+# %%
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional for the model package (jobs workers, reports); the app has it through streamlit
+    pa = None
+    pq = None
+
+# %%
+
+# Columnar export of results
+# IPR tables, nodal tables, operating points and sweeps are written as typed
+# Arrow tables. The input parameters of the run travel in the schema metadata,
+# so a file is self-describing. Parquet is the compact exchange format; the
+# Arrow IPC file is the one to memory-map for zero-copy reads.
+
+METADATA_KIND = b"pynodal.kind"
+METADATA_PARAMS = b"pynodal.params"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required to export results: pip install pyarrow")
+
+
+def _json_default(value):
+    # numpy scalars and arrays found in the input parameters
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+# DataFrame -> typed Arrow table with the run parameters as metadata
+def to_arrow(df: pd.DataFrame,
+             kind: str,
+             params: dict = None):
+    """
+
+    :param df: Result table (IPR, nodal, operating point or sweep)
+    :param kind: Kind of result, stored in the metadata
+    :param params: Input parameters of the run
+    :return: pyarrow.Table
+    """
+    _require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KIND] = kind.encode()
+    metadata[METADATA_PARAMS] = json.dumps(params or {}, default=_json_default).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+# Operating points (or any sweep of named arrays) as a table
+def sweep_table(**columns) -> pd.DataFrame:
+    """
+
+    :param columns: Equal-size arrays, e.g. q=point.q, pwf=point.pwf, pr=pr_values
+    :return: DataFrame with one flat float64 column per argument
+    """
+    arrays = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in columns.values()])
+    return pd.DataFrame({name: a.ravel() for name, a in zip(columns, arrays)})
+
+
+# %%
+
+def write_parquet(df: pd.DataFrame,
+                  path,
+                  kind: str,
+                  params: dict = None,
+                  compression: str = "zstd"):
+    """
+
+    :param df: Result table
+    :param path: Output file (or writable file object)
+    :param kind: Kind of result
+    :param params: Input parameters of the run
+    :param compression: Parquet compression codec
+    """
+    _require_pyarrow()
+    pq.write_table(to_arrow(df, kind, params), path, compression=compression)
+
+
+def write_arrow(df: pd.DataFrame,
+                path,
+                kind: str,
+                params: dict = None):
+    """
+
+    Uncompressed Arrow IPC file, readable without copies through read_arrow.
+
+    :param df: Result table
+    :param path: Output file
+    :param kind: Kind of result
+    :param params: Input parameters of the run
+    """
+    _require_pyarrow()
+    table = to_arrow(df, kind, params)
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def parquet_bytes(df: pd.DataFrame,
+                  kind: str,
+                  params: dict = None) -> bytes:
+    """
+
+    :param df: Result table
+    :param kind: Kind of result
+    :param params: Input parameters of the run
+    :return: Parquet file contents, e.g. for st.download_button
+    """
+    _require_pyarrow()
+    sink = pa.BufferOutputStream()
+    write_parquet(df, sink, kind, params)
+    return sink.getvalue().to_pybytes()
+
+
+# Chunked writing for large fleet runs
+def write_chunks(chunks,
+                 path,
+                 kind: str,
+                 params: dict = None,
+                 file_format: str = "parquet"):
+    """
+
+    Every chunk is written as its own row group (Parquet) or record batch
+    (Arrow IPC) as soon as it arrives, so the full result never has to be in
+    memory. All the chunks must have the same columns.
+
+    :param chunks: Iterable of DataFrames
+    :param path: Output file
+    :param kind: Kind of result
+    :param params: Input parameters of the run
+    :param file_format: "parquet" or "arrow"
+    :return: Number of rows written
+    """
+    _require_pyarrow()
+    writer, sink, rows = None, None, 0
+    try:
+        for df in chunks:
+            table = to_arrow(df, kind, params)
+            if writer is None:
+                if file_format == "parquet":
+                    writer = pq.ParquetWriter(str(path), table.schema, compression="zstd")
+                else:
+                    sink = pa.OSFile(str(path), "wb")
+                    writer = pa.ipc.new_file(sink, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+    return rows
+
+
+# %%
+
+# Zero-copy reading of Arrow IPC files
+def read_arrow(path):
+    """
+
+    :param path: Arrow IPC file written by write_arrow or write_chunks(file_format="arrow")
+    :return: pyarrow.Table whose buffers point into the memory-mapped file
+    """
+    _require_pyarrow()
+    source = pa.memory_map(str(path), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def read_parquet(path, columns=None):
+    """
+
+    :param path: Parquet file
+    :param columns: Columns to read (all by default)
+    :return: pyarrow.Table
+    """
+    _require_pyarrow()
+    return pq.read_table(str(path), columns=columns, memory_map=True)
+
+
+def column_arrays(table, name: str) -> list:
+    """
+
+    :param table: pyarrow.Table
+    :param name: Column name
+    :return: One numpy view per chunk of the column (no copy for null-free numeric columns)
+    """
+    return [chunk.to_numpy(zero_copy_only=True) for chunk in table.column(name).chunks]
+
+
+def read_metadata(table) -> tuple:
+    """
+
+    :param table: pyarrow.Table read from an exported file
+    :return: (kind, input parameters) of the run
+    """
+    metadata = table.schema.metadata or {}
+    return metadata.get(METADATA_KIND, b"").decode(), json.loads(metadata.get(METADATA_PARAMS, b"{}"))
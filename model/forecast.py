@@ -0,0 +1,166 @@
+# %%
+import numpy as np
+import pandas as pd
+
+from model.ipr import ipr_model, ipr_model_from_j, qo_model
+from model.nodal import VLP, operating_point, vlp_model, vlp_pressure
+
+# %%
+
+# Time-lapse nodal analysis
+# The productivity index is taken from the well test at the initial pressure and
+# kept along the forecast; the IPR is rebuilt for every date from that index and
+# the reservoir pressure of the date (ipr_model_from_j), and the operating point
+# of all the dates is solved in a single operating_point call.
+
+
+def _days(dates):
+    # Elapsed days from the first date, as floats
+    dates = pd.to_datetime(pd.Series(dates))
+    return ((dates - dates.iloc[0]).dt.total_seconds() / 86400.0).to_numpy()
+
+
+def _forecast_table(dates, pr, point):
+    days = _days(dates)
+    # Cumulative oil by trapezoidal integration of the daily rates
+    np_cum = np.concatenate(([0.0], np.cumsum(0.5 * (point.q[1:] + point.q[:-1]) * np.diff(days))))
+    df = pd.DataFrame()
+    df['date'] = pd.to_datetime(pd.Series(dates)).to_numpy()
+    df['Pr(psia)'] = pr
+    df['q(bpd)'] = point.q
+    df['Pwf(psia)'] = point.pwf
+    df['Np(bbl)'] = np_cum
+    return df
+
+
+# Reservoir pressure from a user-supplied series
+def pressure_series(dates,
+                    pr_dates,
+                    pr_values):
+    """
+
+    :param dates: Dates of the forecast
+    :param pr_dates: Dates of the measured (or simulated) reservoir pressures
+    :param pr_values: Reservoir pressures at pr_dates
+    :return: Reservoir pressure at every forecast date (linear in time, held flat outside the series)
+    """
+    dates = pd.to_datetime(pd.Series(dates))
+    pr_dates = pd.to_datetime(pd.Series(pr_dates))
+    origin = min(dates.iloc[0], pr_dates.min())
+    x = ((dates - origin).dt.total_seconds()).to_numpy()
+    xp = ((pr_dates - origin).dt.total_seconds()).to_numpy()
+    order = np.argsort(xp)
+    return np.interp(x, xp[order], np.asarray(pr_values, dtype=float)[order])
+
+
+# %%
+
+# Forecast with a known reservoir pressure history
+def forecast_pressure(dates,
+                      pr,
+                      j_value: float,
+                      pb: float,
+                      vlp: VLP,
+                      ef: float = 1):
+    """
+
+    :param dates: Dates of the forecast
+    :param pr: Reservoir pressure at every date (see pressure_series)
+    :param j_value: Productivity index
+    :param pb: Bubble-point pressure
+    :param vlp: VLP of the well
+    :param ef: Efficiency factor
+    :return: DataFrame with date, Pr(psia), q(bpd), Pwf(psia) and Np(bbl)
+    """
+    pr = np.asarray(pr, dtype=float)
+    model = ipr_model_from_j(j_value, pr, pb, ef)
+    point = operating_point(lambda pwf: qo_model(model, pwf), pr, vlp)
+    return _forecast_table(dates, pr, point)
+
+
+# Reservoir pressure from a tank material balance
+def tank_pressure(dates,
+                  pi: float,
+                  n_oip: float,
+                  ce: float,
+                  j_value: float,
+                  pb: float,
+                  vlp: VLP,
+                  ef: float = 1,
+                  points: int = 400):
+    """
+
+    Tank model Np = N * ce * (pi - pr), so dpr/dt = -q(pr) / (N * ce). The time to
+    deplete to each pressure of a grid is the integral of N * ce / q(pr); the rates
+    q(pr) of the whole grid come from one operating_point call and the pressure at
+    each date is interpolated back from that time/pressure table.
+
+    :param dates: Dates of the forecast
+    :param pi: Initial reservoir pressure
+    :param n_oip: Original oil in place (bbl)
+    :param ce: Effective compressibility (1/psi)
+    :param j_value: Productivity index
+    :param pb: Bubble-point pressure
+    :param vlp: VLP of the well
+    :param ef: Efficiency factor
+    :param points: Size of the pressure grid
+    :return: Reservoir pressure at every forecast date
+    """
+    if n_oip * ce <= 0:
+        raise ValueError("the tank model needs n_oip * ce > 0")
+    pr_grid = np.linspace(pi, 0.0, points)
+    model = ipr_model_from_j(j_value, pr_grid, pb, ef)
+    q_grid = operating_point(lambda pwf: qo_model(model, pwf), pr_grid, vlp).q
+    # The table stops where the well dies (pr = Po at zero rate); after the last
+    # flowing node the rate is linear in pr down to that pressure, which gives an
+    # exponential approach to it
+    pr_dead = float(vlp_pressure(vlp, 0.0))
+    days = _days(dates)
+    if pi <= pr_dead:
+        return np.full(len(days), float(pi))
+    flowing = q_grid > 0
+    pr_grid, q_grid = pr_grid[flowing], q_grid[flowing]
+    if len(pr_grid) < 2:
+        tau = n_oip * ce * (pi - pr_dead) / qo_model(ipr_model_from_j(j_value, pi, pb, ef), pr_dead)
+        return pr_dead + (pi - pr_dead) * np.exp(-days / tau)
+    # Exact time for a rate linear in pressure between grid nodes (log-mean rate)
+    q1, q2 = q_grid[:-1], q_grid[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        q_mean = np.where(np.isclose(q1, q2), q1, (q1 - q2) / np.log(q1 / q2))
+    dt = n_oip * ce * -np.diff(pr_grid) / q_mean
+    t_grid = np.concatenate(([0.0], np.cumsum(dt)))
+    tau = n_oip * ce * (pr_grid[-1] - pr_dead) / q_grid[-1]
+    tail = pr_dead + (pr_grid[-1] - pr_dead) * np.exp(-np.maximum(days - t_grid[-1], 0.0) / tau)
+    return np.where(days <= t_grid[-1], np.interp(days, t_grid, pr_grid), tail)
+
+
+def forecast_tank(dates,
+                  pi: float,
+                  n_oip: float,
+                  ce: float,
+                  j_value: float,
+                  pb: float,
+                  vlp: VLP,
+                  ef: float = 1):
+    """
+
+    :param dates: Dates of the forecast
+    :param pi: Initial reservoir pressure
+    :param n_oip: Original oil in place (bbl)
+    :param ce: Effective compressibility (1/psi)
+    :param j_value: Productivity index
+    :param pb: Bubble-point pressure
+    :param vlp: VLP of the well
+    :param ef: Efficiency factor
+    :return: DataFrame with date, Pr(psia), q(bpd), Pwf(psia) and Np(bbl)
+    """
+    pr = tank_pressure(dates, pi, n_oip, ce, j_value, pb, vlp, ef)
+    return forecast_pressure(dates, pr, j_value, pb, vlp, ef)
+
+
+# Quicktest
+dates = pd.date_range("2024-01-01", periods=10 * 365, freq="D")
+vlp = vlp_model(thp=150, api=30, wc=0.2, sg_h2o=1.0, tvd=5000, md=5500, nvl=0, id=2.5)
+j_test = float(ipr_model(500, 2500, 3000, 2800).j)
+df_forecast = forecast_tank(dates, 3000, 5e6, 1.5e-5, j_test, 2800, vlp)
+print("Forecast rate after 1, 5 and 10 years (bpd):", df_forecast['q(bpd)'].iloc[[365, 5 * 365, -1]].to_numpy())
@@ -1,12 +1,22 @@
 # %%
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from scipy.interpolate import make_interp_spline
 
+from model.cache import cached, content_hash
 from model.q import qo_ipr_compuesto, qo, qb, qo_darcy, qo_vogel
 # %%
 
+# Methods of IPR_curve_methods
+IPR_METHODS = ("Darcy", "Vogel", "IPR Compuesto")
+
+
 # IPR CURVE
 
 def IPR_curve(q_test, pwf_test, pr, pwf: list, pb):
@@ -15,7 +25,8 @@ def IPR_curve(q_test, pwf_test, pr, pwf: list, pb):
     df['Pwf(psia)'] = pwf
     df['Qo(bpd)'] = df['Pwf(psia)'].apply(
         lambda x: qo_ipr_compuesto(q_test, pwf_test, pr, x, pb))
-    fig, ax = plt.subplots(figsize=(20, 10))
+    fig = Figure(figsize=(20, 10))
+    ax = fig.subplots()
     x = df['Qo(bpd)']
     y = df['Pwf(psia)']
     # The following steps are used to smooth the curve
@@ -29,22 +40,23 @@ def IPR_curve(q_test, pwf_test, pr, pwf: list, pb):
     ax.set_title('IPR', fontsize=18)
     ax.set(xlim=(0, df['Qo(bpd)'].max() + 10), ylim=(0, df['Pwf(psia)'][0] + 100))
     # Arrow and Annotations
-    plt.annotate(
+    ax.annotate(
         'Bubble Point', xy=(qb(q_test, pwf_test, pr, pb), pb),
         xytext=(qb(q_test, pwf_test, pr, pb) + 100, pb + 100),
         arrowprops=dict(arrowstyle='->', lw=1)
     )
     # Horizontal and Vertical lines at bubble point
-    plt.axhline(y=pb, color='r', linestyle='--')
-    plt.axvline(x=qb(q_test, pwf_test, pr, pb), color='r', linestyle='--')
+    ax.axhline(y=pb, color='r', linestyle='--')
+    ax.axvline(x=qb(q_test, pwf_test, pr, pb), color='r', linestyle='--')
     ax.grid()
-    plt.show()
+    return fig
 
 
 # IPR Curve
 def IPR_curve_methods(q_test, pwf_test, pr, pwf:list, pb, method, ef=1, ef2=None):
     # Creating Dataframe
-    fig, ax = plt.subplots(figsize=(20, 10))
+    fig = Figure(figsize=(20, 10))
+    ax = fig.subplots()
     df = pd.DataFrame()
     df['Pwf(psia)'] = pwf
     if method == 'Darcy':
@@ -67,15 +79,15 @@ def IPR_curve_methods(q_test, pwf_test, pr, pwf:list, pb, method, ef=1, ef2=None
     ax.set_title('IPR')
     ax.set(xlim=(0, df['Qo(bpd)'].max() + 10), ylim=(0, df['Pwf(psia)'].max() + 100))
     # Arrow and Annotations
-    plt.annotate(
+    ax.annotate(
         'Bubble Point', xy=(qb(q_test, pwf_test, pr, pb), pb),xytext=(qb(q_test, pwf_test, pr, pb) + 100, pb + 100) ,
     arrowprops=dict(arrowstyle='->',lw=1)
     )
     # Horizontal and Vertical lines at bubble point
-    plt.axhline(y=pb, color='r', linestyle='--')
-    plt.axvline(x=qb(q_test, pwf_test, pr, pb), color='r', linestyle='--')
+    ax.axhline(y=pb, color='r', linestyle='--')
+    ax.axvline(x=qb(q_test, pwf_test, pr, pb), color='r', linestyle='--')
     ax.grid()
-    plt.show()
+    return fig
 
 
 # IPR Curve
@@ -85,7 +97,11 @@ def IPR_Curve(q_test, pwf_test, pr, pwf: list, pb, ef=1, ef2=None, ax=None):
     df['Pwf(psia)'] = pwf
     df['Qo(bpd)'] = df['Pwf(psia)'].apply(
         lambda x: qo(q_test, pwf_test, pr, x, pb, ef, ef2))
-    fig, ax = plt.subplots(figsize=(20, 10))
+    if ax is None:
+        fig = Figure(figsize=(20, 10))
+        ax = fig.subplots()
+    else:
+        fig = ax.figure
     x = df['Qo(bpd)']
     y = df['Pwf(psia)']
     # The following steps are used to smooth the curve
@@ -99,14 +115,157 @@ def IPR_Curve(q_test, pwf_test, pr, pwf: list, pb, ef=1, ef2=None, ax=None):
     ax.set_title('IPR', fontsize=18)
     ax.set(xlim=(0, df['Qo(bpd)'].max() + 10), ylim=(0, df['Pwf(psia)'][0] + 100))
     # Arrow and Annotations
-    plt.annotate(
+    ax.annotate(
         'Bubble Point', xy=(qb(q_test, pwf_test, pr, pb), pb),
         xytext=(qb(q_test, pwf_test, pr, pb) + 100, pb + 100),
         arrowprops=dict(arrowstyle='->', lw=1)
     )
     # Horizontal and Vertical lines at bubble point
-    plt.axhline(y=pb, color='r', linestyle='--')
-    plt.axvline(x=qb(q_test, pwf_test, pr, pb), color='r', linestyle='--')
+    ax.axhline(y=pb, color='r', linestyle='--')
+    ax.axvline(x=qb(q_test, pwf_test, pr, pb), color='r', linestyle='--')
     ax.grid()
-    plt.show()
+    return fig
+
+
+# System curve of a nodal table (IPR, VLP and Psys against q)
+def nodal_figure(df2: pd.DataFrame):
+    fig4 = Figure()
+    ax4 = fig4.subplots()
+    pl = df2[['q(bpd)', 'Pwf(psia)', 'Po(psia)', 'Psys(psia)']]
+    ax4.plot(list(pl['q(bpd)']), list(pl['Pwf(psia)']), color="red",
+             label="IPR")
+    ax4.plot(list(pl['q(bpd)']), list(pl['Po(psia)']), color="green",
+             label="VLP")
+    ax4.plot(list(pl['q(bpd)']), list(pl['Psys(psia)']), color="orange",
+             label="System Curve")
+    ax4.set_xlabel('q(bpd)')
+    ax4.set_ylabel('Pwf(psia)')
+    ax4.grid()
+    return fig4
+
+
+# %%
+
+# Figure encoding and the rendering pool
+# The figures above are matplotlib.figure.Figure objects that pyplot never
+# sees, so a figure belongs to the thread that builds it and several can be
+# drawn at once. render_figure() builds and encodes a figure in a bounded pool
+# of workers: the charts of several wells (a report, a comparison page) are
+# drawn concurrently and the request thread only waits for the bytes. The pool
+# uses threads by default; render_pool(processes=True) moves the drawing to
+# worker processes, for which the builder must be a module-level function.
+
+RENDER_WORKERS = int(os.environ.get("PYNODAL_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+
+_render_lock = threading.Lock()
+_render = {"executor": None}
+
+
+# Figure -> PNG bytes (the bytes can be cached and shared)
+def figure_png(fig, dpi=100) -> bytes:
+    """
+
+    :param fig: Matplotlib figure
+    :param dpi: Resolution
+    :return: PNG image
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+# Figure -> SVG bytes
+def figure_svg(fig) -> bytes:
+    """
+
+    :param fig: Matplotlib figure
+    :return: SVG image
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='svg', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+# Figure -> PDF bytes (one page)
+def figure_pdf(fig) -> bytes:
+    """
+
+    :param fig: Matplotlib figure
+    :return: PDF document
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='pdf')
+    return buffer.getvalue()
+
+
+def _build_and_encode(builder, args, kwargs, fmt, dpi):
+    fig = builder(*args, **kwargs)
+    if fmt == "svg":
+        return figure_svg(fig)
+    if fmt == "pdf":
+        return figure_pdf(fig)
+    return figure_png(fig, dpi)
+
+
+def render_pool(workers: int = None,
+                processes: bool = False):
+    """
+
+    :param workers: Figures drawn at once (None: RENDER_WORKERS)
+    :param processes: Draw in worker processes instead of threads
+    :return: The executor used by render_figure (created on first use)
+    """
+    with _render_lock:
+        executor = _render["executor"]
+        if workers is None and not processes and executor is not None:
+            return executor
+        if executor is not None:
+            # Futures already submitted still finish
+            executor.shutdown(wait=False)
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        _render["executor"] = pool(max_workers=workers or RENDER_WORKERS)
+        return _render["executor"]
+
+
+def render_figure(builder, *args, fmt: str = "png", dpi: int = 100, **kwargs):
+    """
+
+    :param builder: Function returning a Figure, e.g. IPR_curve_methods
+    :param args: Arguments of the builder
+    :param fmt: "png", "svg" or "pdf"
+    :param dpi: Resolution of the PNG
+    :param kwargs: Keyword arguments of the builder
+    :return: Future of the encoded image
+    """
+    # Submitted under the lock, so render_pool cannot shut the executor down in between
+    with _render_lock:
+        if _render["executor"] is None:
+            _render["executor"] = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+        return _render["executor"].submit(_build_and_encode, builder, args, kwargs, fmt, dpi)
+
+
+def render_figures(jobs, fmt: str = "png", dpi: int = 100) -> list:
+    """
+
+    :param jobs: Iterable of (builder, args) or (builder, args, kwargs)
+    :param fmt: "png", "svg" or "pdf"
+    :param dpi: Resolution of the PNG
+    :return: Encoded images, in the order of jobs
+    """
+    futures = [render_figure(job[0], *job[1], fmt=fmt, dpi=dpi, **(job[2] if len(job) > 2 else {}))
+               for job in jobs]
+    return [future.result() for future in futures]
+
+
+# PNG of IPR_curve_methods, shared by every session and report with the same inputs
+def ipr_png(pwf, q_test, pwf_test, pr, pb, method) -> bytes:
+    """
 
+    :param pwf: Pressures of the curve (any order)
+    :param method: "Darcy", "Vogel" or "IPR Compuesto"
+    :return: PNG image, drawn in the rendering pool
+    """
+    arr_pwf = np.sort(np.asarray(pwf, dtype=float))[::-1]
+    ipr_key = content_hash(arr_pwf, q_test, pwf_test, pr, pb, method)
+    return cached("ipr", ipr_key,
+                  lambda: render_figure(IPR_curve_methods, q_test, pwf_test, pr, arr_pwf, pb, method).result())
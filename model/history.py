@@ -0,0 +1,339 @@
+# %%
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from model.cache import content_hash
+from model.export import _json_default
+
+# %%
+
+# Run history
+# Every potential, IPR, nodal and operating point computation can be recorded
+# in a local SQLite file: well, day, kind of run, the inputs as JSON with their
+# hash, the scalar outputs (q, pwf, aof, j) as columns and, for nodal and IPR
+# runs, the result table compressed in a blob. The scalar outputs are part of
+# the (well, date) index, so the trend of one well is read from the index alone
+# whatever the size of the file. The same well, kind, day and inputs are stored
+# once (Streamlit reruns the page on every widget change), and rows are written
+# in batches of one transaction each.
+
+HISTORY_PATH = os.environ.get("PYNODAL_HISTORY", "pynodal_history.db")
+
+HISTORY_COLUMNS = ("well", "date", "kind", "params_hash", "params", "q", "pwf", "aof", "j", "result")
+
+Run = namedtuple("Run", HISTORY_COLUMNS, defaults=(None,) * 5)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    well TEXT NOT NULL,
+    date TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    params TEXT,
+    q REAL,
+    pwf REAL,
+    aof REAL,
+    j REAL,
+    result BLOB,
+    created REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS runs_unique ON runs (well, kind, date, params_hash);
+CREATE INDEX IF NOT EXISTS runs_params ON runs (params_hash);
+CREATE INDEX IF NOT EXISTS runs_trend ON runs (well, date, kind, q, pwf, aof, j);
+CREATE TABLE IF NOT EXISTS wells (well TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+
+_TREND_COLUMNS = "id, date, kind, q, pwf, aof, j"
+
+_lock = threading.Lock()
+_stores = {}
+
+
+def open_store(path=None) -> sqlite3.Connection:
+    """
+
+    :param path: SQLite file (None: HISTORY_PATH, ":memory:" for a throwaway store)
+    :return: Connection shared by every thread of the process for that path
+    """
+    path = str(path or HISTORY_PATH)
+    with _lock:
+        store = _stores.get(path)
+        if store is None:
+            store = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            store.execute("PRAGMA journal_mode=WAL")
+            store.execute("PRAGMA synchronous=NORMAL")
+            store.execute("PRAGMA cache_size=-65536")
+            store.executescript(_SCHEMA)
+            _stores[path] = store
+    return store
+
+
+def _day(date) -> str:
+    return (pd.Timestamp.today() if date is None else pd.Timestamp(date)).strftime("%Y-%m-%d")
+
+
+def _number(value):
+    # NumPy scalars and 0-d arrays to float, NaN to NULL
+    if value is None:
+        return None
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _nullable(values) -> list:
+    # Float array -> list with None (NULL) in place of NaN
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _params_hash(kind: str, params_json: str, table: pd.DataFrame = None) -> str:
+    digest = hashlib.blake2b(f"{kind}|{params_json}".encode(), digest_size=16)
+    if table is not None:
+        digest.update(content_hash(table).encode())
+    return digest.hexdigest()
+
+
+def pack_table(df: pd.DataFrame) -> bytes:
+    """
+
+    :param df: Result table
+    :return: Compressed JSON of the table (pack_table/unpack_table keep columns and values)
+    """
+    return zlib.compress(df.to_json(orient="split", index=False, double_precision=15).encode())
+
+
+def unpack_table(blob: bytes) -> pd.DataFrame:
+    """
+
+    :param blob: Output of pack_table
+    :return: Result table
+    """
+    split = json.loads(zlib.decompress(blob))
+    return pd.DataFrame(split["data"], columns=split["columns"])
+
+
+def make_run(well,
+             kind: str,
+             params: dict,
+             date=None,
+             q=None,
+             pwf=None,
+             aof=None,
+             j=None,
+             table: pd.DataFrame = None) -> Run:
+    """
+
+    :param well: Well name
+    :param kind: Kind of run ("potential", "ipr", "nodal", "operating_point", ...)
+    :param params: Input parameters of the run
+    :param date: Day of the run (None: today)
+    :param q: Oil rate (bpd)
+    :param pwf: Flowing bottom-hole pressure (psia)
+    :param aof: Absolute Open Flow (bpd)
+    :param j: Productivity index (bpd/psi)
+    :param table: Result table (IPR or nodal table)
+    :return: Run ready for record_runs
+    """
+    params_json = json.dumps(params, sort_keys=True, default=_json_default)
+    return Run(str(well), _day(date), kind, _params_hash(kind, params_json, table), params_json, _number(q),
+               _number(pwf), _number(aof), _number(j),
+               None if table is None else pack_table(table))
+
+
+# %%
+
+def record_runs(store: sqlite3.Connection,
+                runs,
+                batch_size: int = 10000) -> int:
+    """
+
+    :param store: Connection from open_store
+    :param runs: Iterable of Run (make_run)
+    :param batch_size: Rows per transaction
+    :return: Rows inserted (runs already stored for the same well, kind, day and inputs are skipped)
+    """
+    inserted = 0
+    batch = []
+    runs = iter(runs)
+    while True:
+        batch.clear()
+        for run in runs:
+            batch.append(tuple(run) + (time.time(),))
+            if len(batch) == batch_size:
+                break
+        if not batch:
+            return inserted
+        with _lock:
+            store.execute("BEGIN")
+            try:
+                cursor = store.executemany(
+                    f"INSERT OR IGNORE INTO runs ({', '.join(HISTORY_COLUMNS)}, created) "
+                    f"VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 1))})", batch)
+                inserted += cursor.rowcount
+                store.executemany("INSERT OR IGNORE INTO wells VALUES (?)", {(row[0],) for row in batch})
+                store.execute("COMMIT")
+            except BaseException:
+                store.execute("ROLLBACK")
+                raise
+
+
+def record_run(store: sqlite3.Connection, *args, **kwargs) -> int:
+    """
+
+    Single run, same arguments as make_run.
+
+    :return: 1 if stored, 0 if the same run was already stored that day
+    """
+    return record_runs(store, [make_run(*args, **kwargs)])
+
+
+def record_frame(store: sqlite3.Connection,
+                 df: pd.DataFrame,
+                 kind: str,
+                 params=(),
+                 date=None,
+                 batch_size: int = 10000) -> int:
+    """
+
+    Many wells at once, e.g. the output of model.jobs.fleet_pipeline joined to its inputs.
+
+    :param store: Connection from open_store
+    :param df: One row per well with a well column, optional q(bpd), Pwf(psia), AOF(bpd), J(bpd/psi) columns
+               and the input columns named in params
+    :param kind: Kind of run
+    :param params: Columns stored as the inputs of every row
+    :param date: Day of the runs (None: today), or the name of a date column
+    :param batch_size: Rows per transaction
+    :return: Rows inserted
+    """
+    outputs = {"q": "q(bpd)", "pwf": "Pwf(psia)", "aof": "AOF(bpd)", "j": "J(bpd/psi)"}
+    n = len(df)
+    columns = [_nullable(df[column]) if column in df else [None] * n for column in outputs.values()]
+    if isinstance(date, str) and date in df:
+        days = pd.to_datetime(df[date]).dt.strftime("%Y-%m-%d").tolist()
+    else:
+        days = [_day(date)] * n
+    inputs = df[list(params)].to_dict(orient="records") if params else [{}] * n
+    params_json = [json.dumps(row, sort_keys=True, default=_json_default) for row in inputs]
+    keys = [_params_hash(kind, text) for text in params_json]
+    wells = df["well"].astype(str).tolist()
+    runs = map(Run, wells, days, [kind] * n, keys, params_json, *columns)
+    return record_runs(store, runs, batch_size)
+
+
+# %%
+
+def list_wells(store: sqlite3.Connection) -> list:
+    """
+
+    :return: Names of the wells with stored runs
+    """
+    with _lock:
+        return [row[0] for row in store.execute("SELECT well FROM wells ORDER BY well")]
+
+
+def well_trend(store: sqlite3.Connection,
+               well,
+               kind: str = None,
+               start=None,
+               end=None) -> pd.DataFrame:
+    """
+
+    :param store: Connection from open_store
+    :param well: Well name
+    :param kind: Only runs of this kind (None: all)
+    :param start: First day (None: from the first run)
+    :param end: Last day (None: up to the last run)
+    :return: DataFrame with id, date, kind, q, pwf, aof, j of every run, by date
+    """
+    query = f"SELECT {_TREND_COLUMNS} FROM runs WHERE well = ? AND date BETWEEN ? AND ?"
+    args = [str(well), "" if start is None else _day(start), "9999-12-31" if end is None else _day(end)]
+    if kind is not None:
+        query += " AND kind = ?"
+        args.append(kind)
+    with _lock:
+        rows = store.execute(query + " ORDER BY date", args).fetchall()
+    df = pd.DataFrame(rows, columns=_TREND_COLUMNS.split(", ")).astype(
+        {"q": float, "pwf": float, "aof": float, "j": float})
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def find_runs(store: sqlite3.Connection, params_hash: str) -> pd.DataFrame:
+    """
+
+    :param store: Connection from open_store
+    :param params_hash: Run.params_hash
+    :return: Every run with those inputs (any well or day), without the result tables
+    """
+    with _lock:
+        rows = store.execute(f"SELECT {_TREND_COLUMNS}, well, params FROM runs WHERE params_hash = ?",
+                             (params_hash,)).fetchall()
+    return pd.DataFrame(rows, columns=_TREND_COLUMNS.split(", ") + ["well", "params"])
+
+
+def load_run(store: sqlite3.Connection, run_id: int):
+    """
+
+    :param store: Connection from open_store
+    :param run_id: id of the run (well_trend, find_runs)
+    :return: (inputs dict, result table or None)
+    """
+    with _lock:
+        row = store.execute("SELECT params, result FROM runs WHERE id = ?", (int(run_id),)).fetchone()
+    if row is None:
+        raise KeyError(f"no run with id {run_id}")
+    return json.loads(row[0] or "{}"), None if row[1] is None else unpack_table(row[1])
+
+
+def compare_dates(store: sqlite3.Connection,
+                  well,
+                  kind: str,
+                  dates) -> pd.DataFrame:
+    """
+
+    :param store: Connection from open_store
+    :param well: Well name
+    :param kind: Kind of run
+    :param dates: Days to compare, e.g. (today, a month ago)
+    :return: Last run on or before every day (one row per day, NaN if there is none)
+    """
+    rows = []
+    with _lock:
+        for date in dates:
+            row = store.execute(f"SELECT {_TREND_COLUMNS} FROM runs WHERE well = ? AND date <= ? AND kind = ? "
+                                f"ORDER BY date DESC, id DESC LIMIT 1", (str(well), _day(date), kind)).fetchone()
+            rows.append(row or (None, None, kind, None, None, None, None))
+    df = pd.DataFrame(rows, columns=_TREND_COLUMNS.split(", ")).astype({"q": float, "pwf": float, "aof": float,
+                                                                       "j": float})
+    df.insert(0, "asked", [_day(date) for date in dates])
+    return df
+
+
+# Quicktest
+if __name__ == "__main__":
+    store_test = open_store(":memory:")
+    rng = np.random.default_rng(0)
+    wells_test, days_test = 200, 500
+    fleet_test = pd.DataFrame({"well": np.repeat([f"W-{k}" for k in range(wells_test)], days_test),
+                               "date": np.tile(pd.date_range("2025-01-01", periods=days_test), wells_test),
+                               "q(bpd)": rng.uniform(100, 900, wells_test * days_test),
+                               "Pwf(psia)": rng.uniform(800, 2500, wells_test * days_test)})
+    fleet_test["pr"] = fleet_test["Pwf(psia)"] + 500
+    started = time.perf_counter()
+    print("Runs stored:", record_frame(store_test, fleet_test, "operating_point", params=("pr",), date="date"),
+          f"in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    trend_test = well_trend(store_test, "W-123", "operating_point", "2025-06-01", "2025-12-31")
+    print(f"Trend of W-123: {len(trend_test)} runs in {1000 * (time.perf_counter() - started):.1f} ms")
+    print(compare_dates(store_test, "W-123", "operating_point", ("2026-05-15", "2026-04-15")))
@@ -0,0 +1,269 @@
+# %%
+from collections import namedtuple
+
+import numpy as np
+
+# %%
+
+# Vectorized IPR
+# The scalar functions in model/q.py call j() several times per evaluation.
+# IPRModel keeps the constants of one IPR (j, qb, qmax, aof) so that a full
+# pwf sweep, or a full pressure history, is a few array expressions.
+# Every field may be a scalar or an array; they broadcast together.
+
+IPRModel = namedtuple("IPRModel", "pr pb ef j qb qmax aof")
+
+
+def as_float(value):
+    # Float arrays keep their precision (float32 sweeps stay float32), Python
+    # numbers stay Python floats so that they do not promote float32 arrays
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = np.asarray(value)
+    return value if np.issubdtype(value.dtype, np.floating) else value.astype(float)
+
+
+def as_floats(*values):
+    # Common float dtype of several inputs: float32 only if the arrays are float32
+    values = [np.asarray(v) if isinstance(v, (list, tuple)) else v for v in values]
+    dtype = np.result_type(*values)
+    if not np.issubdtype(dtype, np.floating):
+        dtype = np.float64
+    return tuple(np.asarray(v, dtype=dtype) for v in values)
+
+
+def _ef2_array(ef2):
+    # None (no second efficiency) is carried as NaN so that it can live in arrays
+    if ef2 is None:
+        return np.nan
+    return as_float(ef2)
+
+
+# Productivity Index (array version of model.j.j)
+def j_array(q_test,
+            pwf_test,
+            pr,
+            pb,
+            ef=1,
+            ef2=None):
+    """
+
+    :param q_test: Production rate
+    :param pwf_test: Bottom pressure
+    :param pr: Reservoir pressure
+    :param pb: Bubble pressure
+    :param ef: Efficiency 1
+    :param ef2: Efficiency 2 (None or NaN when not used)
+    :return: Productivity Index, same formulas as model.j.j
+    """
+    q_test, pwf_test, pr, pb, ef = as_floats(q_test, pwf_test, pr, pb, ef)
+    ef2 = _ef2_array(ef2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = pwf_test / pb
+        darcy = q_test / (pr - pwf_test)
+        vogel = q_test / ((pr - pb) + (pb / 1.8) * (1 - 0.2 * x - 0.8 * x ** 2))
+        standing = q_test / ((pr - pb) + (pb / 1.8) * (1.8 * (1 - x) - 0.8 * ef * (1 - x) ** 2))
+        standing_ef2 = ((q_test / (pr - pb) + (pb / 1.8) *
+                         (1.8 * (1 - x) - 0.8 * ef * (1 - x) ** 2)) / ef) * ef2
+        above = pwf_test >= pb
+        j_value = np.where(
+            ef == 1, np.where(above, darcy, vogel),
+            np.where(np.isnan(ef2), np.where(above, darcy, standing),
+                     np.where(above, darcy / ef * ef2, standing_ef2)))
+    return j_value
+
+
+# Absolute Open Flow (array version of model.q.aof)
+def aof_array(q_test,
+              pwf_test,
+              pr,
+              pb,
+              ef=1,
+              ef2=None):
+    """
+
+    :param q_test: Production rate
+    :param pwf_test: Bottom pressure
+    :param pr: Reservoir pressure
+    :param pb: Bubble pressure
+    :param ef: Efficiency 1
+    :param ef2: Efficiency 2 (None or NaN when not used)
+    :return: Absolute Open Flow, NaN for the ef/ef2 combinations model.q.aof does not handle
+    """
+    q_test, pwf_test, pr, pb, ef = as_floats(q_test, pwf_test, pr, pb, ef)
+    ef2 = _ef2_array(ef2)
+    no_ef2 = np.isnan(ef2)
+    j_1 = j_array(q_test, pwf_test, pr, pb)
+    j_ef = j_array(q_test, pwf_test, pr, pb, ef, ef2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = pwf_test / pr
+        vogel_sat = q_test / (1 - 0.2 * y - 0.8 * y ** 2)
+        standing_sat = q_test / (1.8 * ef * (1 - y) - 0.8 * ef ** 2 * (1 - y) ** 2)
+        above = pwf_test >= pb
+        # (j used, factor of the undersaturated term below pb, factor of the saturated term)
+        cases = [
+            (np.equal(ef, 1) & no_ef2, j_1, 1 / pb, None),
+            ((ef < 1) & no_ef2, j_ef, 1.8 - 0.8 * ef, 1.8 * ef - 0.8 * ef ** 2),
+            ((ef > 1) & no_ef2, j_ef, 0.624 + 0.376 * ef, 0.624 + 0.376 * ef),
+            ((ef < 1) & (ef2 >= 1), j_ef, 0.624 + 0.376 * ef2, 0.624 + 0.376 * ef2),
+            ((ef > 1) & (ef2 <= 1), j_ef, 1.8 - 0.8 * ef2, 1.8 * ef - 0.8 * ef ** 2),
+        ]
+        aof_value = np.full(np.broadcast(q_test, pwf_test, pr, pb, ef, ef2).shape, np.nan, dtype=j_1.dtype)
+        for mask, j_value, below_factor, sat_factor in reversed(cases):
+            under = np.where(above, j_value * pr,
+                             j_value * (pr - pb) + (j_value * pb / 1.8) * below_factor)
+            sat = vogel_sat if sat_factor is None else standing_sat * sat_factor
+            aof_value = np.where(mask, np.where(pr > pb, under, sat), aof_value)
+    return aof_value
+
+
+# Qo (bpd) @ all conditions (array version of model.q.qo)
+def qo_array(q_test,
+             pwf_test,
+             pr,
+             pwf,
+             pb,
+             ef=1,
+             ef2=None):
+    """
+
+    The branches of model.q.qo as they are: above pb the Darcy rate ignores ef,
+    for ef != 1 without ef2 the rate at pb is qb evaluated with pwf in place of
+    pr, and in saturated reservoirs qo_standing ignores ef2. qo_model is the
+    smooth IPR used by the solvers; this is what the scalar function returns.
+
+    :param q_test: Test flow rate
+    :param pwf_test: Flowing bottom-hole pressure during test
+    :param pr: Reservoir pressure
+    :param pwf: Flowing bottom-hole pressure
+    :param pb: Bubble-point pressure
+    :param ef: Efficiency factor
+    :param ef2: Additional efficiency factor (None or NaN when not used)
+    :return: Oil Production rate, NaN for ef = 1 with ef2 (model.q.qo does not handle it)
+    """
+    q_test, pwf_test, pr, pwf, pb, ef = as_floats(q_test, pwf_test, pr, pwf, pb, ef)
+    ef2 = _ef2_array(ef2)
+    no_ef2 = np.isnan(ef2)
+    j_1 = j_array(q_test, pwf_test, pr, pb)
+    aof_1 = aof_array(q_test, pwf_test, pr, pb)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = pwf / pb
+        y = pwf / pr
+        darcy = j_1 * (pr - pwf)
+        vogel = j_1 * (pr - pb) + (j_1 * pb / 1.8) * (1 - 0.2 * x - 0.8 * x ** 2)
+        shape = 1.8 * (1 - x) - 0.8 * ef * (1 - x) ** 2
+        standing = (j_array(q_test, pwf_test, pwf, pb, ef) * (pwf - pb)
+                    + (j_array(q_test, pwf_test, pr, pb, ef) * pb / 1.8) * shape)
+        j_ef2 = j_array(q_test, pwf_test, pr, pb, ef, ef2)
+        standing_ef2 = j_ef2 * (pr - pb) + (j_ef2 * pb / 1.8) * shape
+        below = np.where(np.equal(ef, 1), vogel, np.where(no_ef2, standing, standing_ef2))
+        saturated = np.where(np.equal(ef, 1), aof_1 * (1 - 0.2 * y - 0.8 * y ** 2),
+                             aof_1 * (1.8 * ef * (1 - y) - 0.8 * ef ** 2 * (1 - y) ** 2))
+        qo_value = np.where(pr > pb, np.where(pwf >= pb, darcy, below), saturated)
+    return np.where(np.equal(ef, 1) & ~no_ef2, np.nan, qo_value)
+
+
+# %%
+
+# IPR constants from a well test
+def ipr_model(q_test,
+              pwf_test,
+              pr,
+              pb,
+              ef=1,
+              ef2=None) -> IPRModel:
+    """
+
+    :param q_test: Test flow rate
+    :param pwf_test: Flowing bottom-hole pressure during test
+    :param pr: Reservoir pressure
+    :param pb: Bubble-point pressure
+    :param ef: Efficiency factor
+    :param ef2: Additional efficiency factor (optional)
+    :return: IPRModel with the constants of the IPR
+    """
+    q_test, pwf_test, pr, pb, ef = as_floats(q_test, pwf_test, pr, pb, ef)
+    j_value = j_array(q_test, pwf_test, pr, pb, ef, ef2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = pwf_test / pr
+        qmax_sat = q_test / (1 - 0.2 * y - 0.8 * y ** 2)
+    qb_value = np.where(pr > pb, j_value * (pr - pb), 0.0)
+    qmax = np.where(pr > pb, qb_value + j_value * pb / 1.8, qmax_sat)
+    return IPRModel(pr, pb, ef, j_value, qb_value, qmax, aof_array(q_test, pwf_test, pr, pb, ef, ef2))
+
+
+# IPR constants from a known productivity index
+def ipr_model_from_j(j_value,
+                     pr,
+                     pb,
+                     ef=1) -> IPRModel:
+    """
+
+    Used when the reservoir pressure changes but the productivity index is kept,
+    e.g. a depletion forecast. Below pb the Vogel AOF is tied to j as j * pr / 1.8,
+    which joins the composite IPR continuously at pr = pb.
+
+    :param j_value: Productivity index
+    :param pr: Reservoir pressure
+    :param pb: Bubble-point pressure
+    :param ef: Efficiency factor
+    :return: IPRModel with the constants of the IPR
+    """
+    j_value, pr, pb, ef = as_floats(j_value, pr, pb, ef)
+    qb_value = np.where(pr > pb, j_value * (pr - pb), 0.0)
+    qmax = np.where(pr > pb, qb_value + j_value * pb / 1.8, j_value * pr / 1.8)
+    aof_value = np.where(pr > pb, qb_value + j_value * pb / 1.8 * (1.8 - 0.8 * ef),
+                         qmax * (1.8 * ef - 0.8 * ef ** 2))
+    return IPRModel(pr, pb, ef, j_value, qb_value, qmax, aof_value)
+
+
+# Qo (bpd) @ all conditions from the IPR constants
+def qo_model(model: IPRModel, pwf):
+    """
+
+    Same result as model.q.qo for ef=1, ef2=None. For ef != 1 the Standing shape
+    is applied to the composite curve below pb and to the Vogel AOF above it.
+
+    :param model: IPRModel
+    :param pwf: Flowing bottom-hole pressure (broadcasts against the model fields)
+    :return: Oil Production rate
+    """
+    pwf = as_float(pwf)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = 1 - pwf / model.pb
+        y = 1 - pwf / model.pr
+        darcy = model.j * (model.pr - pwf)
+        composite = model.qb + (model.j * model.pb / 1.8) * (1.8 * x - 0.8 * model.ef * x ** 2)
+        saturated = model.qmax * (1.8 * model.ef * y - 0.8 * model.ef ** 2 * y ** 2)
+    return np.where(model.pr > model.pb, np.where(pwf >= model.pb, darcy, composite), saturated)
+
+
+# Pwf (psia) for a given rate: inverse of qo_model
+def pwf_model(model: IPRModel, q):
+    """
+
+    Above qb this is pwf_darcy; below pb the quadratic of the composite (or
+    saturated) curve is solved for pwf. For ef > 1.125 the curve turns over
+    near pwf = 0 and the higher-pressure root is returned.
+
+    :param model: IPRModel
+    :param q: Oil Production rate (broadcasts against the model fields)
+    :return: Flowing bottom-hole pressure; NaN or negative above qo_model(model, 0)
+    """
+    q = as_float(q)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        darcy = model.pr - q / model.j
+        # q / J = (pr - pb) + pb * u - a * u^2 with u = 1 - pwf / pb
+        a = 0.8 / 1.8 * model.ef * model.pb
+        c = q / model.j - (model.pr - model.pb)
+        u = (model.pb - np.sqrt(model.pb ** 2 - 4 * a * c)) / (2 * a)
+        composite = model.pb * (1 - u)
+        y = (1.8 - np.sqrt(3.24 - 3.2 * q / model.qmax)) / (1.6 * model.ef)
+        saturated = model.pr * (1 - y)
+    return np.where(model.pr > model.pb, np.where(q <= model.qb, darcy, composite), saturated)
+
+
+# Quicktest
+model = ipr_model(500, 2500, 3000, 2800)
+pwf_values = np.array([3000, 2800, 1500, 0])
+print("Oil Production rate (Qo):", qo_model(model, pwf_values))
@@ -0,0 +1,328 @@
+# %%
+import json
+import multiprocessing
+import os
+import queue
+import secrets
+import sys
+import time
+from collections import namedtuple
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+import pandas as pd
+
+from model.batch import validate_test
+from model.cache import content_hash
+from model.ipr import ipr_model, qo_model
+from model.nodal import operating_point, vlp_model
+
+# %%
+
+# Checkpointed fleet runs
+# A fleet (one row per well or per parameter set) is cut into shards of
+# shard_size consecutive rows. Every finished shard is written to the job
+# directory with an atomic rename, so a run that dies loses at most the shards
+# in progress: running the same job again computes only the missing shards.
+# job.json holds a hash of the fleet and the shard size; a directory cannot be
+# resumed with different inputs.
+#
+# Shards run in local processes (run_local) or on any number of hosts
+# (serve_job + work): the coordinator publishes the shards on a
+# multiprocessing manager queue, workers connect to it, and shards whose result
+# has not come back within `lease` seconds are handed out again. The queue
+# unpickles what it receives, so it listens on localhost by default and is
+# protected by a random key: anyone holding the key can run code on the
+# coordinator and the workers.
+
+FLEET_COLUMNS = ("q_test", "pwf_test", "pr", "pb", "thp", "api", "wc", "sg_h2o", "tvd", "md", "nvl", "id")
+
+Job = namedtuple("Job", "directory key shard_size shards")
+
+
+# Unit of work: IPR constants, AOF and operating point of every row of a shard
+def fleet_pipeline(shard: pd.DataFrame) -> pd.DataFrame:
+    """
+
+    :param shard: Rows with the FLEET_COLUMNS and optionally ef and c
+    :return: DataFrame with J, AOF, Qmax, the operating point and the status code of every row
+             (see model.batch.STATUS; flagged rows are NaN), same index as shard
+    """
+    v = {name: shard[name].to_numpy(dtype=float) for name in FLEET_COLUMNS}
+    ef = shard["ef"].to_numpy(dtype=float) if "ef" in shard else 1
+    c = shard["c"].to_numpy(dtype=float) if "c" in shard else 120
+    model = ipr_model(v["q_test"], v["pwf_test"], v["pr"], v["pb"], ef)
+    vlp = vlp_model(*(v[name] for name in FLEET_COLUMNS[4:]), c)
+    point = operating_point(lambda pwf: qo_model(model, pwf), v["pr"], vlp)
+    df = pd.DataFrame(index=shard.index)
+    df['J(bpd/psi)'] = model.j
+    df['AOF(bpd)'] = model.aof
+    df['Qmax(bpd)'] = model.qmax
+    df['q(bpd)'] = point.q
+    df['Pwf(psia)'] = point.pwf
+    status = validate_test(v["q_test"], v["pwf_test"], v["pr"], v["pb"], ef)
+    df.loc[status != 0] = np.nan
+    df['status'] = status
+    return df
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _shard_path(job: Job, k: int) -> str:
+    return os.path.join(job.directory, f"shard-{k:06d}.pkl")
+
+
+# %%
+
+def open_job(fleet: pd.DataFrame,
+             directory,
+             shard_size: int = 1000) -> Job:
+    """
+
+    :param fleet: Input rows
+    :param directory: Checkpoint directory (created if missing)
+    :param shard_size: Rows per shard
+    :return: Job
+    """
+    os.makedirs(directory, exist_ok=True)
+    key = content_hash(fleet, shard_size)
+    shards = -(-len(fleet) // shard_size)
+    manifest = os.path.join(directory, "job.json")
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            saved = json.load(f)
+        if saved["key"] != key:
+            raise ValueError(f"{directory} holds the checkpoints of a different fleet or shard size")
+    else:
+        def write(path):
+            with open(path, "w") as f:
+                json.dump({"key": key, "shard_size": shard_size, "shards": shards, "rows": len(fleet)}, f)
+        _atomic_write(manifest, write)
+    return Job(str(directory), key, shard_size, shards)
+
+
+def shard_rows(fleet: pd.DataFrame, job: Job, k: int) -> pd.DataFrame:
+    """
+
+    :return: Rows of shard k
+    """
+    return fleet.iloc[k * job.shard_size:(k + 1) * job.shard_size]
+
+
+def pending_shards(job: Job) -> list:
+    """
+
+    :return: Shards without a checkpoint
+    """
+    return [k for k in range(job.shards) if not os.path.exists(_shard_path(job, k))]
+
+
+def save_shard(job: Job, k: int, result: pd.DataFrame):
+    _atomic_write(_shard_path(job, k), result.to_pickle)
+
+
+def collect(job: Job) -> pd.DataFrame:
+    """
+
+    :return: Results of every shard, in fleet order
+    """
+    missing = pending_shards(job)
+    if missing:
+        raise RuntimeError(f"{len(missing)} of {job.shards} shards are not finished (first: {missing[0]})")
+    return pd.concat([pd.read_pickle(_shard_path(job, k)) for k in range(job.shards)])
+
+
+def _run_shard(task):
+    pipeline, k, rows = task
+    return k, pipeline(rows)
+
+
+# Local run on a process pool
+def run_local(fleet: pd.DataFrame,
+              directory,
+              shard_size: int = 1000,
+              processes: int = None,
+              pipeline=fleet_pipeline,
+              progress=None) -> pd.DataFrame:
+    """
+
+    :param fleet: Input rows
+    :param directory: Checkpoint directory; an interrupted run resumes from it
+    :param shard_size: Rows per shard
+    :param processes: Worker processes (None: one per CPU, 1: in this process)
+    :param pipeline: Module-level function shard DataFrame -> result DataFrame
+    :param progress: Called with (finished shards, total shards) after every shard
+    :return: Results of the whole fleet
+    """
+    job = open_job(fleet, directory, shard_size)
+    todo = pending_shards(job)
+    done = job.shards - len(todo)
+    tasks = ((pipeline, k, shard_rows(fleet, job, k)) for k in todo)
+    if processes == 1:
+        results = map(_run_shard, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_run_shard, tasks)
+    try:
+        for k, result in results:
+            save_shard(job, k, result)
+            done += 1
+            if progress is not None:
+                progress(done, job.shards)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return collect(job)
+
+
+# %%
+
+# Shared queues for several hosts
+_tasks = queue.Queue()
+_results = queue.Queue()
+
+
+def _task_queue():
+    return _tasks
+
+
+def _result_queue():
+    return _results
+
+
+class QueueManager(BaseManager):
+    pass
+
+
+QueueManager.register("tasks", callable=_task_queue)
+QueueManager.register("results", callable=_result_queue)
+
+
+def work(address,
+         authkey: bytes,
+         idle: float = 5.0) -> int:
+    """
+
+    Worker loop; on another host: PYNODAL_AUTHKEY=<hex key> python -m model.jobs worker HOST PORT
+
+    :param address: (host, port) of the coordinator
+    :param authkey: Key of the queue (see serve_job)
+    :param idle: Seconds without tasks after which the worker stops
+    :return: Shards computed
+    """
+    manager = QueueManager(address=tuple(address), authkey=authkey)
+    manager.connect()
+    tasks, results = manager.tasks(), manager.results()
+    count = 0
+    while True:
+        try:
+            pipeline, k, rows = tasks.get(timeout=idle)
+        except (queue.Empty, EOFError, ConnectionError):
+            return count
+        try:
+            results.put((k, pipeline(rows), None))
+        except (EOFError, ConnectionError):
+            return count
+        except Exception as error:
+            results.put((k, None, repr(error)))
+        count += 1
+
+
+def serve_job(fleet: pd.DataFrame,
+              directory,
+              shard_size: int = 1000,
+              address=("127.0.0.1", 50000),
+              authkey: bytes = None,
+              local_workers: int = 0,
+              lease: float = 600.0,
+              pipeline=fleet_pipeline,
+              progress=None) -> pd.DataFrame:
+    """
+
+    Coordinator: publishes the pending shards, checkpoints the results as they
+    arrive and re-issues shards whose worker did not answer within lease.
+
+    :param fleet: Input rows
+    :param directory: Checkpoint directory; an interrupted run resumes from it
+    :param shard_size: Rows per shard
+    :param address: (host, port) to listen on; port 0 picks a free port (local workers only). Listen on
+                    another interface only on a trusted network
+    :param authkey: Key of the queue; None: a random key, written in hex to <directory>/authkey (readable by
+                    the owner only) for the workers of other hosts
+    :param local_workers: Worker processes started on this host
+    :param lease: Seconds before an unanswered shard is handed out again
+    :param pipeline: Module-level function shard DataFrame -> result DataFrame (importable by the workers)
+    :param progress: Called with (finished shards, total shards) after every shard
+    :return: Results of the whole fleet
+    """
+    job = open_job(fleet, directory, shard_size)
+    issued = {k: None for k in pending_shards(job)}
+    done = job.shards - len(issued)
+    if authkey is None:
+        authkey = secrets.token_bytes(32)
+        fd = os.open(os.path.join(job.directory, "authkey"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(authkey.hex())
+    manager = QueueManager(address=tuple(address), authkey=authkey)
+    manager.start()
+    workers = []
+    try:
+        tasks, results = manager.tasks(), manager.results()
+        for k in issued:
+            tasks.put((pipeline, k, shard_rows(fleet, job, k)))
+            issued[k] = time.monotonic()
+        workers = [multiprocessing.Process(target=work, args=(manager.address, authkey), daemon=True)
+                   for _ in range(local_workers)]
+        for process in workers:
+            process.start()
+        while issued:
+            try:
+                k, result, error = results.get(timeout=min(1.0, lease))
+            except queue.Empty:
+                now = time.monotonic()
+                for k, started in issued.items():
+                    if now - started > lease:
+                        tasks.put((pipeline, k, shard_rows(fleet, job, k)))
+                        issued[k] = now
+                continue
+            if error is not None:
+                raise RuntimeError(f"shard {k} failed: {error}")
+            if k in issued:
+                save_shard(job, k, result)
+                del issued[k]
+                done += 1
+                if progress is not None:
+                    progress(done, job.shards)
+    finally:
+        for process in workers:
+            process.terminate()
+        manager.shutdown()
+    return collect(job)
+
+
+# Quicktest
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["worker"]:
+        if "PYNODAL_AUTHKEY" not in os.environ:
+            sys.exit("Set PYNODAL_AUTHKEY to the key in the authkey file of the job directory")
+        print("Shards computed:", work((sys.argv[2], int(sys.argv[3])), bytes.fromhex(os.environ["PYNODAL_AUTHKEY"])))
+        sys.exit()
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    n = 5000
+    fleet_test = pd.DataFrame({"q_test": rng.uniform(200, 900, n), "pwf_test": rng.uniform(1200, 2500, n),
+                               "pr": rng.uniform(2600, 3600, n), "pb": rng.uniform(1500, 2500, n),
+                               "thp": rng.uniform(100, 300, n), "api": 30, "wc": rng.uniform(0, 0.8, n),
+                               "sg_h2o": 1.0, "tvd": 6000, "md": 6500, "nvl": 0, "id": 2.5})
+    with tempfile.TemporaryDirectory() as directory:
+        local = run_local(fleet_test, os.path.join(directory, "local"), shard_size=500, processes=2)
+        queued = serve_job(fleet_test, os.path.join(directory, "queue"), shard_size=500,
+                           address=("127.0.0.1", 0), local_workers=2)
+        print(local.describe().loc[["mean", "max"]])
+        print("Queue and pool results equal:", local.equals(queued))
@@ -0,0 +1,150 @@
+# %%
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from model.ipr import IPRModel, ipr_model_from_j, qo_model
+from model.j import j_darcy
+from model.nodal import OperatingPoint, operating_point
+
+# %%
+
+# Commingled multilayer IPR
+# Every layer has its own J (j_darcy), pressure and bubble point. Layers are
+# the last axis of (wells, layers) arrays, wells with fewer layers are padded
+# with h = 0 layers (J = 0), so a well with 40 layers costs one array
+# expression over 40 columns, not 40 calls. At a datum pwf the pressure in
+# front of layer l is pwf + gradient * (depth_l - datum). A layer whose
+# pressure is below that receives fluid (crossflow): q_l = J_l * (pr_l - pwf_l)
+# < 0, the Darcy line continued above pr_l; with crossflow=False (check valves,
+# isolated completions) it gives 0 instead.
+
+MultilayerModel = namedtuple("MultilayerModel", "wells layers offset crossflow")
+
+LAYER_COLUMNS = ("well", "ko", "h", "bo", "uo", "re", "rw", "s", "pr", "pb")
+_PADDING = {"ko": 0.0, "h": 0.0, "bo": 1.0, "uo": 1.0, "re": 2.0, "rw": 1.0, "s": 0.0, "pr": 1.0, "pb": 0.0,
+            "depth": 0.0}
+
+
+def multilayer_model(layers: pd.DataFrame,
+                     flow_regime: str = "pseudocontinue",
+                     crossflow: bool = True,
+                     datum: float = None,
+                     gradient=None) -> MultilayerModel:
+    """
+
+    :param layers: One row per layer with the LAYER_COLUMNS and optionally depth
+    :param flow_regime: Flow regime of j_darcy
+    :param crossflow: Let the layers below the wellbore pressure take fluid
+    :param datum: Depth of the pwf reference (None: every layer sees pwf)
+    :param gradient: Wellbore fluid gradient (psi/ft) per well, with datum
+    :return: MultilayerModel, layer arrays of shape (wells, max layers per well)
+    """
+    if flow_regime not in ("pseudocontinue", "continuo"):
+        raise ValueError("flow_regime must be 'pseudocontinue' or 'continuo'")
+    codes, wells = pd.factorize(layers["well"])
+    position = layers.groupby(codes).cumcount().to_numpy()
+    shape = (len(wells), position.max() + 1)
+    present = np.zeros(shape, dtype=bool)
+    present[codes, position] = True
+    grid = {}
+    for name, fill in _PADDING.items():
+        values = np.full(shape, fill)
+        if name in layers:
+            values[codes, position] = layers[name].to_numpy(dtype=float)
+        grid[name] = values
+    # j_darcy is elementwise, the padding layers (h = 0) get J = 0
+    j_value = j_darcy(*(grid[name] for name in LAYER_COLUMNS[1:8]), flow_regime)
+    if datum is None:
+        offset = np.zeros(shape)
+    else:
+        offset = np.where(present, np.asarray(gradient, dtype=float).reshape(-1, 1) * (grid["depth"] - datum), 0.0)
+    return MultilayerModel(wells, ipr_model_from_j(j_value, grid["pr"], grid["pb"]), offset, crossflow)
+
+
+# %%
+
+# Rate of every layer at a datum pwf
+def layer_rates(model: MultilayerModel, pwf):
+    """
+
+    :param model: MultilayerModel
+    :param pwf: Datum flowing pressure per well (shape (wells,) or broadcastable, e.g. (points, wells))
+    :return: Layer rates, shape (..., wells, layers); negative for crossflow into a layer
+    """
+    layers = model.layers
+    pwf_layer = np.asarray(pwf, dtype=float)[..., None] + model.offset
+    inflow = qo_model(layers, np.minimum(pwf_layer, layers.pr))
+    backflow = layers.j * (layers.pr - pwf_layer) if model.crossflow else 0.0
+    return np.where(pwf_layer < layers.pr, inflow, backflow)
+
+
+def commingled_rate(model: MultilayerModel, pwf):
+    """
+
+    :param model: MultilayerModel
+    :param pwf: Datum flowing pressure per well
+    :return: Total rate of every well (the combined IPR)
+    """
+    return layer_rates(model, pwf).sum(axis=-1)
+
+
+def shut_in_pressure(model: MultilayerModel, iterations: int = 60):
+    """
+
+    :param model: MultilayerModel
+    :param iterations: Bisection steps
+    :return: Datum pressure of every well at which the commingled rate is zero
+    """
+    datum_pr = np.where(model.layers.j > 0, model.layers.pr - model.offset, np.nan)
+    lo, hi = np.nanmin(datum_pr, axis=-1), np.nanmax(datum_pr, axis=-1)
+    for _ in range(iterations):
+        mid = 0.5 * (lo + hi)
+        flowing = commingled_rate(model, mid) > 0
+        lo = np.where(flowing, mid, lo)
+        hi = np.where(flowing, hi, mid)
+    return 0.5 * (lo + hi)
+
+
+def multilayer_operating_point(model: MultilayerModel,
+                               vlp,
+                               iterations: int = 50) -> OperatingPoint:
+    """
+
+    :param model: MultilayerModel
+    :param vlp: VLP per well (datum at the VLP depth)
+    :param iterations: Bisection steps
+    :return: OperatingPoint of every well from the combined IPR
+    """
+    return operating_point(lambda pwf: commingled_rate(model, pwf), shut_in_pressure(model), vlp, iterations)
+
+
+def multilayer_curve(model: MultilayerModel,
+                     well: int = 0,
+                     points: int = 50) -> pd.DataFrame:
+    """
+
+    :param model: MultilayerModel
+    :param well: Row of the well
+    :param points: Pressures between 0 and the highest layer pressure
+    :return: DataFrame with Pwf, total rate and the rate of every layer
+    """
+    shape = model.offset.shape
+    layers = IPRModel(*(np.broadcast_to(field, shape)[well:well + 1] for field in model.layers))
+    single = model._replace(layers=layers, offset=model.offset[well:well + 1])
+    pwf = np.linspace(0, np.max(layers.pr - single.offset), points)
+    rates = layer_rates(single, pwf[:, None])[:, 0, :]
+    df = pd.DataFrame(rates, columns=[f"q{k + 1}(bpd)" for k in range(rates.shape[1])])
+    df.insert(0, 'Pwf(psia)', pwf)
+    df.insert(1, 'q(bpd)', rates.sum(axis=1))
+    return df
+
+
+# Quicktest
+layers_test = pd.DataFrame({"well": ["W-1", "W-1", "W-1", "W-2"], "ko": [100, 50, 200, 80], "h": [30, 20, 10, 40],
+                            "bo": 1.2, "uo": 1.5, "re": 1000, "rw": 0.3, "s": [0, 2, -1, 0],
+                            "pr": [3000, 2600, 1800, 2800], "pb": [2000, 2000, 2000, 1500]})
+multilayer_test = multilayer_model(layers_test)
+print("Layer rates at 2000 psia:", layer_rates(multilayer_test, [2000, 2000]))
+print("Shut-in pressure:", shut_in_pressure(multilayer_test))
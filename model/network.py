@@ -0,0 +1,198 @@
+# %%
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+from model.derivatives import f_darcy_derivatives, qo_derivatives
+from model.ipr import ipr_model, pwf_model, qo_model
+from model.nodal import vlp_model
+
+# %%
+
+# Gathering network
+# Every well flows through its tubing, a wellhead choke and a flowline into a
+# manifold; every manifold flows through a trunk line to the separator, whose
+# pressure is fixed. The rate of a well sets its pressure drops, the sum of the
+# rates of a manifold sets the trunk drop, so the wells of a manifold see each
+# other through the manifold pressure.
+#
+# Unknowns: the rate of every well and the pressure of every manifold.
+#   well i:      pwf_i(q_i) - [P_m + dP_choke + dP_line + g_i * (TVD - NVL) + g_i * f(q_i) * MD] = 0
+#   manifold m:  P_m - p_sep - g_m * (f(Q_m) * L + dz) = 0,   Q_m = sum of its well rates
+# pwf_i(q) is pwf_model (pwf_darcy above pb), friction terms are f_darcy with
+# the fluid gradient (gradient_avg), the choke is the liquid orifice equation
+#   q = 1022.7 * Cd * d^2 * sqrt(dP / sg)          (q bpd, d in, dP psi)
+# and g_m is the rate-weighted gradient of the mixed stream. Newton's method
+# solves all the equations together: the Jacobian has 2 entries per well row
+# and 1 + (wells of the manifold) per manifold row, stored in scipy.sparse.
+# Wells that cannot flow against their manifold pressure are held at q = 0.
+
+WELL_NETWORK_COLUMNS = ("q_test", "pwf_test", "pr", "pb", "api", "wc", "sg_h2o", "tvd", "md", "nvl", "id",
+                        "choke", "line_id", "line_length", "manifold")
+MANIFOLD_COLUMNS = ("trunk_id", "trunk_length")
+
+Network = namedtuple("Network", "wells manifolds model vlp sg choke cd line_id line_length line_dz line_c "
+                                "codes trunk_id trunk_length trunk_dz trunk_c p_sep")
+NetworkSolution = namedtuple("NetworkSolution", "q pwf thp p_manifold iterations converged")
+
+
+def network_model(wells: pd.DataFrame,
+                  manifolds: pd.DataFrame,
+                  p_sep: float,
+                  cd: float = 0.85) -> Network:
+    """
+
+    :param wells: One row per well with the WELL_NETWORK_COLUMNS (choke bean in inches), optionally ef, c, line_dz
+    :param manifolds: Indexed by manifold name with the MANIFOLD_COLUMNS, optionally trunk_dz, c
+    :param p_sep: Separator pressure (psia)
+    :param cd: Discharge coefficient of the chokes
+    :return: Network
+    """
+    v = lambda df, name, default: df[name].to_numpy(dtype=float) if name in df else np.full(len(df), default)
+    w = {name: wells[name].to_numpy(dtype=float) for name in WELL_NETWORK_COLUMNS[:-1]}
+    model = ipr_model(w["q_test"], w["pwf_test"], w["pr"], w["pb"], v(wells, "ef", 1.0))
+    vlp = vlp_model(0.0, w["api"], w["wc"], w["sg_h2o"], w["tvd"], w["md"], w["nvl"], w["id"], v(wells, "c", 120.0))
+    codes = pd.Index(manifolds.index).get_indexer(wells["manifold"])
+    if (codes < 0).any():
+        raise ValueError("every well must name a manifold of the manifolds table")
+    return Network(
+        wells=wells.index, manifolds=manifolds.index, model=model, vlp=vlp, sg=vlp.gradient / 0.433,
+        choke=w["choke"], cd=cd, line_id=w["line_id"], line_length=w["line_length"],
+        line_dz=v(wells, "line_dz", 0.0), line_c=v(wells, "c", 120.0), codes=codes,
+        trunk_id=manifolds["trunk_id"].to_numpy(dtype=float),
+        trunk_length=manifolds["trunk_length"].to_numpy(dtype=float),
+        trunk_dz=v(manifolds, "trunk_dz", 0.0), trunk_c=v(manifolds, "c", 120.0), p_sep=float(p_sep))
+
+
+def _well_terms(network: Network, q, p_manifold):
+    # Required bottom-hole pressure above the reservoir side, and its dq derivative
+    vlp, g = network.vlp, network.vlp.gradient
+    tubing = f_darcy_derivatives(q, vlp.id, vlp.c)
+    line = f_darcy_derivatives(q, network.line_id, network.line_c)
+    k = 1 / (1022.7 * network.cd * network.choke ** 2) ** 2
+    thp = p_manifold[network.codes] + network.sg * k * q ** 2 + g * (line.f * network.line_length + network.line_dz)
+    po = thp + g * (vlp.tvd - vlp.nvl + tubing.f * vlp.md)
+    d_po = 2 * network.sg * k * q + g * (line.d_q * network.line_length + tubing.d_q * vlp.md)
+    return thp, po, d_po
+
+
+def _trunk_terms(network: Network, q):
+    # Trunk pressure drop of every manifold and its derivative with respect to each well rate
+    m = len(network.manifolds)
+    total = np.bincount(network.codes, weights=q, minlength=m)
+    g_q = np.bincount(network.codes, weights=q * network.vlp.gradient, minlength=m)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g_mix = np.where(total > 0, g_q / total, np.bincount(network.codes, weights=network.vlp.gradient,
+                                                             minlength=m) / np.bincount(network.codes, minlength=m))
+    trunk = f_darcy_derivatives(total, network.trunk_id, network.trunk_c)
+    head = trunk.f * network.trunk_length + network.trunk_dz
+    dp = g_mix * head
+    # d(g_mix)/dq_i = (g_i - g_mix) / Q
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dg = np.where(total[network.codes] > 0,
+                      (network.vlp.gradient - g_mix[network.codes]) / total[network.codes], 0.0)
+    d_dp = g_mix[network.codes] * trunk.d_q[network.codes] * network.trunk_length[network.codes] + \
+        dg * head[network.codes]
+    return dp, d_dp
+
+
+def _residual(network: Network, q, p_manifold, shut):
+    _, po, _ = _well_terms(network, q, p_manifold)
+    r_well = np.where(shut, q, pwf_model(network.model, q) - po)
+    dp, _ = _trunk_terms(network, q)
+    return np.concatenate((r_well, p_manifold - network.p_sep - dp))
+
+
+# %%
+
+def solve_network(network: Network,
+                  warm: NetworkSolution = None,
+                  tol: float = 1e-6,
+                  iterations: int = 50) -> NetworkSolution:
+    """
+
+    :param network: Network
+    :param warm: Previous solution to start from (e.g. before a choke or THP change)
+    :param tol: Tolerance on the pressure residuals (psi)
+    :param iterations: Maximum Newton iterations
+    :return: NetworkSolution with q, pwf, thp per well and the manifold pressures; shut wells get q = 0, pwf = pr
+    """
+    n, m = len(network.wells), len(network.manifolds)
+    model = network.model
+    q_cap = 0.999 * qo_model(model, 0.0)  # rate at pwf = 0
+    dead = ~(q_cap > 0)  # no valid IPR (e.g. pwf_test >= pr)
+    q_cap = np.where(dead, 0.0, q_cap)
+    if warm is not None:
+        q, p = np.asarray(warm.q, dtype=float).copy(), np.asarray(warm.p_manifold, dtype=float).copy()
+    else:
+        q, p = 0.5 * q_cap, np.full(m, network.p_sep)
+    rows_well = np.arange(n)
+    shut = dead
+    converged = False
+    for k in range(1, iterations + 1):
+        # Wells that cannot flow even at q = 0 against the manifold pressure are held shut
+        _, po_0, _ = _well_terms(network, np.zeros(n), p)
+        shut = dead | (model.pr <= po_0)
+        q = np.where(shut, 0.0, q)
+        r = _residual(network, q, p, shut)
+        if np.max(np.abs(r)) < tol:
+            converged = True
+            break
+        _, _, d_po = _well_terms(network, q, p)
+        _, d_dp = _trunk_terms(network, q)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d_pwf = 1 / qo_derivatives(model, pwf_model(model, q)).d_pwf
+        diag = np.where(shut, 1.0, d_pwf - d_po)
+        jac = sparse.csr_matrix(
+            (np.concatenate((diag, np.where(shut, 0.0, -1.0), np.ones(m), -d_dp)),
+             (np.concatenate((rows_well, rows_well, n + np.arange(m), n + network.codes)),
+              np.concatenate((rows_well, n + network.codes, n + np.arange(m), rows_well)))),
+            shape=(n + m, n + m))
+        step = spsolve(jac, -r)
+        # Backtracking: halve the step until the residual norm decreases
+        norm, t = np.linalg.norm(r), 1.0
+        for _ in range(20):
+            q_new = np.clip(q + t * step[:n], 0.0, q_cap)
+            p_new = p + t * step[n:]
+            r_new = _residual(network, q_new, p_new, shut)
+            if np.linalg.norm(r_new) < norm:
+                break
+            t *= 0.5
+        q, p = q_new, p_new
+    thp, _, _ = _well_terms(network, q, p)
+    return NetworkSolution(q, np.where(shut, model.pr, pwf_model(model, q)), thp, p, k, converged)
+
+
+def network_table(network: Network, solution: NetworkSolution) -> pd.DataFrame:
+    """
+
+    :param network: Network
+    :param solution: NetworkSolution
+    :return: DataFrame per well with rate, Pwf, THP and manifold pressure
+    """
+    df = pd.DataFrame(index=network.wells)
+    df['q(bpd)'] = solution.q
+    df['Pwf(psia)'] = solution.pwf
+    df['THP(psia)'] = solution.thp
+    df['Manifold'] = network.manifolds[network.codes]
+    df['Pmanifold(psia)'] = solution.p_manifold[network.codes]
+    return df
+
+
+# Quicktest
+rng_test = np.random.default_rng(0)
+n_test = 300
+wells_test = pd.DataFrame({
+    "q_test": rng_test.uniform(300, 900, n_test), "pwf_test": rng_test.uniform(1500, 2500, n_test),
+    "pr": rng_test.uniform(2800, 3600, n_test), "pb": 2000.0, "api": 30, "wc": rng_test.uniform(0, 0.6, n_test),
+    "sg_h2o": 1.0, "tvd": 5000, "md": 5500, "nvl": 0, "id": 2.5, "choke": 48 / 64, "line_id": 3.0,
+    "line_length": rng_test.uniform(1000, 8000, n_test), "manifold": rng_test.choice(["M-1", "M-2", "M-3"], n_test)},
+    index=[f"W-{k}" for k in range(n_test)])
+manifolds_test = pd.DataFrame({"trunk_id": 10.0, "trunk_length": 20000.0}, index=["M-1", "M-2", "M-3"])
+network_test = network_model(wells_test, manifolds_test, p_sep=100)
+solution_test = solve_network(network_test)
+print("Network: iterations", solution_test.iterations, "manifold pressures", solution_test.p_manifold,
+      "total rate", solution_test.q.sum())
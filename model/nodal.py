@@ -0,0 +1,201 @@
+# %%
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from model.cache import cached, content_hash
+from model.ipr import as_float, ipr_model, j_array, qo_model
+from model.other import f_darcy, gradient_avg
+from model.pvt import PVTTable, gradient_pvt
+
+# %%
+
+# Vertical lift performance (VLP)
+# Same terms as the 'Nodal Analysis Plots' table in app.py:
+# Po = THP + gradient * (TVD - NVL) + gradient * f * MD
+
+VLP = namedtuple("VLP", "thp gradient tvd md nvl id c")
+OperatingPoint = namedtuple("OperatingPoint", "q pwf")
+
+
+def vlp_model(thp,
+              api,
+              wc,
+              sg_h2o,
+              tvd,
+              md,
+              nvl,
+              id,
+              c=120) -> VLP:
+    """
+
+    :param thp: Tubing head pressure
+    :param api: API gravity of oil
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :param tvd: True vertical depth
+    :param md: Measured depth
+    :param nvl: Fluid level
+    :param id: Pipe inner diameter
+    :param c: Roughness coefficient
+    :return: VLP with the constants of the lift curve
+    """
+    return VLP(thp, gradient_avg(api, wc, sg_h2o), tvd, md, nvl, id, c)
+
+
+def vlp_pressure(vlp: VLP, q):
+    """
+
+    :param vlp: VLP
+    :param q: Flow rate (broadcasts against the VLP fields)
+    :return: Required bottom-hole pressure Po(psia)
+    """
+    q = np.maximum(as_float(q), 0.0)
+    friction = vlp.gradient * f_darcy(q, vlp.id, vlp.c) * vlp.md
+    return vlp.thp + vlp.gradient * (vlp.tvd - vlp.nvl) + friction
+
+
+# Pressure traverse with pressure-dependent gradient from a PVT table
+def vlp_pressure_pvt(vlp: VLP,
+                     q,
+                     table: PVTTable,
+                     wc: float,
+                     sg_h2o: float,
+                     t_wh: float,
+                     t_bh: float,
+                     steps: int = 50):
+    """
+
+    Marches from THP down the well in equal steps of TVD and MD. The gradient of
+    every step is a table lookup (gradient_pvt), with a predictor-corrector step
+    so that the gradient is taken at the mid pressure of the step.
+
+    :param vlp: VLP (its constant gradient is not used)
+    :param q: Flow rate
+    :param table: PVTTable of the fluid
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :param t_wh: Wellhead temperature
+    :param t_bh: Bottom-hole temperature
+    :param steps: Number of depth steps
+    :return: Required bottom-hole pressure Po(psia)
+    """
+    q = np.maximum(np.asarray(q, dtype=float), 0.0)
+    dz = (vlp.tvd - vlp.nvl) / steps + f_darcy(q, vlp.id, vlp.c) * vlp.md / steps
+    p = np.broadcast_to(np.asarray(vlp.thp, dtype=float), np.broadcast(q, dz).shape)
+    for k in range(steps):
+        t = t_wh + (t_bh - t_wh) * (k + 0.5) / steps
+        p_mid = p + 0.5 * gradient_pvt(table, p, t, wc, sg_h2o) * dz
+        p = p + gradient_pvt(table, p_mid, t, wc, sg_h2o) * dz
+    return p
+
+
+# %%
+
+# Operating point: intersection of IPR and VLP
+def operating_point(rate,
+                    pr,
+                    vlp,
+                    iterations: int = 50) -> OperatingPoint:
+    """
+
+    Bisection on pwf in [0, pr], done on whole arrays at once: the residual
+    vlp_pressure(rate(pwf)) - pwf decreases with pwf, so every element
+    converges in the same fixed number of iterations.
+
+    :param rate: Function pwf -> q, e.g. lambda pwf: qo_model(model, pwf)
+    :param pr: Reservoir pressure (upper bracket)
+    :param vlp: VLP, or a function q -> Po such as a vlp_pressure_pvt partial
+    :param iterations: Number of bisection steps
+    :return: OperatingPoint(q, pwf); wells that cannot lift (Po(0) >= pr) get q = 0 and pwf = pr
+    """
+    pr = np.asarray(as_float(pr))
+    if callable(vlp):
+        lift, shape, dtype = vlp, pr.shape, pr.dtype
+    else:
+        lift, shape, dtype = partial(vlp_pressure, vlp), np.broadcast(pr, *vlp).shape, np.result_type(pr, *vlp)
+    lo = np.zeros(shape, dtype=dtype)
+    hi = np.broadcast_to(pr, shape).astype(dtype)
+    for _ in range(iterations):
+        mid = 0.5 * (lo + hi)
+        above = lift(rate(mid)) > mid
+        lo = np.where(above, mid, lo)
+        hi = np.where(above, hi, mid)
+    pwf = 0.5 * (lo + hi)
+    flowing = lift(np.zeros(shape, dtype=dtype)) < pr
+    q = np.where(flowing, rate(pwf), 0.0)
+    return OperatingPoint(q, np.where(flowing, pwf, pr))
+
+
+# %%
+
+# Table of the 'Nodal Analysis Plots' page, computed on whole columns
+NODAL_COLUMNS = ['q(bpd)', 'Pwf(psia)', 'THP(psia)', 'Pgravity(psia)', 'f', 'F(ft)',
+                 'Pf(psia)', 'Po(psia)', 'Psys(psia)']
+
+
+def nodal_table(q,
+                qt: float,
+                pwft: float,
+                pr: float,
+                pb: float,
+                thp: float,
+                api: float,
+                wc: float,
+                sg_h2o: float,
+                tvd: float,
+                md: float,
+                nvl: float,
+                id: float,
+                c: float = 120) -> pd.DataFrame:
+    """
+
+    :param q: Flow rates (e.g. the oil_rate column of the upload)
+    :param qt: Test flow rate
+    :param pwft: Flowing bottom pressure during test
+    :param pr: Reservoir pressure
+    :param pb: Bubble-point pressure
+    :param thp: Tubing head pressure
+    :param api: API gravity of oil
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :param tvd: True vertical depth
+    :param md: Measured depth
+    :param nvl: Fluid level
+    :param id: Pipe inner diameter
+    :param c: Roughness coefficient
+    :return: DataFrame with the NODAL_COLUMNS (IPR with pwf_darcy, VLP and system curve)
+    """
+    q = np.asarray(q, dtype=float)
+    gradient = gradient_avg(api, wc, sg_h2o)
+    df = pd.DataFrame(columns=NODAL_COLUMNS)
+    df[NODAL_COLUMNS[0]] = q
+    df[NODAL_COLUMNS[1]] = pr - q / j_array(qt, pwft, pr, pb)
+    df[NODAL_COLUMNS[2]] = thp
+    df[NODAL_COLUMNS[3]] = gradient * (tvd - nvl)
+    df[NODAL_COLUMNS[4]] = f_darcy(q, id, c)
+    df[NODAL_COLUMNS[5]] = df['f'] * md
+    df[NODAL_COLUMNS[6]] = gradient * df['F(ft)']
+    df[NODAL_COLUMNS[7]] = df['THP(psia)'] + df['Pgravity(psia)'] + df['Pf(psia)']
+    df[NODAL_COLUMNS[8]] = df['Po(psia)'] - df['Pwf(psia)']
+    return df
+
+
+# Nodal table shared by every session (and report) with the same rates and inputs
+def shared_nodal_table(q, nodal_inputs) -> pd.DataFrame:
+    """
+
+    :param q: Flow rates
+    :param nodal_inputs: (qt, pwft, pr, pb, thp, api, wc, sg_h2o, tvd, md, nvl, id, c), as in nodal_table
+    :return: nodal_table from the shared cache
+    """
+    return cached("nodal", content_hash(q, nodal_inputs), lambda: nodal_table(q, *nodal_inputs))
+
+
+# Quicktest
+ipr = ipr_model(500, 2500, 3000, 2800)
+vlp = vlp_model(thp=150, api=30, wc=0.2, sg_h2o=1.0, tvd=5000, md=5500, nvl=0, id=2.5)
+point = operating_point(lambda pwf: qo_model(ipr, pwf), ipr.pr, vlp)
+print("Operating point (q, pwf):", point.q, point.pwf)
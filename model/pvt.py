@@ -0,0 +1,195 @@
+# %%
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from model.j import j_darcy
+from model.other import sg_oil
+
+# %%
+
+# Black-oil PVT
+# Standing (Rs, Bo below pb), Vasquez-Beggs (Bo and viscosity above pb) and
+# Beggs-Robinson (viscosity below pb). Pressures in psia, temperatures in °F,
+# Rs in scf/bbl, Bo in bbl/STB, viscosity in cp and density in lbm/ft3.
+
+PVTTable = namedtuple("PVTTable", "api sg_gas pb p t rs bo uo rho_o")
+
+PVT_PROPERTIES = ("rs", "bo", "uo", "rho_o")
+
+
+# Solution gas-oil ratio (Standing), Rs is constant above pb
+def rs_standing(p, t, api: float, sg_gas: float, pb: float):
+    """
+
+    :param p: Pressure
+    :param t: Temperature
+    :param api: API gravity of oil
+    :param sg_gas: Specific gravity of gas
+    :param pb: Bubble-point pressure
+    :return: Solution gas-oil ratio
+    """
+    p = np.minimum(p, pb)
+    return sg_gas * ((p / 18.2 + 1.4) * 10 ** (0.0125 * api - 0.00091 * t)) ** 1.2048
+
+
+# Oil formation volume factor (Standing below pb, Vasquez-Beggs compressibility above)
+def bo_standing(p, t, api: float, sg_gas: float, pb: float):
+    """
+
+    :param p: Pressure
+    :param t: Temperature
+    :param api: API gravity of oil
+    :param sg_gas: Specific gravity of gas
+    :param pb: Bubble-point pressure
+    :return: Oil formation volume factor
+    """
+    rs = rs_standing(p, t, api, sg_gas, pb)
+    bo = 0.9759 + 0.000120 * (rs * (sg_gas / sg_oil(api)) ** 0.5 + 1.25 * t) ** 1.2
+    a = 1e-5 * (-1433 + 5 * rs + 17.2 * t - 1180 * sg_gas + 12.61 * api)
+    return np.where(p > pb, bo * (np.maximum(p, pb) / pb) ** -a, bo)
+
+
+# Oil viscosity (Beggs-Robinson below pb, Vasquez-Beggs above)
+def uo_beggs_robinson(p, t, api: float, sg_gas: float, pb: float):
+    """
+
+    :param p: Pressure
+    :param t: Temperature
+    :param api: API gravity of oil
+    :param sg_gas: Specific gravity of gas
+    :param pb: Bubble-point pressure
+    :return: Oil viscosity
+    """
+    rs = rs_standing(p, t, api, sg_gas, pb)
+    uod = 10 ** (t ** -1.163 * np.exp(6.9824 - 0.04658 * api)) - 1
+    uo = 10.715 * (rs + 100) ** -0.515 * uod ** (5.44 * (rs + 150) ** -0.338)
+    m = 2.6 * p ** 1.187 * np.exp(-11.513 - 8.98e-5 * p)
+    return np.where(p > pb, uo * (np.maximum(p, pb) / pb) ** m, uo)
+
+
+# Oil density with dissolved gas
+def rho_oil(p, t, api: float, sg_gas: float, pb: float):
+    """
+
+    :param p: Pressure
+    :param t: Temperature
+    :param api: API gravity of oil
+    :param sg_gas: Specific gravity of gas
+    :param pb: Bubble-point pressure
+    :return: Oil density
+    """
+    rs = rs_standing(p, t, api, sg_gas, pb)
+    return (62.4 * sg_oil(api) + 0.0136 * rs * sg_gas) / bo_standing(p, t, api, sg_gas, pb)
+
+
+# %%
+
+# Property tables, built once per fluid
+@lru_cache(maxsize=32)
+def pvt_table(api: float,
+              sg_gas: float,
+              pb: float,
+              p_max: float = 6000,
+              t_min: float = 60,
+              t_max: float = 300,
+              n_p: int = 200,
+              n_t: int = 25) -> PVTTable:
+    """
+
+    The pressure grid always contains pb, so the kink of every property at the
+    bubble point falls on a node and is not smeared by the interpolation.
+    The returned arrays are read-only because the table is shared by the cache.
+
+    :param api: API gravity of oil
+    :param sg_gas: Specific gravity of gas
+    :param pb: Bubble-point pressure
+    :param p_max: Highest pressure of the grid
+    :param t_min: Lowest temperature of the grid
+    :param t_max: Highest temperature of the grid
+    :param n_p: Number of pressure nodes
+    :param n_t: Number of temperature nodes
+    :return: PVTTable with Rs, Bo, uo and rho_o on the (p, t) grid
+    """
+    p = np.union1d(np.linspace(14.7, max(p_max, pb), n_p), [pb])
+    t = np.linspace(t_min, t_max, n_t)
+    pp, tt = np.meshgrid(p, t, indexing="ij")
+    values = [f(pp, tt, api, sg_gas, pb) for f in (rs_standing, bo_standing, uo_beggs_robinson, rho_oil)]
+    for array in [p, t] + values:
+        array.setflags(write=False)
+    return PVTTable(api, sg_gas, pb, p, t, *values)
+
+
+# Bilinear interpolation in a PVT table
+def pvt_lookup(table: PVTTable, prop: str, p, t):
+    """
+
+    :param table: PVTTable
+    :param prop: One of PVT_PROPERTIES
+    :param p: Pressure (array)
+    :param t: Temperature (array, broadcasts against p)
+    :return: Interpolated property, clamped to the edges of the grid
+    """
+    p, t = np.broadcast_arrays(np.asarray(p, dtype=float), np.asarray(t, dtype=float))
+    values = getattr(table, prop)
+    i = np.clip(np.searchsorted(table.p, p) - 1, 0, len(table.p) - 2)
+    k = np.clip(np.searchsorted(table.t, t) - 1, 0, len(table.t) - 2)
+    u = np.clip((p - table.p[i]) / (table.p[i + 1] - table.p[i]), 0, 1)
+    v = np.clip((t - table.t[k]) / (table.t[k + 1] - table.t[k]), 0, 1)
+    return ((1 - u) * (1 - v) * values[i, k] + u * (1 - v) * values[i + 1, k] +
+            (1 - u) * v * values[i, k + 1] + u * v * values[i + 1, k + 1])
+
+
+# Pressure-dependent average gradient (psi/ft), the PVT version of gradient_avg
+def gradient_pvt(table: PVTTable,
+                 p,
+                 t,
+                 wc: float,
+                 sg_h2o: float):
+    """
+
+    :param table: PVTTable
+    :param p: Pressure
+    :param t: Temperature
+    :param wc: Fraction of water in the fluid
+    :param sg_h2o: Specific gravity of water
+    :return: Average gradient
+    """
+    return wc * sg_h2o * 0.433 + (1 - wc) * pvt_lookup(table, "rho_o", p, t) / 144
+
+
+# Productivity Index using Darcy's Law with Bo and uo from the table
+def j_darcy_pvt(ko: float,
+                h: float,
+                re: float,
+                rw: float,
+                s: float,
+                table: PVTTable,
+                p,
+                t,
+                flow_regime: str = "pseudocontinue"):
+    """
+
+    :param ko: Oil permeability
+    :param h: Thickness of sand
+    :param re: Drainage radius
+    :param rw: Well radius
+    :param s: Skin
+    :param table: PVTTable
+    :param p: Pressure at which Bo and uo are evaluated (e.g. average reservoir pressure)
+    :param t: Reservoir temperature
+    :param flow_regime: flow regime
+    :return: Productivity Index (IP) of Darcy
+    """
+    bo = pvt_lookup(table, "bo", p, t)
+    uo = pvt_lookup(table, "uo", p, t)
+    return j_darcy(ko, h, bo, uo, re, rw, s, flow_regime)
+
+
+# Quicktest
+table = pvt_table(30, 0.75, 2000)
+p_test = np.array([500, 1000, 2000, 3000])
+print("Bo:", pvt_lookup(table, "bo", p_test, 180))
+print("Oil density (lbm/ft3):", pvt_lookup(table, "rho_o", p_test, 180))
+print("Average gradient (psi/ft):", gradient_pvt(table, p_test, 180, 0.2, 1.0))
@@ -0,0 +1,183 @@
+# %%
+import numpy as np
+import pandas as pd
+
+# %%
+
+# Multi-rate well-test regression
+# j() in model/j.py takes one test point. Here every well is fitted to all its
+# test points at once and all the wells of the fleet in the same array
+# operations: the normal equations of every well are per-well sums
+# (np.bincount over the well codes), solved in closed form. Points whose
+# residual is more than outlier_k robust standard deviations (1.4826 * median
+# absolute residual of the well) are dropped and the fit repeated.
+#
+# Models (x = pwf / pb, y = 1 - pwf / pr):
+#   darcy      q = J * (pr - pwf)
+#   composite  q = J * (pr - pwf)                                    pwf >= pb
+#              q = J * ((pr - pb) + pb / 1.8 * (1 - 0.2x - 0.8x^2))    pwf < pb
+#   vogel      q = qmax * (1 - 0.2 (pwf/pr) - 0.8 (pwf/pr)^2)
+#   standing   q = qmax * (1.8 ef y - 0.8 ef^2 y^2)
+# With fit_pr=True pr is fitted too (darcy and composite are linear in pr,
+# vogel uses batched Gauss-Newton); standing needs a known pr.
+
+METHODS = ("darcy", "composite", "vogel", "standing")
+
+
+def _sum(codes, values, n):
+    return np.bincount(codes, weights=values, minlength=n)
+
+
+def _group_median(codes, values, n):
+    # Median of values per group (NaN for empty groups)
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=n)
+    start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_values = values[order]
+    safe = np.maximum(counts, 1)
+    lo = sorted_values[np.minimum(start + (safe - 1) // 2, len(values) - 1)]
+    hi = sorted_values[np.minimum(start + safe // 2, len(values) - 1)]
+    return np.where(counts > 0, 0.5 * (lo + hi), np.nan)
+
+
+def _solve2(codes, w, f1, f2, q, n):
+    # Per-well weighted least squares q ~ p1 * f1 + p2 * f2
+    a11, a12, a22 = _sum(codes, w * f1 * f1, n), _sum(codes, w * f1 * f2, n), _sum(codes, w * f2 * f2, n)
+    b1, b2 = _sum(codes, w * f1 * q, n), _sum(codes, w * f2 * q, n)
+    det = a11 * a22 - a12 ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (a22 * b1 - a12 * b2) / det, (a11 * b2 - a12 * b1) / det
+
+
+def _composite_shape(pwf, pb):
+    # h(pwf) such that the composite IPR is q = J * pr - J * h
+    x = pwf / pb
+    return np.where(pwf >= pb, pwf, pb - pb / 1.8 * (1 - 0.2 * x - 0.8 * x ** 2))
+
+
+def _fit(method, fit_pr, codes, w, q, pwf, pr, pb, n, iterations):
+    # Returns per-well parameters and the per-point prediction
+    if method in ("darcy", "composite"):
+        h = pwf if method == "darcy" else _composite_shape(pwf, pb[codes])
+        if fit_pr:
+            a, b = _solve2(codes, w, np.ones_like(h), -h, q, n)
+            j_value, pr_fit = b, a / b
+        else:
+            g = pr[codes] - h
+            with np.errstate(divide="ignore", invalid="ignore"):
+                j_value = _sum(codes, w * g * q, n) / _sum(codes, w * g * g, n)
+            pr_fit = pr
+        predicted = j_value[codes] * (pr_fit[codes] - h)
+        return {"J": j_value, "pr": pr_fit}, predicted
+    if method == "standing":
+        y = 1 - pwf / pr[codes]
+        a, b = _solve2(codes, w, y, y * y, q, n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ef = -2.25 * b / a
+            qmax = a / (1.8 * ef)
+        return {"qmax": qmax, "ef": ef, "pr": pr}, a[codes] * y + b[codes] * y * y
+    # vogel
+    pr_fit = pr.copy()
+    if fit_pr:
+        # Start from the straight line through the points, above the highest pwf
+        a, b = _solve2(codes, w, np.ones_like(pwf), pwf, q, n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            start = -a / b
+        pwf_max = np.full(n, -np.inf)
+        np.maximum.at(pwf_max, codes, pwf)
+        pr_fit = np.where(np.isfinite(start) & (start > pwf_max), start, 1.2 * pwf_max)
+    for _ in range(iterations if fit_pr else 1):
+        r = pwf / pr_fit[codes]
+        v = 1 - 0.2 * r - 0.8 * r ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            qmax = _sum(codes, w * v * q, n) / _sum(codes, w * v * v, n)
+        if not fit_pr:
+            break
+        # Gauss-Newton step on (qmax, pr) for every well at once; qmax is
+        # re-solved exactly for the new pr at the top of the loop
+        dq_dpr = qmax[codes] * (0.2 * r + 1.6 * r ** 2) / pr_fit[codes]
+        residual = q - qmax[codes] * v
+        _, d_pr = _solve2(codes, w, v, dq_dpr, residual, n)
+        pr_fit = np.where(np.isfinite(d_pr), np.clip(pr_fit + d_pr, 0.5 * pr_fit, 2 * pr_fit), pr_fit)
+    r = pwf / pr_fit[codes]
+    return {"qmax": qmax, "pr": pr_fit}, qmax[codes] * (1 - 0.2 * r - 0.8 * r ** 2)
+
+
+# %%
+
+def fit_tests(tests: pd.DataFrame,
+              wells: pd.DataFrame = None,
+              method: str = "composite",
+              fit_pr: bool = False,
+              outlier_k: float = 3.0,
+              passes: int = 3,
+              min_points: int = 3,
+              iterations: int = 20) -> pd.DataFrame:
+    """
+
+    :param tests: One row per test point with columns well, q, pwf and optionally weight
+    :param wells: Indexed by well with pr (and pb for composite); pr may be omitted with fit_pr=True
+    :param method: One of METHODS
+    :param fit_pr: Fit the reservoir pressure too
+    :param outlier_k: Rejection threshold in robust standard deviations (None to keep every point)
+    :param passes: Fit / reject rounds
+    :param min_points: Wells with fewer accepted points keep all their points
+    :param iterations: Gauss-Newton iterations (vogel with fit_pr)
+    :return: DataFrame indexed by well with the fitted parameters, J, qmax, points used and rmse
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    if method == "standing" and fit_pr:
+        raise ValueError("standing needs a known pr")
+    codes, names = pd.factorize(tests["well"])
+    n = len(names)
+    q = tests["q"].to_numpy(dtype=float)
+    pwf = tests["pwf"].to_numpy(dtype=float)
+    weight = tests["weight"].to_numpy(dtype=float) if "weight" in tests else np.ones_like(q)
+    wells = pd.DataFrame(index=names) if wells is None else wells.reindex(names)
+    pr = wells["pr"].to_numpy(dtype=float) if "pr" in wells else np.full(n, np.nan)
+    pb = wells["pb"].to_numpy(dtype=float) if "pb" in wells else np.full(n, np.nan)
+
+    active = np.ones(len(q), dtype=bool)
+    for k in range(passes if outlier_k is not None else 1):
+        params, predicted = _fit(method, fit_pr, codes, weight * active, q, pwf, pr, pb, n, iterations)
+        if outlier_k is None or k == passes - 1:
+            break
+        residual = np.abs(q - predicted)
+        scale = 1.4826 * _group_median(codes[active], residual[active], n)
+        keep = residual <= outlier_k * np.maximum(scale[codes], 1e-12)
+        enough = _sum(codes, keep.astype(float), n) >= min_points
+        new_active = np.where(enough[codes], keep, True)
+        if np.array_equal(new_active, active):
+            break
+        active = new_active
+
+    used = _sum(codes, active.astype(float), n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rmse = np.sqrt(_sum(codes, active * (q - predicted) ** 2, n) / used)
+    df = pd.DataFrame(index=pd.Index(names, name="well"))
+    df['points'] = np.bincount(codes, minlength=n)
+    df['used'] = used.astype(int)
+    df['pr'] = params["pr"]
+    if "J" in params:
+        df['J'] = params["J"]
+        qmax = params["J"] * params["pr"] if method == "darcy" else \
+            np.where(params["pr"] > pb, params["J"] * (params["pr"] - pb) + params["J"] * pb / 1.8,
+                     params["J"] * params["pr"] / 1.8)
+        df['qmax'] = qmax
+    else:
+        df['qmax'] = params["qmax"]
+        df['J'] = 1.8 * params["qmax"] / params["pr"]
+    if "ef" in params:
+        df['ef'] = params["ef"]
+    df['rmse'] = rmse
+    return df
+
+
+# Quicktest
+rng = np.random.default_rng(0)
+pwf_points = np.tile(np.linspace(1000, 2800, 8), 2)
+q_points = np.concatenate([2.0 * (3000 - pwf_points[:8]), 1.5 * (3200 - pwf_points[8:])]) + rng.normal(0, 5, 16)
+q_points[3] += 400  # bad reading
+tests_test = pd.DataFrame({"well": ["W-1"] * 8 + ["W-2"] * 8, "q": q_points, "pwf": pwf_points})
+print(fit_tests(tests_test, method="darcy", fit_pr=True))
@@ -0,0 +1,252 @@
+# %%
+import html
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.image import imread
+
+from model.batch import batch_qo, describe
+from model.cache import content_hash
+from model.graphics import IPR_METHODS, ipr_png, nodal_figure, render_figure
+from model.jobs import FLEET_COLUMNS, fleet_pipeline
+from model.nodal import shared_nodal_table
+
+# %%
+
+# Well reports
+# For a list of wells the report gives the potential (J, AOF, Qmax and qo at a
+# chosen pwf), the IPR curve of the three methods of IPR_curve_methods, the
+# nodal table with its chart and the operating point. The numbers of the whole
+# list come from one vectorized fleet_pipeline call; the well sections (images
+# and tables) are built on a thread pool and their figures drawn in the
+# rendering pool of model.graphics. Images share the in-memory cache with the
+# app pages and are also kept in the report directory under a hash of their
+# inputs, so the next month's report redraws only the wells that changed.
+#
+# Output: index.html (summary of every well), wells/<well>.html (one page per
+# well), img/*.png and, with pdf=True, pdf/<well>-<hash>.pdf (one A4 page per
+# well).
+
+_STYLE = """
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; font-size: 0.85em; }
+td, th { border: 1px solid #ccc; padding: 2px 6px; text-align: right; }
+img { max-width: 48%; margin: 4px; }
+.error { color: #b00; }
+"""
+
+_SUMMARY_COLUMNS = ['J(bpd/psi)', 'AOF(bpd)', 'Qmax(bpd)', 'qo(bpd)', 'q(bpd)', 'Pwf(psia)']
+
+
+def _slug(well) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(well))
+
+
+def _page(title: str, body: str) -> str:
+    return (f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+            f"<style>{_STYLE}</style></head>\n<body>\n<h1>{html.escape(title)}</h1>\n{body}\n</body></html>\n")
+
+
+def _write(path, data):
+    # Atomic, so an interrupted report never leaves half an image behind. The temporary name is per thread:
+    # two sections can write the same image at once
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data.encode() if isinstance(data, str) else data)
+    os.replace(tmp, path)
+
+
+def _kept(directory, folder: str, name: str, draw) -> str:
+    # File kept in the report directory under a hash of its inputs
+    path = os.path.join(directory, folder, name)
+    if not os.path.exists(path):
+        _write(path, draw())
+    return f"{folder}/{name}"
+
+
+def _pdf_page(well, values: dict, images: list, nodal: pd.DataFrame):
+    # One A4 page: potential and operating point, the curves, the first rows of the nodal table
+    fig = Figure(figsize=(8.27, 11.69))
+    fig.suptitle(f"Well {well}")
+    grid = fig.add_gridspec(4, 2, height_ratios=(1, 2, 2, 1.5))
+    ax = fig.add_subplot(grid[0, :])
+    ax.axis("off")
+    ax.table(cellText=[[label, text] for label, text in values.items()], loc="center")
+    for k, png in enumerate(images[:4]):
+        ax = fig.add_subplot(grid[1 + k // 2, k % 2])
+        ax.imshow(imread(io.BytesIO(png), format="png"))
+        ax.axis("off")
+    if nodal is not None:
+        ax = fig.add_subplot(grid[3, :])
+        ax.axis("off")
+        head = nodal.head(8).round(2)
+        ax.table(cellText=head.to_numpy().tolist(), colLabels=list(head.columns), loc="center")
+    return fig
+
+
+def well_section(directory,
+                 well,
+                 inputs: dict,
+                 result: dict,
+                 rates=None,
+                 pwf=None,
+                 pdf: bool = False) -> dict:
+    """
+
+    :param directory: Report directory
+    :param well: Well name
+    :param inputs: FLEET_COLUMNS (and c) of the well
+    :param result: fleet_pipeline row of the well (and qo)
+    :param rates: Rates of the nodal table (None: 20 rates from 0 to Qmax)
+    :param pwf: Pressures of the IPR curves (None: 20 pressures from pr to 0)
+    :param pdf: Also write the PDF page of the well
+    :return: well, files of the section and of the PDF page, errors met (a failed figure does not stop the report)
+    """
+    errors = []
+    images = []
+    pngs = []
+    pwf = np.linspace(inputs["pr"], 0, 20) if pwf is None else np.asarray(pwf, dtype=float)
+    ipr_inputs = (inputs["q_test"], inputs["pwf_test"], inputs["pr"], inputs["pb"])
+    for method in IPR_METHODS:
+        try:
+            name = f"ipr-{content_hash(pwf, ipr_inputs, method)}.png"
+            images.append((f"IPR {method}", _kept(directory, "img", name, lambda: ipr_png(pwf, *ipr_inputs, method))))
+        except Exception as error:
+            errors.append(f"IPR {method}: {error!r}")
+
+    nodal = None
+    if rates is None and np.isfinite(result["Qmax(bpd)"]):
+        rates = np.linspace(0, result["Qmax(bpd)"], 20)
+    if rates is not None:
+        nodal_inputs = tuple(float(inputs[name]) for name in FLEET_COLUMNS) + (float(inputs.get("c", 120)),)
+        rates = np.asarray(rates, dtype=float)
+        try:
+            nodal = shared_nodal_table(rates, nodal_inputs)
+            name = f"nodal-{content_hash(rates, nodal_inputs)}.png"
+            images.append(("Nodal analysis", _kept(directory, "img", name,
+                                                   lambda: render_figure(nodal_figure, nodal).result())))
+        except Exception as error:
+            errors.append(f"Nodal table: {error!r}")
+
+    values = {name: f"{result[name]:.2f}" for name in _SUMMARY_COLUMNS if name in result}
+    values["Status"] = result.get("status text") or "ok"
+    rows = "".join(f"<tr><th>{html.escape(label)}</th><td>{html.escape(text)}</td></tr>" for label, text in
+                   values.items())
+    body = ["<p><a href='../index.html'>Back to the summary</a></p>", "<h2>Potential and operating point</h2>",
+            f"<table>{rows}</table>", "<h2>Curves</h2>"]
+    body += [f"<img src='../{src}' alt='{html.escape(alt)}' title='{html.escape(alt)}'>" for alt, src in images]
+    if nodal is not None:
+        body += ["<h2>Nodal table</h2>", nodal.to_html(index=False, float_format=lambda x: f"{x:.2f}")]
+    body += [f"<p class='error'>{html.escape(error)}</p>" for error in errors]
+    section = os.path.join("wells", f"{_slug(well)}.html")
+    _write(os.path.join(directory, section), _page(f"Well {well}", "\n".join(body)))
+
+    document = None
+    if pdf:
+        for _, src in images:
+            with open(os.path.join(directory, src), "rb") as f:
+                pngs.append(f.read())
+        key = content_hash(str(well), sorted(values.items()), pngs, nodal if nodal is not None else b"")
+        try:
+            document = _kept(directory, "pdf", f"{_slug(well)}-{key}.pdf",
+                             lambda: render_figure(_pdf_page, well, values, pngs, nodal, fmt="pdf").result())
+        except Exception as error:
+            errors.append(f"PDF: {error!r}")
+    return {"well": well, "section": section, "pdf": document, "errors": errors}
+
+
+# %%
+
+def build_report(fleet: pd.DataFrame,
+                 directory,
+                 history: pd.DataFrame = None,
+                 pwf: pd.DataFrame = None,
+                 workers: int = 8,
+                 pdf: bool = False,
+                 title: str = "Well report",
+                 progress=None) -> pd.DataFrame:
+    """
+
+    :param fleet: One row per well: well, the FLEET_COLUMNS, optionally ef, ef2, c and pwf (pressure of qo)
+    :param directory: Output directory (created if missing; images already there are reused)
+    :param history: Long table with well and oil_rate: the rates of the nodal tables (optional)
+    :param pwf: Long table with well and pwf: the pressures of the IPR curves (optional)
+    :param workers: Well sections built at once
+    :param pdf: Also write one PDF page per well
+    :param title: Title of the report
+    :param progress: Called with (finished wells, total wells) after every well
+    :return: Summary of every well (also in index.html)
+    """
+    for name in ("wells", "img", "pdf"):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    results = fleet_pipeline(fleet)
+    if "pwf" in fleet:
+        ef2 = fleet["ef2"].to_numpy(dtype=float) if "ef2" in fleet else None
+        qo_values = batch_qo(fleet["q_test"], fleet["pwf_test"], fleet["pr"], fleet["pwf"], fleet["pb"],
+                             fleet["ef"] if "ef" in fleet else 1, ef2)
+        # Same value as model.q.qo (the Calculations page); a qo that cannot be computed flags the well
+        results.insert(3, 'qo(bpd)', qo_values.values)
+        results["status"] = results["status"].to_numpy() | qo_values.status
+    results["status text"] = describe(results["status"].to_numpy())
+    rates = {} if history is None else {well: rows["oil_rate"].to_numpy() for well, rows in history.groupby("well")}
+    pressures = {} if pwf is None else {well: rows["pwf"].to_numpy() for well, rows in pwf.groupby("well")}
+
+    inputs = fleet.to_dict(orient="records")
+    outputs = results.to_dict(orient="records")
+    started = time.perf_counter()
+    sections = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(well_section, directory, row["well"], row, result, rates.get(row["well"]),
+                               pressures.get(row["well"]), pdf) for row, result in zip(inputs, outputs)]
+        for future in futures:
+            sections.append(future.result())
+            if progress is not None:
+                progress(len(sections), len(futures))
+
+    summary = results.drop(columns="status")
+    summary.insert(0, "well", fleet["well"].to_numpy())
+    summary["errors"] = ["; ".join(section["errors"]) for section in sections]
+    links = summary.copy()
+    links["well"] = [f"<a href='{section['section']}'>{html.escape(str(section['well']))}</a>"
+                     + (f" (<a href='{section['pdf']}'>pdf</a>)" if section["pdf"] else "")
+                     for section in sections]
+    body = (f"<p>{len(fleet)} wells, {int((results['status'] == 0).sum())} without flags, built in "
+            f"{time.perf_counter() - started:.1f} s on {time.strftime('%Y-%m-%d %H:%M')}.</p>\n"
+            + links.to_html(index=False, escape=False, float_format=lambda x: f"{x:.2f}", na_rep=""))
+    _write(os.path.join(directory, "index.html"), _page(title, body))
+    return summary
+
+
+# Quicktest; with arguments: python -m model.report fleet.csv DIRECTORY [history.csv] (e.g. model.synthetic files)
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    from model.synthetic import production_history, synthetic_fleet
+    from model.units import normalize
+
+    if len(sys.argv) > 2:
+        history_file = normalize(pd.read_csv(sys.argv[3])) if len(sys.argv) > 3 else None
+        summary_file = build_report(normalize(pd.read_csv(sys.argv[1])), sys.argv[2], history_file, pdf=True,
+                                    progress=lambda done, total: print(f"\r{done}/{total}", end=""))
+        print(f"\n{os.path.join(sys.argv[2], 'index.html')}:",
+              f"{int((summary_file['errors'] != '').sum())} wells with errors")
+        sys.exit()
+    fleet_test = synthetic_fleet(12)
+    fleet_test["pwf"] = 0.5 * fleet_test["pwf_test"]
+    history_test = production_history(fleet_test, 30)
+    with tempfile.TemporaryDirectory() as directory_test:
+        for run in ("first", "second"):
+            started_test = time.perf_counter()
+            summary_test = build_report(fleet_test, directory_test, history_test, pdf=True)
+            print(f"{run} run: {len(fleet_test)} wells in {time.perf_counter() - started_test:.1f} s,",
+                  f"{len(os.listdir(os.path.join(directory_test, 'img')))} images,",
+                  f"{int((summary_test['errors'] != '').sum())} wells with errors")
+        print(summary_test.head())
@@ -0,0 +1,242 @@
+# %%
+import asyncio
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from model.ipr import ipr_model_from_j, qo_model
+from model.nodal import operating_point, vlp_model
+
+# %%
+
+# Live telemetry
+# Samples "well,time,thp,q,pwf" arrive from a local socket or from a file that
+# keeps growing. Every well has a fixed-size ring buffer of its last samples
+# and the running sums of a least-squares line q = a + b * pwf over that
+# window, so a new sample costs O(1): add it, subtract the one it overwrites.
+# The productivity index is j = -b and the reservoir pressure pr = -a / b
+# (pwf_darcy solved for the test line). A refresh solves the operating point
+# of every well that received samples since the last refresh in a single
+# operating_point call, with the VLP (gradient_avg, f_darcy) at the last THP.
+
+STATIC_COLUMNS = ("pb", "api", "wc", "sg_h2o", "tvd", "md", "nvl", "id", "c")
+
+StreamState = namedtuple("StreamState", "index wells capacity t thp q pwf head count inserts sums dirty "
+                                        "j pr q_op pwf_op")
+
+Sample = namedtuple("Sample", "well t thp q pwf")
+
+
+def new_stream_state(wells: pd.DataFrame,
+                     capacity: int = 256) -> StreamState:
+    """
+
+    :param wells: One row per well, indexed by well name, with the STATIC_COLUMNS
+    :param capacity: Samples kept per well
+    :return: StreamState
+    """
+    n = len(wells)
+    buffer = lambda: np.full((n, capacity), np.nan)
+    nan = lambda: np.full(n, np.nan)
+    return StreamState(
+        index={name: i for i, name in enumerate(wells.index)},
+        wells=wells.loc[:, list(STATIC_COLUMNS)].astype(float),
+        capacity=capacity,
+        t=buffer(), thp=buffer(), q=buffer(), pwf=buffer(),
+        head=np.zeros(n, dtype=int), count=np.zeros(n, dtype=int), inserts=np.zeros(n, dtype=int),
+        sums=np.zeros((n, 5)),  # n, sum(pwf), sum(q), sum(pwf^2), sum(pwf*q)
+        dirty=np.zeros(n, dtype=bool),
+        j=nan(), pr=nan(), q_op=nan(), pwf_op=nan())
+
+
+def _terms(pwf, q):
+    return np.array([1.0, pwf, q, pwf * pwf, pwf * q])
+
+
+def ingest(state: StreamState, sample: Sample):
+    """
+
+    :param state: StreamState
+    :param sample: New sample of a registered well (unknown wells are ignored)
+    """
+    i = state.index.get(sample.well)
+    if i is None:
+        return
+    k = state.head[i]
+    if state.count[i] == state.capacity:
+        state.sums[i] -= _terms(state.pwf[i, k], state.q[i, k])
+    else:
+        state.count[i] += 1
+    state.t[i, k], state.thp[i, k], state.q[i, k], state.pwf[i, k] = sample.t, sample.thp, sample.q, sample.pwf
+    state.head[i] = (k + 1) % state.capacity
+    state.sums[i] += _terms(sample.pwf, sample.q)
+    state.inserts[i] += 1
+    if state.inserts[i] % state.capacity == 0:
+        # Rebuild the sums from the window now and then so rounding does not accumulate
+        pwf, q = state.pwf[i, :state.count[i]], state.q[i, :state.count[i]]
+        state.sums[i] = [len(pwf), pwf.sum(), q.sum(), (pwf * pwf).sum(), (pwf * q).sum()]
+    state.dirty[i] = True
+
+
+# %%
+
+# IPR fit and operating point of the wells with new samples
+def refresh(state: StreamState) -> np.ndarray:
+    """
+
+    :param state: StreamState
+    :return: Indices of the wells that were updated
+    """
+    rows = np.flatnonzero(state.dirty)
+    if len(rows) == 0:
+        return rows
+    n, sx, sy, sxx, sxy = state.sums[rows].T
+    den = n * sxx - sx ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = (n * sxy - sx * sy) / den
+        a = (sy - b * sx) / n
+    # A well keeps its last fit until its window has two distinct pwf and a falling line
+    fitted = (n >= 2) & (den > 1e-9 * np.maximum(n * sxx, 1)) & (b < 0)
+    state.j[rows] = np.where(fitted, -b, state.j[rows])
+    state.pr[rows] = np.where(fitted, -a / b, state.pr[rows])
+
+    w = state.wells.iloc[rows]
+    last_thp = state.thp[rows, (state.head[rows] - 1) % state.capacity]
+    model = ipr_model_from_j(state.j[rows], state.pr[rows], w["pb"].to_numpy())
+    vlp = vlp_model(last_thp, *(w[name].to_numpy() for name in STATIC_COLUMNS[1:]))
+    ready = ~np.isnan(state.j[rows])
+    with np.errstate(invalid="ignore"):
+        point = operating_point(lambda pwf: qo_model(model, pwf), np.where(ready, state.pr[rows], 0.0), vlp)
+    state.q_op[rows] = np.where(ready, point.q, np.nan)
+    state.pwf_op[rows] = np.where(ready, point.pwf, np.nan)
+    state.dirty[rows] = False
+    return rows
+
+
+def snapshot(state: StreamState) -> pd.DataFrame:
+    """
+
+    :param state: StreamState
+    :return: DataFrame per well with the last sample time, fitted J and pr, and the operating point
+    """
+    last = (state.head - 1) % state.capacity
+    rows = np.arange(len(state.head))
+    df = pd.DataFrame(index=list(state.index))
+    df['t'] = state.t[rows, last]
+    df['samples'] = state.count
+    df['J(bpd/psi)'] = state.j
+    df['Pr(psia)'] = state.pr
+    df['q(bpd)'] = state.q_op
+    df['Pwf(psia)'] = state.pwf_op
+    return df
+
+
+# %%
+
+# Sources
+def parse_line(line: str) -> Sample:
+    """
+
+    :param line: "well,time,thp,q,pwf"
+    :return: Sample, or None for blank or malformed lines
+    """
+    parts = line.strip().split(",")
+    if len(parts) != 5:
+        return None
+    try:
+        return Sample(parts[0], *(float(v) for v in parts[1:]))
+    except ValueError:
+        return None
+
+
+async def tail_file(path,
+                    state: StreamState,
+                    poll: float = 0.2,
+                    from_start: bool = True):
+    """
+
+    Follows a file that another process keeps appending samples to
+    (a stand-in for a historian feed). Runs until cancelled.
+
+    :param path: File with one sample per line
+    :param state: StreamState
+    :param poll: Seconds between checks for new lines
+    :param from_start: Read the lines already in the file first
+    """
+    with open(path, "r") as f:
+        if not from_start:
+            f.seek(0, 2)
+        partial = ""
+        while True:
+            chunk = f.read()
+            if not chunk:
+                await asyncio.sleep(poll)
+                continue
+            lines = (partial + chunk).split("\n")
+            partial = lines.pop()
+            for line in lines:
+                sample = parse_line(line)
+                if sample is not None:
+                    ingest(state, sample)
+
+
+async def serve_socket(state: StreamState,
+                       host: str = "127.0.0.1",
+                       port: int = 8765):
+    """
+
+    :param state: StreamState
+    :param host: Interface to listen on (local by default)
+    :param port: TCP port
+    :return: asyncio server; clients send one sample per line
+    """
+    async def handle(reader, writer):
+        try:
+            async for line in reader:
+                sample = parse_line(line.decode(errors="ignore"))
+                if sample is not None:
+                    ingest(state, sample)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def refresh_loop(state: StreamState,
+                       interval: float = 1.0,
+                       callback=None):
+    """
+
+    :param state: StreamState
+    :param interval: Seconds between refreshes
+    :param callback: Called with (state, updated rows) after every refresh with updates
+    """
+    while True:
+        rows = refresh(state)
+        if callback is not None and len(rows):
+            callback(state, rows)
+        await asyncio.sleep(interval)
+
+
+# Quicktest
+if __name__ == "__main__":
+    async def main():
+        wells = pd.DataFrame({"pb": [2000.0, 2000.0], "api": 30, "wc": 0.3, "sg_h2o": 1.0, "tvd": 6000,
+                              "md": 6500, "nvl": 0, "id": 2.5, "c": 120}, index=["W-1", "W-2"])
+        state = new_stream_state(wells, capacity=64)
+        server = await serve_socket(state, port=0)
+        port = server.sockets[0].getsockname()[1]
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        for k in range(200):
+            pwf = 1500 + 10 * (k % 20)
+            writer.write(f"W-1,{k},150,{2.0 * (3000 - pwf)},{pwf}\n".encode())
+            writer.write(f"W-2,{k},150,{1.0 * (2800 - pwf)},{pwf}\n".encode())
+        await writer.drain()
+        writer.close()
+        await asyncio.sleep(0.1)
+        refresh(state)
+        print(snapshot(state))
+        server.close()
+
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+# %%
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from model.ipr import ipr_model_from_j, qo_model
+from model.jobs import FLEET_COLUMNS
+
+# %%
+
+# Synthetic datasets
+# Seeded, plausible inputs at any scale for benchmarks and load tests:
+# well parameter sets in both regimes (pr > pb and pr <= pb) with the ef/ef2
+# combinations the IPR functions handle, daily production histories with a
+# hyperbolic decline, pwf tables and reservoir pressure histories. The tables
+# have the columns the app pages read (date, oil_rate, pwf, pr) and
+# upload_bytes writes them in the format the uploaders take.
+
+# (share of the wells, ef range, ef2 range; None: no ef2)
+EF_VARIANTS = (
+    (0.6, (1.0, 1.0), None),
+    (0.2, (0.6, 1.4), None),
+    (0.1, (0.6, 0.95), (1.0, 1.3)),
+    (0.1, (1.05, 1.4), (0.7, 1.0)),
+)
+
+
+def synthetic_fleet(wells: int = 1000,
+                    seed: int = 0,
+                    saturated: float = 0.3) -> pd.DataFrame:
+    """
+
+    :param wells: Number of wells
+    :param seed: Random seed (same seed, same fleet)
+    :param saturated: Share of wells with pr <= pb
+    :return: One row per well: well, the FLEET_COLUMNS, ef, ef2 (NaN when not used), c and the J used
+    """
+    rng = np.random.default_rng(seed)
+    pr = rng.uniform(1500, 4500, wells)
+    below = rng.random(wells) < saturated
+    pb = np.where(below, pr * rng.uniform(1.0, 1.2, wells), pr * rng.uniform(0.4, 0.95, wells))
+    pwf_test = pr * rng.uniform(0.45, 0.9, wells)
+    j_value = rng.lognormal(0.0, 0.6, wells)
+    # Test rate on the ef = 1 curve of the sampled productivity index
+    q_test = qo_model(ipr_model_from_j(j_value, pr, pb), pwf_test)
+
+    shares = np.array([variant[0] for variant in EF_VARIANTS])
+    variant = rng.choice(len(EF_VARIANTS), size=wells, p=shares / shares.sum())
+    ef = np.ones(wells)
+    ef2 = np.full(wells, np.nan)
+    for k, (_, ef_range, ef2_range) in enumerate(EF_VARIANTS):
+        rows = variant == k
+        ef[rows] = rng.uniform(*ef_range, rows.sum())
+        if ef2_range is not None:
+            ef2[rows] = rng.uniform(*ef2_range, rows.sum())
+
+    tvd = rng.uniform(4000, 10000, wells)
+    df = pd.DataFrame({"well": [f"W-{k:05d}" for k in range(wells)]})
+    values = {"q_test": q_test, "pwf_test": pwf_test, "pr": pr, "pb": pb, "thp": rng.uniform(100, 300, wells),
+              "api": rng.uniform(18, 40, wells), "wc": rng.beta(2, 3, wells), "sg_h2o": rng.uniform(1.0, 1.1, wells),
+              "tvd": tvd, "md": tvd * rng.uniform(1.0, 1.3, wells),
+              "nvl": np.where(rng.random(wells) < 0.8, 0.0, rng.uniform(0, 0.3, wells) * tvd),
+              "id": rng.choice([1.995, 2.441, 2.992], wells)}
+    for name in FLEET_COLUMNS:
+        df[name] = values[name]
+    df["ef"] = ef
+    df["ef2"] = ef2
+    df["c"] = 120.0
+    df["j"] = j_value
+    return df
+
+
+# %%
+
+def production_history(fleet: pd.DataFrame,
+                       days: int = 365,
+                       start="2024-01-01",
+                       seed: int = 0) -> pd.DataFrame:
+    """
+
+    :param fleet: synthetic_fleet rows
+    :param days: Days of history per well
+    :param start: First date
+    :param seed: Random seed
+    :return: Long table with well, date, oil_rate, water_rate (hyperbolic decline from the test rate,
+             noise and shut-in days)
+    """
+    rng = np.random.default_rng(seed)
+    wells = len(fleet)
+    t = np.arange(days, dtype=float)
+    qi = fleet["q_test"].to_numpy() * rng.uniform(0.9, 1.1, wells)
+    decline = rng.uniform(0.0005, 0.003, wells)[:, None]
+    b = rng.uniform(0.3, 0.9, wells)[:, None]
+    oil = qi[:, None] / (1 + b * decline * t) ** (1 / b)
+    oil = oil * rng.lognormal(0.0, 0.05, (wells, days)) * (rng.random((wells, days)) >= 0.02)
+    # Water cut rising from the test value
+    wc = np.clip(fleet["wc"].to_numpy()[:, None] + 0.1 * t / 365, 0, 0.98)
+    df = pd.DataFrame({"well": np.repeat(fleet["well"].to_numpy(), days),
+                       "date": np.tile(pd.date_range(start, periods=days, freq="D"), wells),
+                       "oil_rate": oil.ravel(),
+                       "water_rate": (oil * wc / (1 - wc)).ravel()})
+    return df
+
+
+def pwf_tables(fleet: pd.DataFrame,
+               points: int = 20) -> pd.DataFrame:
+    """
+
+    :param fleet: synthetic_fleet rows
+    :param points: Pressures per well, from pr down to 0
+    :return: Long table with well and pwf (the IPR Curve upload)
+    """
+    fraction = np.linspace(1.0, 0.0, points)
+    pr = fleet["pr"].to_numpy()
+    return pd.DataFrame({"well": np.repeat(fleet["well"].to_numpy(), points),
+                         "pwf": (pr[:, None] * fraction).ravel()})
+
+
+def pressure_history(fleet: pd.DataFrame,
+                     days: int = 365,
+                     step: int = 30,
+                     start="2024-01-01",
+                     seed: int = 0) -> pd.DataFrame:
+    """
+
+    :param fleet: synthetic_fleet rows
+    :param days: Days covered
+    :param step: Days between pressure measurements
+    :param start: First date
+    :param seed: Random seed
+    :return: Long table with well, date and pr (the pressure history upload of the forecast)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days, freq="D")[::step]
+    t = (dates - dates[0]).days.to_numpy(dtype=float)
+    wells = len(fleet)
+    pr = fleet["pr"].to_numpy()[:, None] - rng.uniform(0.1, 1.0, (wells, 1)) * t + rng.normal(0, 10, (wells, len(t)))
+    return pd.DataFrame({"well": np.repeat(fleet["well"].to_numpy(), len(t)),
+                         "date": np.tile(dates, wells),
+                         "pr": pr.ravel()})
+
+
+# %%
+
+def upload_bytes(df: pd.DataFrame, file_format: str = "xlsx") -> bytes:
+    """
+
+    :param df: Table to upload (one well)
+    :param file_format: "xlsx" (what the uploaders read, needs openpyxl) or "csv"
+    :return: File content
+    """
+    buffer = io.BytesIO()
+    if file_format == "xlsx":
+        df.to_excel(buffer, index=False)
+    else:
+        df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def write_dataset(directory,
+                  wells: int = 1000,
+                  days: int = 365,
+                  seed: int = 0,
+                  uploads: int = 10,
+                  file_format: str = "xlsx") -> dict:
+    """
+
+    :param directory: Output directory (created if missing)
+    :param wells: Number of wells
+    :param days: Days of production history
+    :param seed: Random seed
+    :param uploads: Wells that also get one upload file per page (history, pwf, pressure)
+    :param file_format: Format of the upload files
+    :return: Name -> path of the files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    fleet = synthetic_fleet(wells, seed)
+    tables = {"fleet": fleet, "history": production_history(fleet, days, seed=seed),
+              "pwf": pwf_tables(fleet), "pressure": pressure_history(fleet, days, seed=seed)}
+    paths = {}
+    for name, table in tables.items():
+        paths[name] = os.path.join(directory, f"{name}.csv")
+        table.to_csv(paths[name], index=False)
+    for well in fleet["well"].iloc[:uploads]:
+        for name in ("history", "pwf", "pressure"):
+            table = tables[name]
+            path = os.path.join(directory, f"{name}_{well}.{file_format}")
+            with open(path, "wb") as f:
+                f.write(upload_bytes(table[table["well"] == well].drop(columns="well"), file_format))
+            paths[f"{name}_{well}"] = path
+    return paths
+
+
+# Quicktest
+fleet_test = synthetic_fleet(1000)
+print("Wells with pr <= pb:", int((fleet_test["pr"] <= fleet_test["pb"]).sum()),
+      "with ef2:", int(fleet_test["ef2"].notna().sum()))
+print(production_history(fleet_test.head(2), 3))
@@ -0,0 +1,204 @@
+# %%
+import re
+
+import numpy as np
+import pandas as pd
+
+# %%
+
+# Units
+# The model functions work in psia, bpd, ft and inches. Columns in other units
+# are converted once when they are read: the unit of a column comes from its
+# header ("pr [kPa]", "oil_rate (m3/d)"), from a units mapping, or, when the
+# wells of a table were measured differently, from a "<column>_unit" column
+# with one unit per row. Each column takes one multiply and add over all its
+# rows (the factors of a per-row unit column come from its distinct values),
+# so the kernels only ever see canonical arrays. A blank unit means the
+# canonical one. Results are converted to the units asked for when they are
+# shown.
+
+# Unit -> (dimension, factor, offset): canonical value = value * factor + offset
+UNITS = {
+    "psia": ("pressure", 1.0, 0.0),
+    "psi": ("pressure", 1.0, 0.0),
+    "psig": ("pressure", 1.0, 14.696),
+    "kpa": ("pressure", 0.1450377, 0.0),
+    "mpa": ("pressure", 145.0377, 0.0),
+    "bar": ("pressure", 14.50377, 0.0),
+    "atm": ("pressure", 14.69595, 0.0),
+    "kg/cm2": ("pressure", 14.22334, 0.0),
+    "bpd": ("rate", 1.0, 0.0),
+    "bbl/d": ("rate", 1.0, 0.0),
+    "stb/d": ("rate", 1.0, 0.0),
+    "m3/d": ("rate", 6.289811, 0.0),
+    "m3/h": ("rate", 150.9555, 0.0),
+    "ft": ("length", 1.0, 0.0),
+    "m": ("length", 3.280840, 0.0),
+    "in": ("diameter", 1.0, 0.0),
+    "mm": ("diameter", 1 / 25.4, 0.0),
+}
+
+# Spellings read in headers and unit columns
+_ALIASES = {"m³/d": "m3/d", "m3/day": "m3/d", "m3d": "m3/d", "sm3/d": "m3/d", "m³/h": "m3/h", "bopd": "bpd",
+            "bbl/day": "bpd", "b/d": "bpd", "stb/day": "stb/d", "\"": "in", "inch": "in", "feet": "ft"}
+
+CANONICAL = {"pressure": "psia", "rate": "bpd", "length": "ft", "diameter": "in", "index": "bpd/psi"}
+
+# Column -> dimension, for the columns of the uploads, fleets and results
+COLUMNS = {
+    "q_test": "rate", "pwf_test": "pressure", "pr": "pressure", "pb": "pressure", "pwf": "pressure",
+    "thp": "pressure", "tvd": "length", "md": "length", "nvl": "length", "id": "diameter",
+    "oil_rate": "rate", "water_rate": "rate",
+    "q(bpd)": "rate", "AOF(bpd)": "rate", "Qmax(bpd)": "rate", "qo(bpd)": "rate", "Pwf(psia)": "pressure",
+    "Drawdown(psi)": "pressure", "J(bpd/psi)": "index",
+    "THP(psia)": "pressure", "Pgravity(psia)": "pressure", "Pf(psia)": "pressure", "Po(psia)": "pressure",
+    "Psys(psia)": "pressure", "Pr(psia)": "pressure", "F(ft)": "length",
+}
+
+# Pressure differences: converted without the offset of gauge units
+DIFFERENCES = {"Drawdown(psi)", "Pgravity(psia)", "Pf(psia)", "Psys(psia)"}
+
+
+class UnitError(ValueError):
+    """Unit that cannot be read, or of the wrong dimension for its column"""
+
+
+_HEADER = re.compile(r"^\s*(?P<name>.+?)\s*[\[(](?P<unit>[^\[\]()]+)[\])]\s*$")
+
+
+def unit_of(unit: str) -> str:
+    """
+
+    :param unit: Unit as written, e.g. "kPa", "m³/d", "bbl/day"
+    :return: Key of UNITS (UnitError if unknown)
+    """
+    key = str(unit).strip().lower().replace(" ", "")
+    key = _ALIASES.get(key, key)
+    if key not in UNITS:
+        raise UnitError(f"Unknown unit: {str(unit)!r}")
+    return key
+
+
+def _factors(units, dimension: str):
+    # (factor, offset) of one unit, or arrays of them for one unit per row; blank or NaN is the canonical unit
+    scalar = np.ndim(units) == 0
+    units = np.asarray([units] if scalar else units, dtype=object)
+    blank = pd.isna(units) | (np.char.strip(units.astype(str)) == "")
+    names, inverse = np.unique(np.where(blank, CANONICAL[dimension], units).astype(str), return_inverse=True)
+    factor = np.empty(len(names))
+    offset = np.empty(len(names))
+    for k, name in enumerate(names):
+        found, factor[k], offset[k] = UNITS[unit_of(name)]
+        if found != dimension:
+            raise UnitError(f"{str(name)!r} is a {found} unit, not a {dimension} unit")
+    if scalar:
+        return factor[0], offset[0]
+    return factor[inverse], offset[inverse]
+
+
+def to_canonical(values, units, dimension: str):
+    """
+
+    :param values: Values (number or array)
+    :param units: Their unit, or one unit per value
+    :param dimension: Key of CANONICAL
+    :return: Values in the canonical unit of the dimension
+    """
+    factor, offset = _factors(units, dimension)
+    return np.asarray(values, dtype=float) * factor + offset
+
+
+def from_canonical(values, units, dimension: str):
+    """
+
+    :param values: Values in the canonical unit of the dimension
+    :param units: Unit wanted, or one unit per value
+    :param dimension: Key of CANONICAL
+    :return: Values in the unit wanted
+    """
+    factor, offset = _factors(units, dimension)
+    return (np.asarray(values, dtype=float) - offset) / factor
+
+
+# %%
+
+def normalize(df: pd.DataFrame, units: dict = None) -> pd.DataFrame:
+    """
+
+    :param df: Table as read, with units in the headers ("pr [kPa]"), in units or in <column>_unit columns
+    :param units: Column -> unit, for columns whose header has none
+    :return: Copy with the headers without units, the columns of COLUMNS in canonical units and the unit
+             columns dropped (the table itself when nothing is to convert); UnitError for a unit that
+             cannot be read
+    """
+    units = dict(units or {})
+    names = {}
+    for column in df.columns:
+        match = _HEADER.match(str(column))
+        if match and match["name"] in COLUMNS:
+            names[column] = match["name"]
+            units[match["name"]] = match["unit"]
+    for column in COLUMNS:
+        if f"{column}_unit" in df:
+            units[column] = df[f"{column}_unit"].to_numpy()
+    if not units:
+        return df
+    out = df.rename(columns=names).drop(columns=[f"{column}_unit" for column in COLUMNS if f"{column}_unit" in df])
+    for column, unit in units.items():
+        if column in out and column in COLUMNS:
+            try:
+                out[column] = to_canonical(out[column].to_numpy(dtype=float), unit, COLUMNS[column])
+            except UnitError as error:
+                raise UnitError(f"Column {column}: {error}") from None
+    return out
+
+
+def convert_output(df: pd.DataFrame, units: dict) -> pd.DataFrame:
+    """
+
+    :param df: Results in canonical units (columns of COLUMNS, e.g. "q(bpd)")
+    :param units: Dimension -> unit wanted, e.g. {"rate": "m3/d", "pressure": "kPa"} (productivity indexes
+                  follow the rate and pressure units)
+    :return: Copy with those columns converted and their headers relabelled, e.g. "q(m3/d)"
+    """
+    out = df.copy()
+    names = {}
+    for column in df.columns:
+        dimension = COLUMNS.get(column)
+        values = df[column].to_numpy(dtype=float) if dimension else None
+        if dimension == "index":
+            if "rate" not in units or "pressure" not in units:
+                continue
+            # Rate per pressure difference: no gauge offset
+            factor = _factors(units["rate"], "rate")[0] / _factors(units["pressure"], "pressure")[0]
+            out[column] = values / factor
+            names[column] = label(column, f"{units['rate']}/{units['pressure']}")
+            continue
+        if dimension not in units or unit_of(units[dimension]) == CANONICAL[dimension]:
+            continue
+        if column in DIFFERENCES:
+            out[column] = values / _factors(units[dimension], dimension)[0]
+        else:
+            out[column] = from_canonical(values, units[dimension], dimension)
+        names[column] = label(column, units[dimension])
+    return out.rename(columns=names)
+
+
+def label(column: str, unit: str) -> str:
+    """
+
+    :param column: Column name, with or without its canonical unit ("q(bpd)", "pr")
+    :param unit: Unit shown
+    :return: Column name with that unit, e.g. "q(m3/d)"
+    """
+    match = _HEADER.match(column)
+    return f"{match['name'] if match else column}({unit})"
+
+
+# Quicktest
+if __name__ == "__main__":
+    print(to_canonical([100.0, 1000.0], "kPa", "pressure"), from_canonical(2000.0, "bar", "pressure"))
+    print(normalize(pd.DataFrame({"pr [kPa]": [20000.0, 25000.0], "q_test": [80.0, 500.0],
+                                  "q_test_unit": ["m3/d", "bpd"], "tvd (m)": [2000.0, 1800.0]})))
+    print(convert_output(pd.DataFrame({"q(bpd)": [1000.0], "Pwf(psia)": [2000.0], "J(bpd/psi)": [1.0]}),
+                         {"rate": "m3/d", "pressure": "kPa"}))
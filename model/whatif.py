@@ -0,0 +1,134 @@
+# %%
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from model.cache import cached, content_hash
+from model.ipr import ipr_model, qo_model
+from model.nodal import operating_point, vlp_model
+
+# %%
+
+# What-if response surface
+# The operating point (q, pwf) of one well is computed once on a small grid of
+# a few parameters around the current inputs (every other input fixed), in one
+# vectorized operating_point call. A slider position is then answered by
+# linear interpolation on that grid, which costs the same whatever the grid.
+# Surfaces are built in a background thread and kept in the shared cache, so
+# the same well and parameters are never built twice.
+
+WHATIF_PARAMETERS = ("q_test", "pwf_test", "pr", "pb", "thp", "api", "wc", "sg_h2o", "tvd", "md", "nvl", "id", "c")
+
+Surface = namedtuple("Surface", "base names axes q pwf interpolator")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whatif")
+_futures = {}
+_lock = threading.Lock()
+
+
+def exact_point(values: dict):
+    """
+
+    :param values: Every WHATIF_PARAMETERS value (arrays broadcast together)
+    :return: OperatingPoint from the IPR (qo) and the VLP (gradient_avg, f_darcy); NaN for an invalid test
+    """
+    model = ipr_model(values["q_test"], values["pwf_test"], values["pr"], values["pb"])
+    vlp = vlp_model(*(values[name] for name in WHATIF_PARAMETERS[4:]))
+    with np.errstate(invalid="ignore"):
+        point = operating_point(lambda pwf: qo_model(model, pwf), model.pr, vlp)
+    valid = (model.j > 0) & (model.qmax > 0)
+    return point._replace(q=np.where(valid, point.q, np.nan), pwf=np.where(valid, point.pwf, np.nan))
+
+
+def whatif_axes(base: dict,
+                names,
+                span: float = 0.2,
+                points: int = 9) -> dict:
+    """
+
+    :param base: Current value of every WHATIF_PARAMETERS
+    :param names: Parameters to vary
+    :param span: Relative range around the current value (+/-)
+    :param points: Grid points per parameter
+    :return: Parameter name -> ascending grid values (wc kept in [0, 1], pr and pwf_test kept apart);
+             ValueError when pr or pwf_test is varied and pr <= pwf_test
+    """
+    if {"pr", "pwf_test"} & set(names) and float(base["pr"]) <= float(base["pwf_test"]):
+        raise ValueError("the what-if surface needs pr > pwf_test")
+    axes = {}
+    for name in names:
+        value = float(base[name])
+        lo, hi = sorted((value * (1 - span), value * (1 + span))) if value else (0.0, span)
+        if name == "wc":
+            lo, hi = max(lo, 0.0), min(hi, 1.0)
+        elif name == "pr":
+            # q grows without bound as pr comes down to pwf_test: stop at half the test drawdown
+            lo = max(lo, 0.5 * (value + float(base["pwf_test"])))
+        elif name == "pwf_test":
+            hi = min(hi, 0.5 * (value + float(base["pr"])))
+        axes[name] = np.linspace(lo, hi, points)
+    return axes
+
+
+def build_surface(base: dict, axes: dict) -> Surface:
+    """
+
+    :param base: Current value of every WHATIF_PARAMETERS
+    :param axes: Parameter name -> grid values (e.g. whatif_axes)
+    :return: Surface with q and pwf on the grid
+    """
+    names = tuple(axes)
+    grids = np.meshgrid(*(axes[name] for name in names), indexing="ij")
+    values = dict(base, **dict(zip(names, grids)))
+    point = exact_point(values)
+    shape = grids[0].shape
+    q, pwf = np.broadcast_to(point.q, shape), np.broadcast_to(point.pwf, shape)
+    interpolator = RegularGridInterpolator(tuple(axes[name] for name in names), np.stack((q, pwf), axis=-1))
+    return Surface(dict(base), names, axes, q, pwf, interpolator)
+
+
+def surface_future(base: dict,
+                   names,
+                   span: float = 0.2,
+                   points: int = 9) -> Future:
+    """
+
+    :param base: Current value of every WHATIF_PARAMETERS
+    :param names: Parameters to vary
+    :param span: Relative range around the current value (+/-)
+    :param points: Grid points per parameter
+    :return: Future of the Surface, built in the background (done at once if cached)
+    """
+    axes = whatif_axes(base, names, span, points)
+    key = content_hash(sorted(base.items()), sorted((name, axis) for name, axis in axes.items()))
+    with _lock:
+        future = _futures.get(key)
+        if future is None or future.cancelled():
+            future = _futures[key] = _executor.submit(cached, "whatif", key, lambda: build_surface(base, axes))
+            # Keep only a few recent surfaces here; the shared cache holds the values
+            while len(_futures) > 32:
+                del _futures[next(iter(_futures))]
+    return future
+
+
+def interpolate(surface: Surface, values: dict):
+    """
+
+    :param surface: Surface
+    :param values: Parameter name -> value for the varied parameters (clipped to the grid)
+    :return: (q, pwf) interpolated, NaN next to invalid grid points
+    """
+    point = [np.clip(values[name], surface.axes[name][0], surface.axes[name][-1]) for name in surface.names]
+    q, pwf = surface.interpolator(point)[0]
+    return float(q), float(pwf)
+
+
+# Quicktest
+base_test = dict(q_test=500, pwf_test=2500, pr=3000, pb=2800, thp=150, api=30, wc=0.2, sg_h2o=1.0, tvd=5000, md=5500,
+                 nvl=0, id=2.5, c=120)
+surface_test = surface_future(base_test, ("thp", "wc", "pr")).result()
+print("What-if (thp=170, wc=0.25, pr=3100):", interpolate(surface_test, {"thp": 170, "wc": 0.25, "pr": 3100}),
+      "exact:", exact_point(dict(base_test, thp=170, wc=0.25, pr=3100)))
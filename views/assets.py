@@ -0,0 +1,35 @@
+# %%
+from functools import lru_cache
+from pathlib import Path
+
+# %%
+
+# Static assets, read from disk once per server process
+
+RESOURCES = Path(__file__).resolve().parent.parent / "resources"
+
+
+@lru_cache(maxsize=None)
+def asset_bytes(name: str) -> bytes:
+    """
+
+    :param name: File name inside resources/
+    :return: Content of the file
+    """
+    return (RESOURCES / name).read_bytes()
+
+
+@lru_cache(maxsize=None)
+def asset_image(name: str):
+    """
+
+    :param name: Image file name inside resources/
+    :return: PIL image, decoded once
+    """
+    import io
+
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(asset_bytes(name)))
+    image.load()
+    return image
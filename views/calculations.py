@@ -0,0 +1,116 @@
+# %%
+import sqlite3
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from model import graphics
+from model.cache import read_upload
+from model.history import open_store, record_run
+from model.j import j
+from model.q import aof, qo, qo_darcy, qo_ipr_compuesto, qo_vogel
+from model.units import UNITS, UnitError, from_canonical, to_canonical, unit_of
+
+# %%
+
+# Calculations page: reservoir potential and IPR curves
+
+
+# Headless part of the page (also used by the load test): results without Streamlit
+def potential(q_test, pwf_test, pr, pwf, pb):
+    """
+
+    :return: (Qo, AOF, productivity index) of the Potential reservoir section
+    """
+    return (qo(q_test, pwf_test, pr, pwf, pb, ef=1, ef2=None), aof(q_test, pwf_test, pr, pb, ef=1, ef2=None),
+            j(q_test, pwf_test, pr, pb, ef=1, ef2=None))
+
+
+def ipr_png(df3: pd.DataFrame, q_test, pwf_test, pr, pb, method) -> bytes:
+    """
+
+    :param df3: Uploaded table with a pwf column
+    :return: PNG of the IPR curve of the IPR Curve section, shared by every session with the same inputs
+    """
+    return graphics.ipr_png(df3["pwf"], q_test, pwf_test, pr, pb, method)
+
+
+# Rate of each method of the IPR Curve section
+IPR_METHODS = {"Darcy": qo_darcy, "Vogel": qo_vogel, "IPR Compuesto": qo_ipr_compuesto}
+
+
+def ipr_table(df3: pd.DataFrame, q_test, pwf_test, pr, pb, method) -> pd.DataFrame:
+    """
+
+    :param df3: Uploaded table with a pwf column
+    :return: Pwf(psia) and qo(bpd) of the IPR curve, as drawn by ipr_png
+    """
+    pwf = np.sort(df3["pwf"].to_numpy(dtype=float))[::-1]
+    rate = IPR_METHODS[method]
+    return pd.DataFrame({"Pwf(psia)": pwf, "qo(bpd)": [rate(q_test, pwf_test, pr, value, pb) for value in pwf]})
+
+
+# Units offered on the page, first the canonical one
+PRESSURE_UNITS = ("psia", "psig", "kPa", "bar")
+RATE_UNITS = ("bpd", "m3/d")
+
+
+def render():
+    st.write("This section is used to obtain the reservoir potential. Also, in the IPR Curve option you must load a "
+             "file containing pwf data. To obtain the IPR curve by different methods.")
+    if st.checkbox("Potential reservoir"):
+        Data = namedtuple("Input", "q_test pwf_test pr pwf pb ef ef2")
+        st.subheader("**Enter input values**")
+        well = st.text_input("Well name (stored in the history)")
+        p_unit = st.selectbox("Pressure unit", PRESSURE_UNITS)
+        q_unit = st.selectbox("Rate unit", RATE_UNITS)
+        q_test = st.number_input(f"Enter q_test value ({q_unit}): ")
+        pwf_test = st.number_input(f"Enter pw_test value ({p_unit}): ")
+        pr = st.number_input(f"Enter pr value ({p_unit}): ")
+        pwf = st.number_input(f"Enter pwf value ({p_unit})")
+        pb = st.number_input(f"Enter pb value ({p_unit})")
+        ef = st.number_input("Enter ef value")
+        ef2 = st.number_input("Enter ef2 value")
+        # The inputs in psia and bpd, the results back in the units chosen
+        q_test = float(to_canonical(q_test, q_unit, "rate"))
+        pwf_test, pr, pwf, pb = map(float, to_canonical([pwf_test, pr, pwf, pb], p_unit, "pressure"))
+        st.subheader("**Show results**")
+        qo_value, Qmax, idp = potential(q_test, pwf_test, pr, pwf, pb)
+        # J per unit of pressure difference: no gauge offset
+        j_factor = UNITS[unit_of(p_unit)][1] / UNITS[unit_of(q_unit)][1]
+        st.success(f"{'Qo'} -> {from_canonical(qo_value, q_unit, 'rate'):.3f} {q_unit} ")
+        st.success(f"{'Caudal maximo'} -> {from_canonical(Qmax, q_unit, 'rate'):.3f} {q_unit} ")
+        st.success(f"{'Indice de productividad'} -> {idp * j_factor:.3f} {q_unit}/{p_unit} ")
+        if well:
+            params = dict(q_test=q_test, pwf_test=pwf_test, pr=pr, pwf=pwf, pb=pb)
+            try:
+                record_run(open_store(), well, "potential", params, q=qo_value, pwf=pwf, aof=Qmax, j=idp)
+            except sqlite3.Error as error:
+                st.warning(f"The run was not stored in the history: {error}")
+
+    elif st.checkbox("IPR Curve"):
+        file2 = st.file_uploader("Upload your csv file to Calculations/IPR CURVE")
+        try:
+            df_e = read_upload(file2)
+        except UnitError as error:
+            st.error(f"The units of the file cannot be read: {error}")
+            return
+        df3 = pd.DataFrame(df_e)
+        st.subheader("**Select method**")
+        method = st.selectbox("Method", ("Darcy", "Vogel", "IPR Compuesto"))
+        Data = namedtuple("Input", "q_test pwf_test pr pwf pb")
+        st.subheader("**Enter input values**")
+        well = st.text_input("Well name (stored in the history)")
+        q_test = st.number_input("Enter q_test value: ")
+        pwf_test = st.number_input("Enter pw_test value: ")
+        pr = st.number_input("Enter pr value: ")
+        pb = st.number_input("Enter pb value")
+        st.image(ipr_png(df3, q_test, pwf_test, pr, pb, method))
+        if well:
+            params = dict(q_test=q_test, pwf_test=pwf_test, pr=pr, pb=pb, method=method)
+            try:
+                record_run(open_store(), well, "ipr", params, table=ipr_table(df3, q_test, pwf_test, pr, pb, method))
+            except sqlite3.Error as error:
+                st.warning(f"The run was not stored in the history: {error}")
@@ -0,0 +1,71 @@
+# %%
+import pandas as pd
+import streamlit as st
+
+from model.cache import cached, content_hash, read_upload
+from model.compare import RANKINGS, comparison, comparison_figure, ranking
+from model.graphics import render_figure
+from model.jobs import FLEET_COLUMNS
+from model.units import UnitError, convert_output
+from views.calculations import PRESSURE_UNITS, RATE_UNITS
+
+# %%
+
+# Well Comparison page: IPR and VLP curves of every well of an upload on one chart, and the wells ranked
+
+
+# Headless part of the page: comparison and chart shared by every session with the same upload
+def well_comparison(fleet: pd.DataFrame, points: int = 200):
+    """
+
+    :param fleet: One row per well: well, the FLEET_COLUMNS, optionally ef and c
+    :param points: Rates per curve
+    :return: Comparison of the wells
+    """
+    return cached("compare", content_hash(fleet, points), lambda: comparison(fleet, points))
+
+
+def comparison_png(fleet: pd.DataFrame, highlight, points: int = 200) -> bytes:
+    """
+
+    :param highlight: Rows of the wells drawn in colour
+    :return: PNG of the comparison chart
+    """
+    result = well_comparison(fleet, points)
+    return cached("compare-plot", content_hash(fleet, points, tuple(highlight)),
+                  lambda: render_figure(comparison_figure, result, tuple(highlight)).result())
+
+
+def render():
+    st.write("This section compares the wells of a field: upload a file with one row per well (well, "
+             f"{', '.join(FLEET_COLUMNS)} and optionally ef and c; units in the headers, e.g. pr [kPa], or in "
+             "<column>_unit columns, default psia, bpd, ft and in) to see every IPR and VLP curve on one chart, "
+             "with the operating points, and the wells ranked.")
+    file = st.file_uploader("Upload your file with one row per well")
+    if file is None:
+        return
+    try:
+        fleet = read_upload(file)
+    except UnitError as error:
+        st.error(f"The units of the file cannot be read: {error}")
+        return
+    missing = [name for name in FLEET_COLUMNS if name not in fleet]
+    if missing:
+        st.error(f"Missing columns: {', '.join(missing)}")
+        return
+    result = well_comparison(fleet)
+
+    st.subheader("**Ranking**")
+    by = st.selectbox("Rank by", tuple(RANKINGS))
+    ascending = st.checkbox("Smallest first")
+    ranked = ranking(result.table, by, ascending)
+    p_unit = st.selectbox("Pressure unit", PRESSURE_UNITS)
+    q_unit = st.selectbox("Rate unit", RATE_UNITS)
+    st.write(convert_output(ranked, {"pressure": p_unit, "rate": q_unit}))
+    flagged = int((result.table["status"] != "").sum())
+    if flagged:
+        st.warning(f"{flagged} wells with inconsistent test data are left out of the chart")
+
+    st.subheader("**IPR and VLP curves**")
+    top = st.slider("Wells highlighted (top of the ranking)", 0, min(10, len(ranked)), min(5, len(ranked)))
+    st.image(comparison_png(fleet, ranked.index[:top].tolist()))
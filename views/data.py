@@ -0,0 +1,22 @@
+# %%
+import pandas as pd
+import streamlit as st
+
+from model.cache import read_upload
+from model.units import UnitError
+
+# %%
+
+# Data page: uploaded production history
+
+
+def render():
+    st.write("In this section you must first upload your file containing the oil production with the respective dates.")
+    file = st.file_uploader("Upload your csv file with oil and water rate")
+    try:
+        df = read_upload(file)
+    except UnitError as error:
+        st.error(f"The units of the file cannot be read: {error}")
+        return
+    df1 = pd.DataFrame(df)
+    st.write(df1)
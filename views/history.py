@@ -0,0 +1,56 @@
+# %%
+import pandas as pd
+import streamlit as st
+from matplotlib.figure import Figure
+
+from model.history import compare_dates, list_wells, load_run, open_store, well_trend
+
+# %%
+
+# History page: stored runs of a well, their trend and two dates side by side
+
+
+def render():
+    st.write("Every potential and nodal computation made in the app is stored by well and day. Choose a well to see "
+             "how its operating point changed, or compare two dates without rerunning anything.")
+    store = open_store()
+    wells = list_wells(store)
+    if not wells:
+        st.info("No runs stored yet: enter a well name in Calculations or Nodal Analysis Plots.")
+        return
+    well = st.selectbox("Well", wells)
+    kind = st.selectbox("Kind of run", ("All", "nodal", "potential", "operating_point"))
+    today = pd.Timestamp.today().normalize()
+    dates = st.date_input("Dates", (today - pd.Timedelta(days=365), today))
+    if len(dates) != 2:
+        return
+    start, end = dates
+    df_trend = well_trend(store, well, None if kind == "All" else kind, start, end)
+    st.write(f"{len(df_trend)} runs")
+    if df_trend.empty:
+        return
+    st.write(df_trend)
+
+    fig6 = Figure()
+    ax6 = fig6.subplots()
+    ax6.plot(list(df_trend['date']), list(df_trend['q']), color="red", label="q(bpd)")
+    ax7 = ax6.twinx()
+    ax7.plot(list(df_trend['date']), list(df_trend['pwf']), color="green", label="Pwf(psia)")
+    st.title('Operating point history')
+    ax6.set_xlabel('Date')
+    ax6.set_ylabel('q(bpd)')
+    ax7.set_ylabel('Pwf(psia)')
+    ax6.grid()
+    st.pyplot(fig6)
+
+    if st.checkbox("Compare two dates"):
+        first = st.date_input("First date", today)
+        second = st.date_input("Second date", today - pd.Timedelta(days=30))
+        st.write(compare_dates(store, well, "nodal" if kind == "All" else kind, (first, second)))
+
+    if st.checkbox("Inputs and table of a run"):
+        run_id = st.selectbox("Run", df_trend["id"].tolist()[::-1])
+        params, table = load_run(store, run_id)
+        st.json(params)
+        if table is not None:
+            st.write(table)
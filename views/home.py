@@ -0,0 +1,28 @@
+# %%
+import streamlit as st
+
+from views.assets import asset_bytes
+
+# %%
+
+# Home page: text and the animation only, no numerical stack
+
+
+def render():
+    st.write("**Welcome to the Home Page**")
+    st.write(
+        "Web application that will visually present the IPR (Well Productivity Index Curve) and demand curves, "
+        "allowing the user to evaluate the well's capacity based on the data he has provided."
+    )
+    try:
+        animation = asset_bytes("analisis_nodal.gif")
+    except FileNotFoundError:
+        animation = None
+    if animation is not None:
+        st.image(animation, caption='IPR and Demand Curves', use_column_width=True)
+    st.write("It is commonly accepted that wells are drilled and equipped for the primary purpose of extracting "
+             "oil or gas from reservoirs. The movement of these fluids from the accumulations to and through the"
+             " wellbore requires energy to compensate for frictional losses and bring them to the surface. "
+             "The fluids initially travel through the reservoir, enter the wellbore, flow to the surface, pass "
+             "through the pipeline system and are finally processed in the fluid separators located at the flow "
+             "stations (Marcelo Hirschfeldt, 2009). (Marcelo Hirschfeldt, 2009)")
@@ -0,0 +1,155 @@
+# %%
+import importlib.util
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model.cache import clear_cache, read_upload
+from model.graphics import IPR_METHODS, nodal_figure, render_figure
+from model.forecast import forecast_pressure
+from model.history import open_store, record_frame, well_trend
+from model.ipr import ipr_model
+from model.nodal import vlp_model
+from model.synthetic import pressure_history, production_history, pwf_tables, synthetic_fleet, upload_bytes
+from views.calculations import ipr_png, potential
+from views.nodal_analysis import nodal_values
+from views.nodal_plots import nodal_results
+from views.plots import production_figure
+
+# %%
+
+# End-to-end load test of the app pages
+# A synthetic fleet is pushed through the headless part of every page (the
+# functions render() calls, without Streamlit): one request per well and page,
+# each with the uploads of its well. Requests run on a thread pool, as the
+# sessions of one Streamlit server do, and the report gives the throughput and
+# latency percentiles of every page. The shared cache is cleared first, so
+# every request computes. Uploads go through read_upload as Excel files when
+# openpyxl is installed; without it the tables are handed over directly.
+
+
+def _uploader(parse: bool):
+    # read_upload only needs getvalue() from the st.file_uploader result
+    if parse:
+        return lambda df: io.BytesIO(upload_bytes(df)), read_upload
+    return lambda df: df, lambda df: df
+
+
+def page_requests(wells: int = 100,
+                  days: int = 365,
+                  seed: int = 0,
+                  store=":memory:",
+                  parse_uploads: bool = None) -> dict:
+    """
+
+    :param wells: Wells in the synthetic fleet (requests per page)
+    :param days: Days of production history per well
+    :param seed: Random seed
+    :param store: History store path for the History page (":memory:" by default, the app store is left alone)
+    :param parse_uploads: Parse Excel uploads (None: if openpyxl is installed)
+    :return: Page name -> list of zero-argument requests
+    """
+    if parse_uploads is None:
+        parse_uploads = importlib.util.find_spec("openpyxl") is not None
+    upload, read = _uploader(parse_uploads)
+    fleet = synthetic_fleet(wells, seed)
+    history = dict(tuple(production_history(fleet, days, seed=seed).groupby("well")))
+    pwf = dict(tuple(pwf_tables(fleet).groupby("well")))
+    pressure = dict(tuple(pressure_history(fleet, days, seed=seed).groupby("well")))
+    history_store = open_store(store)
+    requests = {"Data": [], "Plots": [], "Calculations": [], "Nodal Analysis": [], "Nodal Analysis Plots": [],
+                "History": []}
+    for k, row in enumerate(fleet.itertuples(index=False)):
+        well_history = upload(history[row.well].drop(columns="well"))
+        well_pwf = upload(pwf[row.well].drop(columns="well"))
+        nodal_inputs = (row.q_test, row.pwf_test, row.pr, row.pb, row.thp, row.api, row.wc, row.sg_h2o, row.tvd,
+                        row.md, row.nvl, row.id, row.c)
+        method = IPR_METHODS[k % len(IPR_METHODS)]
+
+        def data(file=well_history):
+            return read(file)
+
+        def plots(file=well_history):
+            return render_figure(production_figure, read(file)).result()
+
+        def calculations(row=row, file=well_pwf, method=method):
+            return potential(row.q_test, row.pwf_test, row.pr, 0.5 * row.pwf_test, row.pb), \
+                ipr_png(read(file), row.q_test, row.pwf_test, row.pr, row.pb, method)
+
+        def nodal_analysis(row=row):
+            return nodal_values(row.q_test, row.pwf_test, 0.8 * row.q_test, row.pr, row.pb, row.sg_h2o, row.api,
+                                row.q_test, row.id, row.wc)
+
+        def nodal_plots(file=well_history, nodal_inputs=nodal_inputs):
+            df2, point = nodal_results(read(file)["oil_rate"].to_numpy(), nodal_inputs)
+            return render_figure(nodal_figure, df2).result(), point
+
+        def history_page(row=row, pressure=pressure[row.well]):
+            # Operating point of every measured pressure, stored in one transaction, then read back as a trend
+            vlp = vlp_model(row.thp, row.api, row.wc, row.sg_h2o, row.tvd, row.md, row.nvl, row.id, row.c)
+            j_value = float(ipr_model(row.q_test, row.pwf_test, row.pr, row.pb).j)
+            forecast = forecast_pressure(pressure["date"], pressure["pr"], j_value, row.pb, vlp)
+            record_frame(history_store, forecast.assign(well=row.well), "forecast", ("Pr(psia)",), date="date")
+            return well_trend(history_store, row.well)
+
+        requests["Data"].append(data)
+        requests["Plots"].append(plots)
+        requests["Calculations"].append(calculations)
+        requests["Nodal Analysis"].append(nodal_analysis)
+        requests["Nodal Analysis Plots"].append(nodal_plots)
+        requests["History"].append(history_page)
+    return requests
+
+
+def _timed(request):
+    started = time.perf_counter()
+    try:
+        request()
+        error = None
+    except Exception as exception:
+        error = repr(exception)
+    return time.perf_counter() - started, error
+
+
+def load_test(requests: dict,
+              concurrency: int = 8) -> pd.DataFrame:
+    """
+
+    :param requests: Page name -> list of requests (page_requests)
+    :param concurrency: Requests in flight at once (sessions)
+    :return: One row per page: requests, errors, throughput (req/s), latency p50/p90/p99/max (ms) and the first error
+    """
+    rows = []
+    for page, calls in requests.items():
+        clear_cache()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(_timed, calls))
+            wall = time.perf_counter() - started
+        latency = np.array([seconds for seconds, _ in results]) * 1000
+        errors = [error for _, error in results if error is not None]
+        p50, p90, p99 = np.percentile(latency, [50, 90, 99])
+        rows.append({"page": page, "requests": len(calls), "errors": len(errors),
+                     "throughput(req/s)": len(calls) / wall, "p50(ms)": p50, "p90(ms)": p90, "p99(ms)": p99,
+                     "max(ms)": latency.max(), "first error": errors[0] if errors else ""})
+    return pd.DataFrame(rows).set_index("page")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test of the app pages with a synthetic fleet")
+    parser.add_argument("--wells", type=int, default=100)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        page_calls = page_requests(args.wells, args.days, args.seed, os.path.join(directory, "history.db"))
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(load_test(page_calls, args.concurrency).round(2))
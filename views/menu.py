@@ -0,0 +1,26 @@
+# %%
+
+# Pages of the app: menu name -> module with a render() function.
+# The modules are imported only when their page is shown.
+
+PAGES = {
+    "Home": "views.home",
+    "Data": "views.data",
+    "Plots": "views.plots",
+    "Calculations": "views.calculations",
+    "Nodal Analysis": "views.nodal_analysis",
+    "Nodal Analysis Plots": "views.nodal_plots",
+    "History": "views.history",
+    "Well Comparison": "views.compare",
+}
+
+# Pages listed in the navigation bar, with their icons
+MENU = {
+    "Home": "house",
+    "Data": "table",
+    "Plots": "bar-chart",
+    "Calculations": "calculator",
+    "Nodal Analysis Plots": "graph-up",
+    "History": "clock-history",
+    "Well Comparison": "layers",
+}
@@ -0,0 +1,47 @@
+# %%
+from collections import namedtuple
+
+import streamlit as st
+
+from model.other import f_darcy, gradient_avg, sg_avg, sg_oil
+from model.pwf import pwf_darcy, pwf_vogel
+
+# %%
+
+# Nodal Analysis page: pwf, friction and gradients of one well
+
+
+# Headless part of the page (also used by the load test)
+def nodal_values(q_test, pwf_test, q, pr, pb, sg_h2o, API, Q, ID, wc) -> dict:
+    """
+
+    :return: Result label -> (value, unit), in the order shown
+    """
+    if pr > pb:
+        values = {"Pwf Darcy": (pwf_darcy(q_test, pwf_test, q, pr, pb), "psia")}
+    else:
+        values = {"Pwf Vogel": (pwf_vogel(q_test, pwf_test, q, pr, pb), "psia")}
+    values["Friccion"] = (f_darcy(Q, ID, c=120), "")
+    values["Sg Oil"] = (sg_oil(API), "")
+    values["Sg fluids"] = (sg_avg(API, wc, sg_h2o), "")
+    values["Average Gradient"] = (gradient_avg(API, wc, sg_h2o), "psi/ft")
+    return values
+
+
+def render():
+    Data = namedtuple("Input", "q_test pwf_test q pr pb sg_h2o API Q ID c wc")
+    st.subheader("**Enter input values**")
+    q_test = st.number_input("Enter q_test Value: ")
+    pwf_test = st.number_input("Enter pwf test value: ")
+    sg_h2o = st.number_input("Enter sg_h20 value: ")
+    API = st.number_input("Enter API value")
+    Q = st.number_input("Enter Q value")
+    ID = st.number_input("Enter ID value")
+    q = st.number_input("Enter q value")
+    pr = st.number_input("Enter pr value")
+    c = st.number_input("Enter c value")
+    pb = st.number_input("Enter pb value")
+    wc = st.number_input("Enter wc value")
+    st.subheader("**Show results**")
+    for label, (value, unit) in nodal_values(q_test, pwf_test, q, pr, pb, sg_h2o, API, Q, ID, wc).items():
+        st.success(f"{label} -> {value:.3f} {unit} ")
@@ -0,0 +1,183 @@
+# %%
+import sqlite3
+from collections import namedtuple
+
+import pandas as pd
+import streamlit as st
+from matplotlib.figure import Figure
+
+from model.cache import read_upload
+from model.export import parquet_bytes
+from model.forecast import forecast_pressure, forecast_tank, pressure_series
+from model.graphics import nodal_figure
+from model.history import open_store, record_run
+from model.ipr import ipr_model
+from model.nodal import shared_nodal_table, vlp_model
+from model.units import COLUMNS, UnitError, convert_output, from_canonical, label, to_canonical
+from model.whatif import WHATIF_PARAMETERS, exact_point, interpolate, surface_future
+from views.calculations import PRESSURE_UNITS, RATE_UNITS
+
+# %%
+
+# Nodal Analysis Plots page: IPR, VLP and system curves of Well 1, and the depletion forecast
+
+
+# Headless part of the page (also used by the load test)
+def nodal_results(rates, nodal_inputs):
+    """
+
+    :param rates: oil_rate column of the upload
+    :param nodal_inputs: (QT, PWFT, PR, PB, THP, API, WC, SG_H2O, TVD, MD, NVL, ID, C)
+    :return: (nodal table shared by every session with the same rates and inputs, operating point)
+    """
+    return shared_nodal_table(rates, nodal_inputs), exact_point(dict(zip(WHATIF_PARAMETERS, nodal_inputs)))
+
+
+# Operating point in the units shown
+def point_text(q, pwf, units: dict) -> str:
+    """
+
+    :param units: {"pressure": .., "rate": ..}
+    :return: e.g. "q = 834.5 bpd, Pwf = 2114.1 psia"
+    """
+    q_unit, p_unit = units["rate"], units["pressure"]
+    return (f"q = {float(from_canonical(q, q_unit, 'rate')):.1f} {q_unit}, "
+            f"Pwf = {float(from_canonical(pwf, p_unit, 'pressure')):.1f} {p_unit}")
+
+
+# What-if section: operating point read from a response surface around the inputs
+def whatif_section(base: dict, units: dict):
+    """
+
+    :param base: Current value of every WHATIF_PARAMETERS
+    :param units: Units shown, {"pressure": .., "rate": ..}; the sliders of pressures follow them
+    """
+    if base["pr"] <= max(base["pwf_test"], 0.0):
+        st.warning("The what-if surface needs PR > PWFT.")
+        return
+    st.write("The operating point is precomputed around the inputs above for the chosen parameters, so every "
+             "slider position is read from that surface at once. Press 'Exact' to recompute the released "
+             "position with the full model.")
+    labels = {"THP": "thp", "WC": "wc", "PR": "pr", "PB": "pb", "ID": "id", "API": "api"}
+    chosen = st.multiselect("What-if parameters", list(labels), default=["THP", "WC", "PR"])
+    if not chosen:
+        return
+    future = surface_future(base, [labels[name] for name in chosen])
+    if not future.done():
+        # The page run does not wait for the surface: the sliders appear on a later run
+        st.info("The response surface is being built in the background. Press 'Refresh' in a moment.")
+        st.button("Refresh")
+        return
+    surface = future.result()
+    values = {}
+    for name in chosen:
+        parameter = labels[name]
+        axis = surface.axes[parameter]
+        dimension = COLUMNS.get(parameter)
+        unit = units.get(dimension)
+        lo, hi, value = (from_canonical([axis[0], axis[-1], base[parameter]], unit, dimension) if unit
+                         else (axis[0], axis[-1], base[parameter]))
+        # The current value can lie outside the axis (e.g. wc > 1): start at the nearest end
+        picked = st.slider(f"{name} ({unit})" if unit else name, float(lo), float(hi), float(min(max(value, lo), hi)))
+        values[parameter] = float(to_canonical(picked, unit, dimension)) if unit else picked
+    q_value, pwf_value = interpolate(surface, values)
+    st.write(f"Operating point (surface): {point_text(q_value, pwf_value, units)}")
+    if st.button("Exact"):
+        point = exact_point(dict(base, **values))
+        st.write(f"Operating point (exact): {point_text(point.q, point.pwf, units)}")
+
+
+def render():
+    st.write("This section is used to obtain the IPR and VLP curves, it is necessary to enter production data for a "
+             "certain time of the well to be analysed.")
+    file3 = st.file_uploader("Upload your csv file to Nodal Analysis")
+    try:
+        df_nodal = read_upload(file3)
+    except UnitError as error:
+        st.error(f"The units of the file cannot be read: {error}")
+        return
+    df1_a_n = pd.DataFrame(df_nodal)
+    Data = namedtuple("Input", "THP WC SG_H2O API QT ID TVD MD C PR PB PWFT NVL")
+    st.subheader("**Enter input values Well 1**")
+    WELL = st.text_input("Well name (stored in the history)")
+    THP = st.number_input("Enter THP value: ")
+    WC = st.number_input("Enter WC test value: ")
+    SG_H2O = st.number_input("Enter SG_H2O value: ")
+    API = st.number_input("Enter API value")
+    QT = st.number_input("Enter QT value")
+    ID = st.number_input("Enter ID value")
+    TVD = st.number_input("Enter TVD value")
+    MD = st.number_input("Enter MD value")
+    C = st.number_input("Enter C value")
+    PR = st.number_input("Enter PR value")
+    PB = st.number_input("Enter PB value")
+    PWFT = st.number_input("Enter PWFT value")
+    NVL = st.number_input("Enter Fluid Level (ft) value")
+
+    nodal_inputs = (QT, PWFT, PR, PB, THP, API, WC, SG_H2O, TVD, MD, NVL, ID, C)
+    rates = df1_a_n["oil_rate"].to_numpy()
+    df2, point = nodal_results(rates, nodal_inputs)
+    # Results in the units chosen; the history and the downloads keep psia and bpd
+    units = {"pressure": st.selectbox("Pressure unit", PRESSURE_UNITS), "rate": st.selectbox("Rate unit", RATE_UNITS)}
+    st.write(convert_output(df2, units))
+    nodal_params = dict(THP=THP, WC=WC, SG_H2O=SG_H2O, API=API, QT=QT, ID=ID, TVD=TVD, MD=MD, C=C, PR=PR, PB=PB,
+                        PWFT=PWFT, NVL=NVL)
+    st.download_button("Download nodal table (Parquet)", parquet_bytes(df2, "nodal", nodal_params),
+                       file_name="nodal.parquet")
+    base = dict(q_test=QT, pwf_test=PWFT, pr=PR, pb=PB, thp=THP, api=API, wc=WC, sg_h2o=SG_H2O, tvd=TVD, md=MD,
+                nvl=NVL, id=ID, c=C)
+    if WELL and PR > 0:
+        try:
+            record_run(open_store(), WELL, "nodal", nodal_params, q=point.q, pwf=point.pwf,
+                       j=ipr_model(QT, PWFT, PR, PB).j, table=df2)
+        except sqlite3.Error as error:
+            st.warning(f"The run was not stored in the history: {error}")
+    st.subheader("**Nodal Analysis Graphic**")
+
+    fig4 = nodal_figure(df2)
+    st.title('Nodal Analysis')
+    st.plotly_chart(fig4)
+
+    if st.checkbox("What-if (response surface)"):
+        whatif_section(base, units)
+
+    if st.checkbox("Forecast (reservoir depletion)"):
+        st.write("The IPR of Well 1 is rebuilt for every day with the depleted reservoir pressure and the operating "
+                 "point is solved against the VLP above. The reservoir pressure comes from a pressure history file "
+                 "(columns date and pr, e.g. pr [kPa]; default psia) or from a tank material balance.")
+        YEARS = st.number_input("Enter forecast years", value=5)
+        dates = pd.date_range(pd.Timestamp.today().normalize(), periods=int(YEARS * 365), freq="D")
+        vlp = vlp_model(THP, API, WC, SG_H2O, TVD, MD, NVL, ID, C)
+        J = float(ipr_model(QT, PWFT, PR, PB).j)
+        source = st.selectbox("Reservoir pressure", ("Tank model", "Pressure history"))
+        if source == "Tank model":
+            N = st.number_input("Enter N (bbl) value", min_value=0.0)
+            CE = st.number_input("Enter ce (1/psi) value", min_value=0.0, format="%.2e")
+            if N <= 0 or CE <= 0:
+                st.info("Enter N and ce (both > 0) to run the tank model.")
+                return
+            df_forecast = forecast_tank(dates, PR, N, CE, J, PB, vlp)
+        else:
+            file4 = st.file_uploader("Upload your pressure history file")
+            if file4 is None:
+                return
+            try:
+                df_pr = read_upload(file4)
+            except UnitError as error:
+                st.error(f"The units of the file cannot be read: {error}")
+                return
+            pr = pressure_series(dates, df_pr["date"], df_pr["pr"])
+            df_forecast = forecast_pressure(dates, pr, J, PB, vlp)
+        shown = convert_output(df_forecast, units)
+        st.write(shown)
+        st.download_button("Download forecast (Parquet)", parquet_bytes(df_forecast, "forecast", nodal_params),
+                           file_name="forecast.parquet")
+        fig5 = Figure()
+        ax5 = fig5.subplots()
+        q_column = label("q(bpd)", units["rate"])
+        ax5.plot(list(shown['date']), list(shown[q_column]), color="red")
+        st.title('Production Forecast')
+        ax5.set_xlabel('Date')
+        ax5.set_ylabel(q_column)
+        ax5.grid()
+        st.pyplot(fig5)
@@ -0,0 +1,42 @@
+# %%
+import pandas as pd
+import streamlit as st
+from matplotlib.figure import Figure
+
+from model.cache import read_upload
+from model.units import UnitError
+
+# %%
+
+# Plots page: production history chart
+
+
+# Headless part of the page (also used by the load test)
+def production_figure(dataframe):
+    fig1 = Figure()
+    ax1 = fig1.subplots()
+    ax1.plot(list(dataframe['date']), list(dataframe['oil_rate']), color="red")
+    ax1.set_xlabel('Years')
+    ax1.set_ylabel('Rate (BBL/D)')
+    ax1.grid()
+    return fig1
+
+
+def plots(dataframe):
+    st.write(dataframe)
+    st.subheader("***Production History***")
+    fig1 = production_figure(dataframe)
+    st.title('Annual Oil Production')
+    st.plotly_chart(fig1)
+
+
+def render():
+    st.write("In this section you get the respective graph with the data entered in the Data section.")
+    file = st.file_uploader("Upload your csv file with oil and water rate")
+    try:
+        df = read_upload(file)
+    except UnitError as error:
+        st.error(f"The units of the file cannot be read: {error}")
+        return
+    df1 = pd.DataFrame(df)
+    plots(df1)
@@ -0,0 +1,59 @@
+# %%
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# %%
+
+# Cold-start timing of every page
+# Each page is loaded in a fresh interpreter, as after a container restart:
+# first the shell that app.py always imports, then the page module, then its
+# render() in Streamlit bare mode. Pages that wait for an upload stop at the
+# uploader; their time is still the time to the first paint of the page.
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import streamlit, streamlit_option_menu
+from views.assets import asset_image
+asset_image("Logo.png")
+t1 = time.perf_counter()
+import importlib
+page = importlib.import_module({module!r})
+t2 = time.perf_counter()
+try:
+    page.render()
+    stopped = None
+except Exception as error:
+    stopped = type(error).__name__
+t3 = time.perf_counter()
+print(json.dumps({{"shell_s": t1 - t0, "import_s": t2 - t1, "render_s": t3 - t2, "stopped": stopped}}))
+"""
+
+
+def cold_start_times(pages: dict = None) -> dict:
+    """
+
+    :param pages: Page name -> module (app.PAGES by default)
+    :return: Page name -> shell, page import and render times in seconds
+    """
+    if pages is None:
+        from views.menu import PAGES
+        pages = PAGES
+    results = {}
+    for name, module in pages.items():
+        out = subprocess.run([sys.executable, "-c", _SNIPPET.format(module=module)], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+    return results
+
+
+if __name__ == "__main__":
+    for name, times in cold_start_times().items():
+        total = times["shell_s"] + times["import_s"] + times["render_s"]
+        note = f" (stopped at {times['stopped']})" if times["stopped"] else ""
+        print(f"{name:22s} first paint {total:6.3f} s  shell {times['shell_s']:.3f}  "
+              f"import {times['import_s']:.3f}  render {times['render_s']:.3f}{note}")